@@ -0,0 +1,193 @@
+"""
+Per-memoria threshold calibration.
+
+ImageMatcher accepts a match once its confidence reaches one global threshold. Look-alike
+cards need a stricter one, and distinctive cards can get by with a looser one. This tool
+scores every template against a labeled set of screenshots and picks a threshold per
+memoria from its ROC curve:
+
+- positives are the best-match confidences of a memoria in the screenshots labeled with it
+- negatives are its best-match confidences in every other screenshot
+
+When the two are separable, the threshold is the smallest one that clears every negative by
+a safety margin. Otherwise it is the ROC point with the best TPR - FPR, and the memoria is
+reported as ambiguous. The thresholds are written to memoria_thresholds.json, which
+ImageMatcher loads (see match_memorias).
+
+The labels file maps screenshot paths to the memorias shown on them:
+
+    {"screenshots/a_at_x.com_20240101.png": ["yingying-ss1", "tama-ss4"], ...}
+
+Usage:
+
+    python calibrate_thresholds.py --labels memoria_labels.json
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+MEMORIA_THRESHOLD_FILE = 'memoria_thresholds.json'
+LABELS_FILE = 'memoria_labels.json'
+
+# A calibrated threshold clears the strongest negative by at least this much
+SAFETY_MARGIN = 0.02
+# Calibrated thresholds are kept within these bounds
+MIN_THRESHOLD = 0.3
+MAX_THRESHOLD = 0.99
+
+
+def roc_curve(positives, negatives):
+    """
+    ROC curve of a score that should be high on positives and low on negatives.
+
+    Returns:
+        List of (threshold, tpr, fpr) points, one per distinct score, highest threshold first
+    """
+    positives = np.sort(np.asarray(positives, dtype=np.float64))
+    negatives = np.sort(np.asarray(negatives, dtype=np.float64))
+    points = []
+    for threshold in np.unique(np.concatenate([positives, negatives]))[::-1]:
+        # Scores at or above the threshold are accepted
+        tpr = (positives.size - np.searchsorted(positives, threshold)) / positives.size if positives.size else 0.0
+        fpr = (negatives.size - np.searchsorted(negatives, threshold)) / negatives.size if negatives.size else 0.0
+        points.append((float(threshold), float(tpr), float(fpr)))
+    return points
+
+
+def roc_auc(points):
+    """Area under a ROC curve given as (threshold, tpr, fpr) points, highest threshold first."""
+    fprs = [0.0] + [fpr for _, _, fpr in points] + [1.0]
+    tprs = [0.0] + [tpr for _, tpr, _ in points] + [1.0]
+    return float(sum((fprs[i + 1] - fprs[i]) * (tprs[i + 1] + tprs[i]) / 2 for i in range(len(fprs) - 1)))
+
+
+def choose_threshold(positives, negatives, margin=SAFETY_MARGIN):
+    """
+    Pick one memoria's threshold.
+
+    Args:
+        positives: Best-match confidences in the screenshots showing the memoria
+        negatives: Best-match confidences in the other screenshots
+        margin: Safety margin above the strongest negative
+
+    Returns:
+        Dictionary with the threshold, whether positives and negatives are separable, the
+        ROC AUC and the counts and extremes the choice was based on
+    """
+    points = roc_curve(positives, negatives)
+    max_negative = max(negatives, default=-1.0)
+    min_positive = min(positives)
+
+    separable = max_negative + margin <= min_positive
+    if separable:
+        threshold = max_negative + margin
+    else:
+        # Overlapping scores: take the ROC point with the best TPR - FPR
+        threshold, tpr, fpr = max(points, key=lambda point: (point[1] - point[2], point[0]))
+    threshold = min(MAX_THRESHOLD, max(MIN_THRESHOLD, threshold))
+
+    return {
+        'threshold': round(threshold, 4),
+        'separable': separable,
+        'auc': round(roc_auc(points), 4),
+        'positives': len(positives),
+        'negatives': len(negatives),
+        'min_positive': round(min_positive, 4),
+        'max_negative': round(max_negative, 4)
+    }
+
+
+def calibrate(matcher, labels, margin=SAFETY_MARGIN):
+    """
+    Calibrate the threshold of every labeled memoria.
+
+    Args:
+        matcher: ImageMatcher used to score the screenshots
+        labels: Dictionary mapping screenshot paths to lists of the memorias shown on them
+        margin: Safety margin above the strongest negative
+
+    Returns:
+        Tuple of (calibration, curves): calibration maps memoria names to choose_threshold()
+        results, curves maps them to their ROC points
+    """
+    scores = {}
+    for screenshot_path, names in labels.items():
+        screenshot_scores = matcher.template_scores(screenshot_path)
+        if screenshot_scores is None:
+            continue
+        shown = set(names)
+        for name, confidence in screenshot_scores.items():
+            positives, negatives = scores.setdefault(name, ([], []))
+            (positives if name in shown else negatives).append(confidence)
+        print(f"Scored {screenshot_path}")
+
+    calibration = {}
+    curves = {}
+    for name, (positives, negatives) in sorted(scores.items()):
+        if not positives:
+            print(f"{name}: no labeled screenshot shows it, keeping the global threshold")
+            continue
+        calibration[name] = choose_threshold(positives, negatives, margin)
+        curves[name] = roc_curve(positives, negatives)
+    return calibration, curves
+
+
+def load_memoria_thresholds(threshold_file=MEMORIA_THRESHOLD_FILE):
+    """
+    Load calibrated thresholds.
+
+    Returns:
+        Dictionary mapping memoria names to thresholds; empty if the file does not exist
+    """
+    if not os.path.exists(threshold_file):
+        return {}
+
+    try:
+        with open(threshold_file, 'r') as f:
+            calibration = json.load(f)
+    except json.JSONDecodeError as e:
+        print(f"Error loading memoria thresholds {threshold_file}: {e}")
+        return {}
+    return {name: entry['threshold'] for name, entry in calibration.items()}
+
+
+def save_memoria_thresholds(calibration, threshold_file=MEMORIA_THRESHOLD_FILE):
+    """Save calibration results (see calibrate) keyed by memoria name."""
+    with open(threshold_file, 'w') as f:
+        json.dump(calibration, f, indent=2)
+    print(f"Memoria thresholds saved to {threshold_file}")
+
+
+if __name__ == "__main__":
+    from image_matcher import ImageMatcher
+
+    parser = argparse.ArgumentParser(description="Calibrate per-memoria match thresholds from labeled screenshots")
+    parser.add_argument('--labels', default=LABELS_FILE, help="JSON mapping screenshot paths to the memorias shown")
+    parser.add_argument('--memoria-dir', default='memorias')
+    parser.add_argument('--output', default=MEMORIA_THRESHOLD_FILE)
+    parser.add_argument('--margin', type=float, default=SAFETY_MARGIN,
+                        help="Safety margin above the strongest negative")
+    parser.add_argument('--roc-output', help="Also write every memoria's ROC curve to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.labels, 'r') as f:
+        labels = json.load(f)
+
+    matcher = ImageMatcher(memoria_dir=args.memoria_dir, search_mode='exhaustive')
+    calibration, curves = calibrate(matcher, labels, args.margin)
+
+    for name, entry in calibration.items():
+        note = '' if entry['separable'] else ' (ambiguous: positives and negatives overlap)'
+        print(f"{name}: threshold {entry['threshold']:.3f}, AUC {entry['auc']:.3f}, "
+              f"{entry['positives']} positives, {entry['negatives']} negatives{note}")
+    if calibration:
+        save_memoria_thresholds(calibration, args.output)
+        if args.roc_output:
+            with open(args.roc_output, 'w') as f:
+                json.dump({name: [{'threshold': t, 'tpr': tpr, 'fpr': fpr} for t, tpr, fpr in points]
+                           for name, points in curves.items()}, f, indent=2)
+            print(f"ROC curves saved to {args.roc_output}")
+    else:
+        print("No memoria could be calibrated; check that the labels name memorias and existing screenshots")
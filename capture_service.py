@@ -0,0 +1,377 @@
+"""
+Continuous background capture of every instance.
+
+Captures used to happen only when the screenshot hotkey was pressed, and each one went
+straight to a PNG on disk. CaptureService samples every email-titled window at a fixed
+rate on a background thread instead (see screenshot_windows.capture_windows, so no window
+is brought to the front), and keeps the recent frames of each instance in memory:
+
+- every frame is reduced to a small grayscale signature; a frame whose signature matches
+  the instance's previous one is counted and dropped
+- changed frames go into the instance's FrameRing, a fixed set of preallocated slots that
+  are overwritten in turn
+- subscribers (the matcher, a state detector, an archiver) are called with a "frame
+  changed" event for every changed frame
+
+Memory stays bounded: the capture sessions' frame buffers (one per instance, needed to
+capture at all) are counted against memory_budget first, and the rings share what is left
+equally. Every round all rings are resized to their share, so adding instances makes every
+ring shallower rather than only the next one pushed to; when the share cannot hold one frame
+the rings keep nothing. Subscribers still get every changed frame, and the service only
+remembers each instance's signature.
+
+Run this module directly to watch the windows (or synthetic ones with --fake) for a while
+and print the change events.
+"""
+import argparse
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from capture_session import CaptureSessionPool
+
+# Seconds between two captures of the same instance
+CAPTURE_INTERVAL = 1.0
+# Frames kept per instance when the memory budget allows
+RING_SIZE = 4
+# Bytes of frames the capture buffers and all rings together may hold
+MEMORY_BUDGET = 256 * 1024 * 1024
+# Frames are compared as grayscale thumbnails of this (width, height)
+SIGNATURE_SIZE = (64, 36)
+# A frame changed when more than this fraction of its thumbnail pixels moved by more than
+# SIGNATURE_PIXEL_DIFF; blinking cursors and clock ticks stay below it
+SIGNATURE_CHANGED_FRACTION = 0.01
+SIGNATURE_PIXEL_DIFF = 12
+
+
+def frame_signature(frame):
+    """Small grayscale thumbnail of a BGR frame that change detection compares."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def changed_fraction(signature, previous):
+    """Fraction of thumbnail pixels that differ between two signatures (1.0 if there is no previous one)."""
+    if previous is None:
+        return 1.0
+    return np.count_nonzero(cv2.absdiff(signature, previous) > SIGNATURE_PIXEL_DIFF) / signature.size
+
+
+class FrameRing:
+    """
+    Fixed number of frame slots, overwritten oldest first.
+
+    Slots are allocated on first use and reused afterwards; a frame of a different size
+    (the window was resized) replaces the slot's array.
+    """
+
+    def __init__(self, depth):
+        self.depth = depth
+        self._slots = [None] * depth
+        self._timestamps = [None] * depth
+        self._next = 0
+        self._count = 0
+
+    @property
+    def nbytes(self):
+        """Bytes held by the ring's slots."""
+        return sum(slot.nbytes for slot in self._slots if slot is not None)
+
+    def push(self, frame, timestamp):
+        """
+        Copy a frame into the oldest slot.
+
+        Returns:
+            The slot's array (overwritten after depth more pushes), or None if the ring has
+            no slots
+        """
+        if not self.depth:
+            return None
+        slot = self._slots[self._next]
+        if slot is None or slot.shape != frame.shape:
+            slot = self._slots[self._next] = np.empty(frame.shape, dtype=frame.dtype)
+        np.copyto(slot, frame)
+        self._timestamps[self._next] = timestamp
+        self._next = (self._next + 1) % self.depth
+        self._count = min(self._count + 1, self.depth)
+        return slot
+
+    def frames(self):
+        """List of (timestamp, frame) tuples held, newest first."""
+        frames = []
+        for i in range(1, self._count + 1):
+            index = (self._next - i) % self.depth
+            frames.append((self._timestamps[index], self._slots[index]))
+        return frames
+
+    def latest(self):
+        """(timestamp, frame) of the newest frame, or None if the ring is empty."""
+        frames = self.frames()
+        return frames[0] if frames else None
+
+    def resize(self, depth):
+        """Change the number of slots, keeping the newest frames that still fit."""
+        if depth == self.depth:
+            return
+        # Oldest first, so the slot after the kept frames is the next one overwritten
+        kept = self.frames()[:depth][::-1]
+        padding = [None] * (depth - len(kept))
+        self._slots = [frame for _, frame in kept] + padding
+        self._timestamps = [timestamp for timestamp, _ in kept] + padding
+        self.depth = depth
+        self._count = len(kept)
+        self._next = len(kept) % depth if depth else 0
+
+
+class CaptureService:
+    """
+    Samples every instance on a background thread and publishes the frames that changed.
+    """
+
+    def __init__(self, interval=CAPTURE_INTERVAL, ring_size=RING_SIZE, memory_budget=MEMORY_BUDGET,
+                 find_windows=None, backend=None, max_workers=None):
+        """
+        Initialize the service; nothing is captured until start() or poll().
+
+        Args:
+            interval: Seconds between two capture rounds
+            ring_size: Maximum number of frames kept per instance
+            memory_budget: Bytes of frames the capture session buffers and all rings together
+                           may hold
+            find_windows: Function returning the (hwnd, title) tuples to capture
+                          (default: screenshot_windows.find_email_windows)
+            backend: CaptureBackend for the capture sessions (default: Win32CaptureBackend)
+            max_workers: Capture threads (default: screenshot_windows.CAPTURE_THREADS)
+        """
+        if find_windows is None:
+            from screenshot_windows import find_email_windows
+            find_windows = find_email_windows
+        if max_workers is None:
+            from screenshot_windows import CAPTURE_THREADS
+            max_workers = CAPTURE_THREADS
+
+        self.interval = interval
+        self.ring_size = ring_size
+        self.memory_budget = memory_budget
+        self.find_windows = find_windows
+        self.max_workers = max_workers
+        self.sessions = CaptureSessionPool(backend)
+        self.stats = {'rounds': 0, 'captured': 0, 'changed': 0, 'unchanged': 0, 'failed': 0}
+
+        self._rings = {}
+        self._frame_bytes = {}
+        self._signatures = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def subscribe(self, callback, closed=None):
+        """
+        Call callback(event) for every changed frame.
+
+        The event is a dictionary with the hwnd, title, frame, timestamp, capture time in
+        milliseconds and changed fraction. Callbacks run on the capture thread: hand slow
+        work (matching, writing PNGs) to a queue or thread of your own, and copy the frame if
+        it has to outlive the next capture of its window.
+
+        Args:
+            callback: Function called with every change event
+            closed: Optional function called with the hwnd of every window that closed, once
+                    the service has dropped its ring and signature (clear per-instance state here)
+        """
+        with self._lock:
+            self._subscribers.append((callback, closed))
+
+    def unsubscribe(self, callback):
+        """Stop calling a subscribed callback (and its closed callback)."""
+        with self._lock:
+            self._subscribers = [subscriber for subscriber in self._subscribers if subscriber[0] != callback]
+
+    def start(self):
+        """Start capturing on a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='capture-service', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and free the capture sessions."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.sessions.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error in capture round: {str(e)}")
+            self._stop.wait(max(0.0, self.interval - (time.perf_counter() - started)))
+
+    def poll(self):
+        """
+        Run one capture round over every instance.
+
+        Returns:
+            List of the change events published this round
+        """
+        from screenshot_windows import capture_windows
+
+        windows = self.find_windows()
+        hwnds = [hwnd for hwnd, _ in windows]
+        self.sessions.prune(hwnds)
+
+        captures = capture_windows(windows, self.sessions, self.max_workers)
+        with self._lock:
+            closed = self._forget_closed(hwnds)
+            closed_callbacks = [on_closed for _, on_closed in self._subscribers if on_closed is not None]
+            for capture in captures:
+                if capture['frame'] is not None:
+                    self._frame_bytes[capture['hwnd']] = capture['frame'].nbytes
+            self._rebalance(len(windows))
+        for hwnd in closed:
+            for on_closed in closed_callbacks:
+                try:
+                    on_closed(hwnd)
+                except Exception as e:
+                    print(f"Error in closed-window subscriber {getattr(on_closed, '__name__', on_closed)}: {str(e)}")
+
+        events = []
+        for capture in captures:
+            hwnd = capture['hwnd']
+            if capture['error'] is not None:
+                self.stats['failed'] += 1
+                continue
+            self.stats['captured'] += 1
+
+            frame = capture['frame']
+            signature = frame_signature(frame)
+            changed = changed_fraction(signature, self._signatures.get(hwnd))
+            if changed <= SIGNATURE_CHANGED_FRACTION:
+                self.stats['unchanged'] += 1
+                continue
+            self.stats['changed'] += 1
+            self._signatures[hwnd] = signature
+
+            timestamp = time.time()
+            with self._lock:
+                stored = self._rings[hwnd].push(frame, timestamp)
+                subscribers = [callback for callback, _ in self._subscribers]
+            event = {
+                'hwnd': hwnd,
+                'title': capture['title'],
+                'frame': stored if stored is not None else frame,
+                'timestamp': timestamp,
+                'capture_ms': capture['capture_ms'],
+                'changed_fraction': changed
+            }
+            events.append(event)
+            for callback in subscribers:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"Error in frame subscriber {getattr(callback, '__name__', callback)}: {str(e)}")
+
+        self.stats['rounds'] += 1
+        return events
+
+    def _rebalance(self, instances):
+        """
+        Give every instance's ring the depth its share of the memory budget allows.
+
+        The budget left after the capture session buffers is split equally between the
+        instances, and each ring holds as many of its instance's frames as fit in one share.
+        """
+        share = max(0, self.memory_budget - self.sessions.nbytes) // max(1, instances)
+        for hwnd, frame_bytes in self._frame_bytes.items():
+            depth = min(self.ring_size, share // frame_bytes)
+            ring = self._rings.get(hwnd)
+            if ring is None:
+                self._rings[hwnd] = FrameRing(depth)
+            elif ring.depth != depth:
+                ring.resize(depth)
+
+    def _forget_closed(self, hwnds):
+        """Drop the state of windows that are not in hwnds; returns the hwnds that had any."""
+        open_hwnds = set(hwnds)
+        closed = (set(self._rings) | set(self._frame_bytes) | set(self._signatures)) - open_hwnds
+        for hwnd in set(self._rings) - open_hwnds:
+            del self._rings[hwnd]
+        for hwnd in set(self._frame_bytes) - open_hwnds:
+            del self._frame_bytes[hwnd]
+        for hwnd in set(self._signatures) - open_hwnds:
+            del self._signatures[hwnd]
+        return closed
+
+    def latest(self, hwnd):
+        """(timestamp, frame) of an instance's newest kept frame, or None."""
+        with self._lock:
+            ring = self._rings.get(hwnd)
+            return ring.latest() if ring is not None else None
+
+    def frames(self, hwnd):
+        """List of an instance's kept (timestamp, frame) tuples, newest first."""
+        with self._lock:
+            ring = self._rings.get(hwnd)
+            return ring.frames() if ring is not None else []
+
+    def memory_used(self):
+        """Bytes of frames held by the capture session buffers and all rings (what memory_budget bounds)."""
+        with self._lock:
+            return self.sessions.nbytes + sum(ring.nbytes for ring in self._rings.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture every instance continuously and print frame changes")
+    parser.add_argument('--seconds', type=float, default=10.0, help="How long to run")
+    parser.add_argument('--interval', type=float, default=CAPTURE_INTERVAL, help="Seconds between capture rounds")
+    parser.add_argument('--ring-size', type=int, default=RING_SIZE)
+    parser.add_argument('--memory-mb', type=int, default=MEMORY_BUDGET // (1024 * 1024))
+    parser.add_argument('--fake', type=int, metavar='WINDOWS',
+                        help="Use this many synthetic 1280x720 windows, one of which changes every round")
+    args = parser.parse_args()
+
+    find_windows = backend = None
+    if args.fake:
+        from capture_session import FakeCaptureBackend
+        rng = np.random.default_rng(0)
+
+        def fake_frame():
+            # Large flat blocks, like a game screen, rather than noise that averages out
+            blocks = rng.integers(0, 256, (18, 32, 3), dtype=np.uint8)
+            return cv2.resize(blocks, (1280, 720), interpolation=cv2.INTER_NEAREST)
+
+        backend = FakeCaptureBackend({hwnd: fake_frame() for hwnd in range(args.fake)})
+        find_windows = lambda: [(hwnd, f"fake{hwnd}@example.com") for hwnd in backend.frames]
+
+    service = CaptureService(args.interval, args.ring_size, args.memory_mb * 1024 * 1024, find_windows, backend)
+    service.subscribe(lambda event: print(f"{event['title']}: frame changed "
+                                          f"({event['changed_fraction']:.1%} of pixels, "
+                                          f"captured in {event['capture_ms']:.1f} ms)"))
+    with service:
+        ends = time.monotonic() + args.seconds
+        changing = 0
+        while time.monotonic() < ends:
+            time.sleep(args.interval)
+            if args.fake:
+                backend.frames[changing] = fake_frame()
+                changing = (changing + 1) % args.fake
+
+    stats = service.stats
+    print(f"{stats['rounds']} rounds: {stats['captured']} frames captured, {stats['changed']} changed, "
+          f"{stats['unchanged']} unchanged, {stats['failed']} failed")
+    print(f"Frames kept in memory: {service.memory_used() / (1024 * 1024):.1f} MB")
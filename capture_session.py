@@ -0,0 +1,282 @@
+"""
+Reusable per-window capture sessions.
+
+Capturing a window the one-shot way creates a window DC, a compatible DC and a bitmap sized
+to the window, copies the bits out into a new bytes object and destroys everything again.
+Doing that for 30 instances every round churns GDI objects and allocations.
+
+A CaptureSession keeps its device contexts and bitmap between frames and copies the bits
+straight into a preallocated NumPy buffer. Both are only recreated when the window size
+changes. The platform calls sit behind a small backend interface:
+
+- Win32CaptureBackend: PrintWindow into a compatible bitmap, GetBitmapBits into the buffer
+- FakeCaptureBackend: serves in-memory frames, so the buffer management runs anywhere
+
+Run this module directly to compare session captures with one-shot captures.
+"""
+import argparse
+import time
+
+import numpy as np
+
+
+class CaptureBackend:
+    """
+    Platform calls a CaptureSession is built on.
+
+    A surface is whatever the backend needs to capture one window at one size (device
+    contexts, a bitmap); the session creates it once and reuses it for every frame.
+    """
+
+    def window_size(self, hwnd):
+        """Current (width, height) of a window."""
+        raise NotImplementedError
+
+    def create_surface(self, hwnd, width, height):
+        """Allocate what capturing a width x height window needs; returns an opaque surface."""
+        raise NotImplementedError
+
+    def capture(self, hwnd, surface, out):
+        """Fill out, a (height, width, 4) uint8 BGRX array, with the window's current frame."""
+        raise NotImplementedError
+
+    def release(self, hwnd, surface):
+        """Free a surface created by create_surface."""
+        raise NotImplementedError
+
+
+class Win32CaptureBackend(CaptureBackend):
+    """
+    GDI capture with PrintWindow (flag 3 renders the full window even when it is covered).
+    """
+
+    def __init__(self):
+        # win32 is only available on Windows; keep the module importable elsewhere
+        import ctypes
+        from ctypes import wintypes
+        import win32gui
+        import win32ui
+
+        self._win32gui = win32gui
+        self._win32ui = win32ui
+        self._print_window = ctypes.windll.user32.PrintWindow
+        self._get_bitmap_bits = ctypes.windll.gdi32.GetBitmapBits
+        self._get_bitmap_bits.argtypes = [wintypes.HBITMAP, ctypes.c_long, ctypes.c_void_p]
+        self._get_bitmap_bits.restype = ctypes.c_long
+
+    def window_size(self, hwnd):
+        left, top, right, bottom = self._win32gui.GetWindowRect(hwnd)
+        return right - left, bottom - top
+
+    def create_surface(self, hwnd, width, height):
+        hwnd_dc = self._win32gui.GetWindowDC(hwnd)
+        mfc_dc = self._win32ui.CreateDCFromHandle(hwnd_dc)
+        save_dc = mfc_dc.CreateCompatibleDC()
+        bitmap = self._win32ui.CreateBitmap()
+        bitmap.CreateCompatibleBitmap(mfc_dc, width, height)
+        save_dc.SelectObject(bitmap)
+        return hwnd_dc, mfc_dc, save_dc, bitmap
+
+    def capture(self, hwnd, surface, out):
+        hwnd_dc, mfc_dc, save_dc, bitmap = surface
+        self._print_window(hwnd, save_dc.GetSafeHdc(), 3)
+        # 32-bit rows are top-down BGRX with no padding, exactly the layout of out
+        copied = self._get_bitmap_bits(bitmap.GetHandle(), out.nbytes, out.ctypes.data)
+        if copied != out.nbytes:
+            raise OSError(f"GetBitmapBits copied {copied} of {out.nbytes} bytes")
+
+    def release(self, hwnd, surface):
+        hwnd_dc, mfc_dc, save_dc, bitmap = surface
+        self._win32gui.DeleteObject(bitmap.GetHandle())
+        save_dc.DeleteDC()
+        mfc_dc.DeleteDC()
+        self._win32gui.ReleaseDC(hwnd, hwnd_dc)
+
+
+class FakeCaptureBackend(CaptureBackend):
+    """
+    In-memory stand-in for a capture backend.
+
+    Windows are entries of the frames dictionary (hwnd -> BGR image); replace an entry to
+    change what the window shows, including its size. The backend counts the surfaces it
+    created and released and the frames it captured.
+    """
+
+    def __init__(self, frames=None):
+        self.frames = frames if frames is not None else {}
+        self.surfaces_created = 0
+        self.surfaces_released = 0
+        self.captures = 0
+
+    def window_size(self, hwnd):
+        h, w = self.frames[hwnd].shape[:2]
+        return w, h
+
+    def create_surface(self, hwnd, width, height):
+        self.surfaces_created += 1
+        return (width, height)
+
+    def capture(self, hwnd, surface, out):
+        frame = self.frames[hwnd]
+        if frame.shape[1::-1] != surface:
+            raise OSError(f"Window {hwnd} is {frame.shape[1]}x{frame.shape[0]}, surface is {surface[0]}x{surface[1]}")
+        out[:, :, :3] = frame
+        out[:, :, 3] = 0
+        self.captures += 1
+
+    def release(self, hwnd, surface):
+        self.surfaces_released += 1
+
+
+class CaptureSession:
+    """
+    Captures one window repeatedly, reusing its surface and frame buffer.
+    """
+
+    def __init__(self, hwnd, backend=None):
+        """
+        Initialize the session; nothing is allocated until the first capture.
+
+        Args:
+            hwnd: Window handle
+            backend: CaptureBackend (default: Win32CaptureBackend)
+        """
+        self.hwnd = hwnd
+        self.backend = backend if backend is not None else Win32CaptureBackend()
+        self.size = None
+        self._surface = None
+        self._buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def nbytes(self):
+        """Bytes held by the session's frame buffer."""
+        return self._buffer.nbytes if self._buffer is not None else 0
+
+    def capture(self):
+        """
+        Capture the window's current frame.
+
+        Returns:
+            (height, width, 3) uint8 BGR view over the session's buffer. The next capture
+            overwrites it, so copy frames that must outlive it; a buffer replaced after a
+            resize (or left behind by close) is never reused.
+        """
+        size = self.backend.window_size(self.hwnd)
+        if size != self.size:
+            self._reallocate(size)
+        self.backend.capture(self.hwnd, self._surface, self._buffer)
+        return self._buffer[:, :, :3]
+
+    def _reallocate(self, size):
+        """Recreate the surface and buffer for a new window size."""
+        self._release_surface()
+        width, height = size
+        self._surface = self.backend.create_surface(self.hwnd, width, height)
+        self._buffer = np.empty((height, width, 4), dtype=np.uint8)
+        self.size = size
+
+    def _release_surface(self):
+        if self._surface is not None:
+            self.backend.release(self.hwnd, self._surface)
+            self._surface = None
+
+    def close(self):
+        """Free the surface. Frames already returned stay valid; they own the buffer now."""
+        self._release_surface()
+        self._buffer = None
+        self.size = None
+
+
+class CaptureSessionPool:
+    """
+    One CaptureSession per window, kept open across capture rounds.
+    """
+
+    def __init__(self, backend=None):
+        """
+        Args:
+            backend: CaptureBackend shared by every session (default: Win32CaptureBackend)
+        """
+        self.backend = backend if backend is not None else Win32CaptureBackend()
+        self.sessions = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def nbytes(self):
+        """Bytes held by the frame buffers of every session."""
+        return sum(session.nbytes for session in list(self.sessions.values()))
+
+    def session(self, hwnd):
+        """The window's session, opened on first use."""
+        session = self.sessions.get(hwnd)
+        if session is None:
+            session = self.sessions[hwnd] = CaptureSession(hwnd, self.backend)
+        return session
+
+    def capture(self, hwnd):
+        """Capture a window through its session (see CaptureSession.capture)."""
+        return self.session(hwnd).capture()
+
+    def prune(self, hwnds):
+        """Close the sessions of windows that are not in hwnds (e.g. closed instances)."""
+        for hwnd in set(self.sessions) - set(hwnds):
+            self.sessions.pop(hwnd).close()
+
+    def close(self):
+        """Close every session."""
+        for session in self.sessions.values():
+            session.close()
+        self.sessions = {}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare reused capture sessions with one-shot captures")
+    parser.add_argument('--rounds', type=int, default=10, help="Capture rounds over every window")
+    parser.add_argument('--fake', type=int, metavar='WINDOWS',
+                        help="Use the fake backend with this many synthetic 1280x720 windows instead of the "
+                             "email-titled windows")
+    args = parser.parse_args()
+
+    if args.fake:
+        rng = np.random.default_rng(0)
+        backend = FakeCaptureBackend({
+            hwnd: rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8) for hwnd in range(args.fake)
+        })
+        hwnds = list(backend.frames)
+    else:
+        from screenshot_windows import find_email_windows
+        backend = Win32CaptureBackend()
+        hwnds = [hwnd for hwnd, _ in find_email_windows()]
+
+    if not hwnds:
+        print("No windows with email addresses found")
+    else:
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            for hwnd in hwnds:
+                with CaptureSession(hwnd, backend) as session:
+                    session.capture()
+        one_shot = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with CaptureSessionPool(backend) as pool:
+            for _ in range(args.rounds):
+                for hwnd in hwnds:
+                    pool.capture(hwnd)
+        reused = time.perf_counter() - started
+
+        frames = args.rounds * len(hwnds)
+        print(f"{len(hwnds)} windows, {args.rounds} rounds")
+        print(f"One-shot: {one_shot / frames * 1000:.2f} ms per frame")
+        print(f"Session:  {reused / frames * 1000:.2f} ms per frame")
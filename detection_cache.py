@@ -0,0 +1,334 @@
+"""
+Raw detection cache for memoria matching.
+
+Template matching is the expensive part of a match run; turning detections into scores is
+cheap arithmetic. The cache keeps the raw detections (memoria, confidence, position, size,
+color similarity) for every screenshot, keyed by the screenshot's content hash, so scores can
+be rebuilt with different custom_scores or scoring_criteria without touching any image (see
+rescore.py).
+
+Each frame also records the hash of every template it was matched against, and of every
+template an expected_cards search skipped once it had claimed enough cards. When templates
+are added or edited, only those templates need to be matched against old screenshots (all
+of them if the search had stopped early, since a changed template may claim a card first).
+
+Detections also depend on the matcher's settings (threshold, search mode, multi_instance,
+expected_cards, search regions, per-memoria thresholds), so each frame records a fingerprint
+of them (see ImageMatcher.config_hash). Lookups made with another fingerprint miss, and the
+frame is matched again under the new settings.
+
+Rewriting the whole file after every run (or every auto-captured frame) costs O(history), so
+save() only appends the entries stored since the last save to a journal next to the cache
+file (detection_cache.json.log, one JSON entry per line). load() replays the journal over
+the cache file; once the journal outgrows the cache file, save() folds it back in. Each
+instance only ever appends its own entries and compaction rebuilds the cache file from
+what is on disk, so several DetectionCache instances on the same file (the GUI, auto-capture,
+a batch run) never drop each other's updates.
+"""
+import hashlib
+import json
+import os
+import threading
+
+DETECTION_CACHE_FILE = 'detection_cache.json'
+CACHE_FORMAT_VERSION = 2
+# The journal is folded into the cache file once it holds more entries than this and than
+# the cache has frames, so compaction stays amortized O(1) per stored entry
+JOURNAL_COMPACT_ENTRIES = 1000
+
+
+def content_hash(data):
+    """SHA-1 of raw bytes (e.g. a PNG file), used to recognise identical screenshots."""
+    return hashlib.sha1(data).hexdigest()
+
+
+def file_content_hash(path):
+    """SHA-1 of a file's bytes."""
+    with open(path, 'rb') as f:
+        return content_hash(f.read())
+
+
+def template_hash(img):
+    """SHA-1 of a decoded template's shape and pixels."""
+    digest = hashlib.sha1(repr(img.shape).encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def stale_templates(matched_templates, template_hashes, matched_config=None, config=None, skipped_templates=None):
+    """
+    Templates a frame still has to be matched against.
+
+    Args:
+        matched_templates: Dictionary of memoria name -> template hash the frame was matched with
+        template_hashes: Dictionary of memoria name -> template hash of the current bank
+        matched_config: Matcher config fingerprint the frame was matched with
+        config: Optional current matcher config fingerprint; when it differs from
+                matched_config every template is stale
+        skipped_templates: Optional dictionary of memoria name -> template hash an
+                           expected_cards search skipped once enough cards were claimed; an
+                           unchanged skipped template is not stale
+
+    Returns:
+        Sorted list of memoria names that are new or changed since the frame was matched
+    """
+    if config is not None and matched_config != config:
+        return sorted(template_hashes)
+    skipped_templates = skipped_templates or {}
+    return sorted(name for name, digest in template_hashes.items()
+                  if matched_templates.get(name) != digest and skipped_templates.get(name) != digest)
+
+
+def append_journal(journal_file, entries):
+    """Append entries to a journal file, one JSON document per line."""
+    with open(journal_file, 'a') as f:
+        f.write(''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def claim_journal(journal_file):
+    """
+    Move a journal aside for compaction, so entries appended meanwhile start a new journal.
+
+    Returns:
+        Path of the claimed journal; one left by an interrupted compaction is claimed again
+    """
+    claimed = f"{journal_file}.compacting"
+    if not os.path.exists(claimed) and os.path.exists(journal_file):
+        os.replace(journal_file, claimed)
+    return claimed
+
+
+def apply_journal(journal_file, tables):
+    """
+    Apply the entries of one journal file to a set of tables.
+
+    Args:
+        journal_file: Journal path
+        tables: Dictionary mapping table names to the dictionaries the entries update
+
+    Returns:
+        Number of entries applied
+    """
+    entries = read_journal(journal_file)
+    for entry in entries:
+        tables[entry['table']][entry['key']] = entry['value']
+    return len(entries)
+
+
+def replay_journal(journal_file, tables):
+    """Apply a journal, after the part claimed by an unfinished compaction (see apply_journal)."""
+    return sum(apply_journal(path, tables) for path in (f"{journal_file}.compacting", journal_file))
+
+
+def read_journal(journal_file):
+    """
+    Entries of a journal file, oldest first.
+
+    A line cut short by an interrupted append is skipped with a warning.
+    """
+    if not os.path.exists(journal_file):
+        return []
+    entries = []
+    with open(journal_file, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Skipping unreadable line {line_number} of {journal_file}")
+    return entries
+
+
+class DetectionCache:
+    """
+    JSON-backed store of raw detections.
+
+    Frames are stored once per content hash; screenshot paths point at a frame, so identical
+    screenshots share their detections. One instance can be shared between threads.
+    """
+
+    def __init__(self, cache_file=DETECTION_CACHE_FILE):
+        self.cache_file = cache_file
+        self.journal_file = f"{cache_file}.log"
+        self.frames = {}
+        self.screenshots = {}
+        self._pending = []
+        self._journal_entries = 0
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """
+        Load the cache file and replay its journal, starting empty if the file is missing or unreadable.
+
+        Entries stored but not saved yet are discarded.
+        """
+        with self._lock:
+            self.frames, self.screenshots = self._read_cache_file()
+            self._pending = []
+            self._journal_entries = replay_journal(self.journal_file, {'frames': self.frames,
+                                                                       'screenshots': self.screenshots})
+
+    def _read_cache_file(self):
+        """(frames, screenshots) of the cache file alone, empty if it is missing or unreadable."""
+        if not os.path.exists(self.cache_file):
+            return {}, {}
+
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+        except json.JSONDecodeError as e:
+            print(f"Error loading detection cache {self.cache_file}: {e}")
+            return {}, {}
+
+        if data.get('format_version') != CACHE_FORMAT_VERSION:
+            print(f"Ignoring detection cache {self.cache_file} with unsupported format")
+            return {}, {}
+        return data.get('frames', {}), data.get('screenshots', {})
+
+    def save(self):
+        """Append the entries stored since the last save to the journal, compacting it when it has grown large."""
+        with self._lock:
+            self._flush()
+            if self._journal_entries > max(JOURNAL_COMPACT_ENTRIES, len(self.frames)):
+                self.compact()
+
+    def compact(self):
+        """
+        Fold the journal into the cache file and reload.
+
+        The journal is moved aside first, so entries other instances append meanwhile start a
+        new journal, and the cache file is rebuilt from the files on disk rather than from this
+        instance's view. The cache file is replaced atomically; a compaction cut short is
+        replayed by the next load and finished by the next compaction.
+        """
+        with self._lock:
+            self._flush()
+            claimed = claim_journal(self.journal_file)
+            frames, screenshots = self._read_cache_file()
+            apply_journal(claimed, {'frames': frames, 'screenshots': screenshots})
+
+            tmp_file = f"{self.cache_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump({
+                    'format_version': CACHE_FORMAT_VERSION,
+                    'frames': frames,
+                    'screenshots': screenshots
+                }, f, separators=(',', ':'))
+            os.replace(tmp_file, self.cache_file)
+            if os.path.exists(claimed):
+                os.remove(claimed)
+            self.load()
+
+    def _flush(self):
+        if self._pending:
+            append_journal(self.journal_file, self._pending)
+            self._journal_entries += len(self._pending)
+            self._pending = []
+
+    def lookup(self, frame_hash, config=None):
+        """
+        Cached frame detections for a screenshot content hash.
+
+        Args:
+            frame_hash: Content hash of the screenshot
+            config: Optional matcher config fingerprint; frames matched with other settings miss
+
+        Returns:
+            Dictionary with 'templates', 'skipped', 'config', 'frame_size' and 'detections', or None when
+            the frame is unknown
+        """
+        frame = self.frames.get(frame_hash)
+        if frame is None or (config is not None and frame.get('config') != config):
+            return None
+        return frame
+
+    def is_current(self, screenshot_path, template_hashes, config=None):
+        """
+        Whether a screenshot path's frame was matched against every given template with these settings.
+
+        Only the path is looked up, so the screenshot is not read or hashed.
+        """
+        screenshot = self.screenshots.get(str(screenshot_path))
+        if screenshot is None:
+            return False
+        frame = self.lookup(screenshot['content_hash'], config)
+        return frame is not None and not stale_templates(frame['templates'], template_hashes,
+                                                         skipped_templates=frame.get('skipped'))
+
+    def store(self, record):
+        """Store a raw detection record as returned by ImageMatcher.detect_screenshot; save() persists it."""
+        with self._lock:
+            self._put('frames', record['content_hash'], {
+                'templates': record['templates'],
+                'skipped': record.get('skipped', {}),
+                'config': record.get('config'),
+                'frame_size': list(record['frame_size']),
+                'detections': record['detections']
+            })
+            self._put('screenshots', record['screenshot_path'], {
+                'content_hash': record['content_hash'],
+                'email': record['email'],
+                'timestamp': record['timestamp']
+            })
+
+    def store_duplicate(self, record):
+        """
+        Store the record of a screenshot that duplicates an already cached one.
+
+        The screenshot is pointed at the frame cached under its content hash, which is kept as
+        it is; the record's detections are only stored when no frame is cached under that hash.
+        """
+        with self._lock:
+            if record['content_hash'] not in self.frames:
+                self.store(record)
+                return
+            self._put('screenshots', record['screenshot_path'], {
+                'content_hash': record['content_hash'],
+                'email': record['email'],
+                'timestamp': record['timestamp']
+            })
+
+    def _put(self, table, key, value):
+        getattr(self, table)[key] = value
+        self._pending.append({'table': table, 'key': key, 'value': value})
+
+    def record(self, screenshot_path, config=None):
+        """
+        Rebuild the raw detection record of a screenshot.
+
+        Args:
+            screenshot_path: Screenshot path the record was stored under
+            config: Optional matcher config fingerprint; frames matched with other settings miss
+
+        Returns:
+            The record, or None if it is not cached
+        """
+        screenshot = self.screenshots.get(screenshot_path)
+        if screenshot is None:
+            return None
+        frame = self.lookup(screenshot['content_hash'], config)
+        if frame is None:
+            return None
+
+        return {
+            'email': screenshot['email'],
+            'screenshot_path': screenshot_path,
+            'content_hash': screenshot['content_hash'],
+            'templates': frame['templates'],
+            'skipped': frame.get('skipped', {}),
+            'config': frame.get('config'),
+            'frame_size': tuple(frame['frame_size']),
+            'detections': frame['detections'],
+            'timestamp': screenshot['timestamp']
+        }
+
+    def records(self):
+        """Raw detection records for every cached screenshot."""
+        for screenshot_path in list(self.screenshots):
+            record = self.record(screenshot_path)
+            if record is not None:
+                yield record
@@ -0,0 +1,303 @@
+"""
+FFT-based batched template correlation.
+
+cv2.matchTemplate redoes all screenshot-side work (transforms and local sums) for every
+memoria. FFTCorrelationEngine transforms the screenshot and builds its local-energy window
+sums once, then scores every template against that shared state. The template transforms
+are computed once per frame size and cached, so a batch of same-resolution screenshots
+only pays for one spectrum multiply and one inverse transform per template.
+
+The result maps are the same TM_CCOEFF_NORMED maps that cv2.matchTemplate produces (to
+float32 precision), so peak positions and confidences can be used interchangeably.
+
+Run this module directly to benchmark it against cv2.matchTemplate.
+"""
+import argparse
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Upper bound on cached template spectra; templates beyond it are transformed on the fly
+DEFAULT_SPECTRUM_CACHE_BYTES = 512 * 1024 * 1024
+
+# Windows whose energy is below this are flat, where TM_CCOEFF_NORMED is undefined
+MIN_WINDOW_ENERGY = 1e-3
+
+
+class FFTCorrelationEngine:
+    """
+    Scores a bank of templates against one screenshot at a time in the frequency domain.
+    """
+
+    def __init__(self, templates, frame_shape=None, max_cache_bytes=DEFAULT_SPECTRUM_CACHE_BYTES):
+        """
+        Initialize the engine.
+
+        Args:
+            templates: Dictionary mapping template names to BGR images
+            frame_shape: Optional (height, width) of the screenshots to expect. When given, every
+                         template transform is computed up front instead of on the first screenshot.
+            max_cache_bytes: Memory budget for cached template transforms
+        """
+        self.max_cache_bytes = max_cache_bytes
+        self._templates = {}
+        self._spectra = {}
+        self._cache_bytes = 0
+
+        for name, img in templates.items():
+            # Zero-mean templates make the screenshot's local mean drop out of the numerator
+            centered = img.astype(np.float32)
+            centered -= centered.reshape(-1, _channels(img)).mean(axis=0)
+            norm = float(np.sqrt(np.square(centered, dtype=np.float64).sum()))
+            self._templates[name] = (centered, norm)
+
+        if frame_shape is not None:
+            self.precompute(frame_shape)
+
+    @staticmethod
+    def dft_shape(frame_shape):
+        """
+        Transform size for a frame. Padding to the frame size is enough: correlation outputs
+        are only read for fully overlapping positions, which never wrap around.
+        """
+        return cv2.getOptimalDFTSize(frame_shape[0]), cv2.getOptimalDFTSize(frame_shape[1])
+
+    def precompute(self, frame_shape):
+        """Compute and cache template transforms for frames of the given (height, width)."""
+        dft_shape = self.dft_shape(frame_shape)
+        for name in self._templates:
+            self._template_spectra(name, dft_shape)
+
+    def _template_spectra(self, name, dft_shape):
+        """Per-channel transforms of a zero-padded template, cached while the budget allows."""
+        cache = self._spectra.setdefault(dft_shape, {})
+        if name in cache:
+            return cache[name]
+
+        centered = self._templates[name][0]
+        spectra = [_forward_dft(channel, dft_shape) for channel in _split(centered)]
+
+        size = sum(spectrum.nbytes for spectrum in spectra)
+        if self._cache_bytes + size <= self.max_cache_bytes:
+            cache[name] = spectra
+            self._cache_bytes += size
+        return spectra
+
+    def prepare(self, screenshot):
+        """
+        Compute the screenshot-side state shared by every template.
+
+        Returns:
+            Opaque dictionary passed to correlate()
+        """
+        frame_shape = screenshot.shape[:2]
+        dft_shape = self.dft_shape(frame_shape)
+
+        # Centering the frame keeps float32 transforms and window sums well conditioned
+        centered = screenshot.astype(np.float32)
+        centered -= centered.reshape(-1, _channels(screenshot)).mean(axis=0)
+        energy = cv2.transform(cv2.multiply(centered, centered), np.ones((1, _channels(screenshot)), np.float32))
+
+        return {
+            'frame_shape': frame_shape,
+            'dft_shape': dft_shape,
+            'spectra': [_forward_dft(channel, dft_shape) for channel in _split(centered)],
+            'centered': centered,
+            'energy': energy,
+            'window_energy': {}
+        }
+
+    def _window_energy(self, frame, h, w):
+        """Sum over channels of each h x w window's variance term, shared by same-size templates."""
+        key = (h, w)
+        if key not in frame['window_energy']:
+            out_h = frame['frame_shape'][0] - h + 1
+            out_w = frame['frame_shape'][1] - w + 1
+            sums = _window_sum(frame['centered'], h, w)[:out_h, :out_w]
+            squares = _window_sum(frame['energy'], h, w)[:out_h, :out_w]
+            channels = frame['centered'].shape[2] if frame['centered'].ndim == 3 else 1
+            squared_sums = cv2.transform(cv2.multiply(sums, sums), np.full((1, channels), 1.0 / (h * w), np.float32))
+            frame['window_energy'][key] = cv2.sqrt(cv2.max(cv2.subtract(squares, squared_sums), MIN_WINDOW_ENERGY))
+        return frame['window_energy'][key]
+
+    def correlate(self, frame, name):
+        """
+        TM_CCOEFF_NORMED map of one template against a prepared screenshot.
+
+        Returns:
+            float32 array of shape (H - h + 1, W - w + 1), or None if the template is larger
+            than the screenshot
+        """
+        centered, norm = self._templates[name]
+        h, w = centered.shape[:2]
+        frame_h, frame_w = frame['frame_shape']
+        if h > frame_h or w > frame_w:
+            return None
+
+        spectra = self._template_spectra(name, frame['dft_shape'])
+        product = cv2.mulSpectrums(frame['spectra'][0], spectra[0], 0, conjB=True)
+        for frame_spectrum, template_spectrum in zip(frame['spectra'][1:], spectra[1:]):
+            product += cv2.mulSpectrums(frame_spectrum, template_spectrum, 0, conjB=True)
+
+        numerator = cv2.dft(product, flags=cv2.DFT_INVERSE | cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+        numerator = numerator[:frame_h - h + 1, :frame_w - w + 1]
+        if norm == 0:
+            return np.zeros_like(numerator)
+
+        result = cv2.divide(numerator, self._window_energy(frame, h, w), scale=1.0 / norm)
+        return np.clip(result, -1.0, 1.0, out=result)
+
+    def best_matches(self, screenshot, names=None, profiler=None):
+        """
+        Best match of every template in one screenshot.
+
+        Args:
+            screenshot: BGR screenshot
+            names: Optional subset of template names to score
+            profiler: Optional MatchProfiler that times the shared transform and every template
+
+        Returns:
+            Dictionary mapping template names to (confidence, top_left) tuples
+        """
+        started = time.perf_counter()
+        frame = self.prepare(screenshot)
+        if profiler is not None:
+            profiler.lap('fft_prepare', started)
+
+        matches = {}
+        for name in (self._templates if names is None else names):
+            if profiler is not None:
+                started = time.perf_counter()
+            result = self.correlate(frame, name)
+            if result is None:
+                matches[name] = (-1.0, (0, 0))
+                continue
+            if profiler is not None:
+                started = profiler.lap('fft_correlate', started, name)
+            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+            if profiler is not None:
+                profiler.lap('min_max_loc', started, name)
+            matches[name] = (max_val, max_loc)
+        return matches
+
+
+def _channels(img):
+    return img.shape[2] if img.ndim == 3 else 1
+
+
+def _split(img):
+    return cv2.split(img) if img.ndim == 3 else [img]
+
+
+def _forward_dft(channel, dft_shape):
+    """Zero-pad a single channel to dft_shape and return its packed (CCS) real transform."""
+    padded = np.zeros(dft_shape, np.float32)
+    padded[:channel.shape[0], :channel.shape[1]] = channel
+    return cv2.dft(padded)
+
+
+def _window_sum(img, h, w):
+    """Sum of every h x w window, indexed by the window's top-left corner."""
+    return cv2.boxFilter(img, -1, (w, h), anchor=(0, 0), normalize=False, borderType=cv2.BORDER_CONSTANT)
+
+
+def _synthetic_bank(memoria_dir, count):
+    """Grow the memoria set to `count` distinct templates with flips and crops."""
+    base = [cv2.imread(str(path)) for path in sorted(Path(memoria_dir).glob('*.png'))]
+    base = [img for img in base if img is not None]
+    if not base:
+        raise SystemExit(f"No memoria templates found in {memoria_dir}")
+
+    bank = {}
+    for i in range(count):
+        img = base[i % len(base)]
+        variant = i // len(base)
+        if variant % 2:
+            img = cv2.flip(img, 1)
+        crop = variant // 2
+        if crop:
+            img = img[crop:img.shape[0] - crop, crop:img.shape[1] - crop]
+        bank[f"template-{i}"] = np.ascontiguousarray(img)
+    return bank
+
+
+def _synthetic_screenshot(bank, frame_shape, seed=0):
+    """Noisy background with a handful of the templates pasted in."""
+    rng = np.random.default_rng(seed)
+    h, w = frame_shape
+    background = rng.integers(0, 256, (h // 8, w // 8, 3), dtype=np.uint8)
+    screenshot = cv2.resize(cv2.GaussianBlur(background, (3, 3), 0), (w, h))
+    for img in list(bank.values())[:6]:
+        th, tw = img.shape[:2]
+        x, y = int(rng.integers(0, w - tw)), int(rng.integers(0, h - th))
+        screenshot[y:y + th, x:x + tw] = img
+    return screenshot
+
+
+def benchmark(memoria_dir='memorias', templates=36, frame_shape=(720, 1280), screenshots=3):
+    """
+    Compare per-template cv2.matchTemplate against the batched FFT engine.
+
+    Returns:
+        Dictionary of timings (seconds per screenshot), speedup and agreement figures
+    """
+    bank = _synthetic_bank(memoria_dir, templates)
+    frames = [_synthetic_screenshot(bank, frame_shape, seed) for seed in range(screenshots)]
+
+    start = time.perf_counter()
+    engine = FFTCorrelationEngine(bank, frame_shape=frame_shape)
+    precompute_time = time.perf_counter() - start
+
+    baseline_time = 0.0
+    engine_time = 0.0
+    max_difference = 0.0
+    same_peaks = 0
+    for frame in frames:
+        start = time.perf_counter()
+        expected = {}
+        for name, img in bank.items():
+            result = cv2.matchTemplate(frame, img, cv2.TM_CCOEFF_NORMED)
+            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+            expected[name] = (max_val, max_loc)
+        baseline_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = engine.best_matches(frame)
+        engine_time += time.perf_counter() - start
+
+        for name, (max_val, max_loc) in expected.items():
+            max_difference = max(max_difference, abs(actual[name][0] - max_val))
+            same_peaks += actual[name][1] == max_loc
+
+    return {
+        'templates': templates,
+        'frame_shape': list(frame_shape),
+        'screenshots': screenshots,
+        'precompute_seconds': precompute_time,
+        'match_template_seconds_per_screenshot': baseline_time / screenshots,
+        'fft_seconds_per_screenshot': engine_time / screenshots,
+        'speedup': baseline_time / engine_time,
+        'max_confidence_difference': max_difference,
+        'peak_agreement': same_peaks / (templates * screenshots)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark FFT batched correlation against cv2.matchTemplate")
+    parser.add_argument('--memoria-dir', default='memorias')
+    parser.add_argument('--templates', type=int, default=36, help="Bank size (memorias are flipped/cropped to reach it)")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--screenshots', type=int, default=3)
+    args = parser.parse_args()
+
+    report = benchmark(args.memoria_dir, args.templates, (args.height, args.width), args.screenshots)
+    print(f"Templates: {report['templates']}, frame: {args.width}x{args.height}, screenshots: {report['screenshots']}")
+    print(f"Template transforms precomputed in {report['precompute_seconds']:.2f}s")
+    print(f"cv2.matchTemplate: {report['match_template_seconds_per_screenshot'] * 1000:.1f} ms per screenshot")
+    print(f"FFT engine:        {report['fft_seconds_per_screenshot'] * 1000:.1f} ms per screenshot")
+    print(f"Speedup: {report['speedup']:.1f}x")
+    print(f"Max confidence difference: {report['max_confidence_difference']:.2e}, "
+          f"peak agreement: {report['peak_agreement']:.1%}")
@@ -2,6 +2,7 @@ import json
 import os
 from pathlib import Path
 import sys
+from results_store import ResultsStore, RESULTS_DB_FILE
 
 def extract_email_from_filename(filename):
     """Extract email address from screenshot filename."""
@@ -13,12 +14,8 @@ def extract_email_from_filename(filename):
         return email
     return None
 
-def save_readable_results():
-    """Save match results in a more readable format"""
-    # Load match_results.json
-    with open('match_results.json', 'r') as f:
-        results = json.load(f)
-    
+def build_readable_results(results):
+    """Summarize match results per email: the top 3 memorias and the sum of their custom scores"""
     readable_results = {}
     
     # First, get all unique emails from screenshots directory
@@ -78,11 +75,25 @@ def save_readable_results():
                 {'name': name, 'score': info['custom_score']} for name, info in top_memorias
             ]
     
+    return readable_results
+
+def save_readable_results(results=None, output_file='memoria_match_results.json'):
+    """Save match results in a more readable format"""
+    # Load the results store, or match_results.json if there is none yet
+    if results is None and os.path.exists(RESULTS_DB_FILE):
+        with ResultsStore(RESULTS_DB_FILE) as store:
+            results = store.load_results()
+    elif results is None:
+        with open('match_results.json', 'r') as f:
+            results = json.load(f)
+    
+    readable_results = build_readable_results(results)
+    
     # Save to file
-    with open('memoria_match_results.json', 'w') as f:
+    with open(output_file, 'w') as f:
         json.dump(readable_results, f, indent=2)
     
-    print("Saved readable results to memoria_match_results.json")
+    print(f"Saved readable results to {output_file}")
 
 if __name__ == "__main__":
     save_readable_results()
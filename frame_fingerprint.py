@@ -0,0 +1,177 @@
+"""
+Content fingerprints of captured frames, used to store and match each distinct screen once.
+
+Rerolls often land on the same screen (a failed pull, the title screen, a repeated capture).
+Every frame is fingerprinted with an exact pixel hash (SHA-1 of the decoded pixels, so PNG
+encoder differences do not matter), and a frame whose pixel hash is known is a duplicate of
+that canonical frame.
+
+Only identical pixels count. Result screens of different accounts differ in a single card,
+which neither a perceptual hash of the whole screen nor a downscaled pixel comparison
+reliably tells apart, and linking them would give one account the other's cards. Frames
+that are merely similar are written and matched on their own.
+
+frame_index.json records the canonical frames and which screenshots are linked to them.
+screenshot_windows consults it at capture time; ImageMatcher uses the links to reuse the
+canonical frame's detections. Like the detection cache, saves append to a journal
+(frame_index.json.log) that is folded back into the file once it outgrows it, so saving
+after every capture stays cheap and separate FrameIndex instances keep each other's entries.
+Run this module directly to index existing screenshots.
+"""
+import argparse
+import json
+import os
+import threading
+from pathlib import Path
+
+import cv2
+
+from detection_cache import (JOURNAL_COMPACT_ENTRIES, append_journal, apply_journal, claim_journal, replay_journal,
+                             template_hash)
+
+FRAME_INDEX_FILE = 'frame_index.json'
+
+
+def pixel_hash(img):
+    """SHA-1 of a decoded frame's shape and pixels (the digest templates are tracked with)."""
+    return template_hash(img)
+
+
+class FrameIndex:
+    """
+    JSON-backed index of canonical frames and the screenshots linked to them.
+    """
+
+    def __init__(self, index_file=FRAME_INDEX_FILE):
+        self.index_file = index_file
+        self.journal_file = f"{index_file}.log"
+        # Pixel hash -> {'path': canonical screenshot, 'frame_size': [w, h]}
+        self.frames = {}
+        # Screenshot path -> canonical screenshot path (all paths absolute)
+        self.links = {}
+        self._pending = []
+        self._journal_entries = 0
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """Load the index file and replay its journal, starting empty if the file is missing or unreadable."""
+        with self._lock:
+            self.frames, self.links = self._read_index_file()
+            self._pending = []
+            self._journal_entries = replay_journal(self.journal_file, {'frames': self.frames, 'links': self.links})
+
+    def _read_index_file(self):
+        if not os.path.exists(self.index_file):
+            return {}, {}
+
+        try:
+            with open(self.index_file, 'r') as f:
+                data = json.load(f)
+        except json.JSONDecodeError as e:
+            print(f"Error loading frame index {self.index_file}: {e}")
+            return {}, {}
+        return data.get('frames', {}), data.get('links', {})
+
+    def save(self):
+        """Append the entries registered since the last save to the journal, compacting it when it has grown large."""
+        with self._lock:
+            self._flush()
+            if self._journal_entries > max(JOURNAL_COMPACT_ENTRIES, len(self.frames)):
+                self.compact()
+
+    def compact(self):
+        """Fold the journal into the index file and reload (see DetectionCache.compact)."""
+        with self._lock:
+            self._flush()
+            claimed = claim_journal(self.journal_file)
+            frames, links = self._read_index_file()
+            apply_journal(claimed, {'frames': frames, 'links': links})
+
+            tmp_file = f"{self.index_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump({'frames': frames, 'links': links}, f, separators=(',', ':'))
+            os.replace(tmp_file, self.index_file)
+            if os.path.exists(claimed):
+                os.remove(claimed)
+            self.load()
+
+    def _flush(self):
+        if self._pending:
+            append_journal(self.journal_file, self._pending)
+            self._journal_entries += len(self._pending)
+            self._pending = []
+
+    def _put(self, table, key, value):
+        getattr(self, table)[key] = value
+        self._pending.append({'table': table, 'key': key, 'value': value})
+
+    def canonical(self, screenshot_path):
+        """Canonical screenshot a screenshot is linked to, or None if it is a canonical frame itself."""
+        return self.links.get(os.path.abspath(screenshot_path))
+
+    def find_duplicate(self, img, frame_hash=None):
+        """
+        Canonical frame with exactly the same pixels as an image.
+
+        Args:
+            img: Decoded BGR frame
+            frame_hash: The image's pixel hash, if already computed
+
+        Returns:
+            Path of the canonical screenshot, or None if the frame is new
+        """
+        frame = self.frames.get(frame_hash or pixel_hash(img))
+        if frame is not None and os.path.exists(frame['path']):
+            return frame['path']
+        return None
+
+    def register(self, screenshot_path, img):
+        """
+        Record a screenshot, either as a new canonical frame or as a link to the one it duplicates.
+
+        Args:
+            screenshot_path: Path the screenshot is (or would be) saved at
+            img: Decoded BGR frame
+
+        Returns:
+            Path of the canonical screenshot it duplicates, or None if it became a canonical frame
+        """
+        screenshot_path = os.path.abspath(screenshot_path)
+        frame_hash = pixel_hash(img)
+        with self._lock:
+            canonical = self.find_duplicate(img, frame_hash)
+            if canonical is not None and canonical != screenshot_path:
+                self._put('links', screenshot_path, canonical)
+                return canonical
+
+            self._put('frames', frame_hash, {
+                'path': screenshot_path,
+                'frame_size': [img.shape[1], img.shape[0]]
+            })
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index screenshots and link duplicates to their canonical frame")
+    parser.add_argument('screenshots_dir', nargs='?', default='screenshots')
+    parser.add_argument('--index', default=FRAME_INDEX_FILE)
+    args = parser.parse_args()
+
+    index = FrameIndex(args.index)
+    known = {entry['path'] for entry in index.frames.values()} | set(index.links)
+    duplicates = 0
+    for screenshot_path in sorted(Path(args.screenshots_dir).glob('*.png')):
+        if os.path.abspath(screenshot_path) in known:
+            continue
+        img = cv2.imread(str(screenshot_path))
+        if img is None:
+            print(f"Error: Could not load screenshot {screenshot_path}")
+            continue
+        canonical = index.register(screenshot_path, img)
+        if canonical is not None:
+            duplicates += 1
+            print(f"{screenshot_path.name} duplicates {Path(canonical).name}")
+
+    index.save()
+    print(f"{len(index.frames)} canonical frames, {duplicates} new duplicates linked; index saved to {args.index}")
@@ -1,6 +1,10 @@
 from macro_launcher import rename_hbr_windows, type_salted_emails, scan_outlook_for_codes, enter_verification_codes, force_outlook_sync
 from screenshot_windows import screenshot_windows
-from image_matcher import match_memorias
+from image_matcher import match_memorias, load_scoring_config
+from rescore import rescore_results
+from fix_memoria_results import save_readable_results
+from capture_service import CaptureService
+from results_trigger import AutoCapture, ResultsScreenDetector
 import threading
 import queue
 import time
@@ -48,7 +52,8 @@ class MacroGUI(ctk.CTk):
             "enter_codes": "Ctrl+Alt+5",
             "take_screenshots": "Ctrl+Alt+6",
             "match_memorias": "Ctrl+Alt+7",
-            "view_memoria_results": "Ctrl+Alt+8"
+            "view_memoria_results": "Ctrl+Alt+8",
+            "rescore_results": "Ctrl+Alt+9"
         }
 
         # Create buttons
@@ -100,7 +105,14 @@ class MacroGUI(ctk.CTk):
             text=f"Match Memorias in Screenshots [{self.hotkey_mappings['match_memorias']}]",
             command=self.match_memorias
         )
-        self.match_memorias_button.grid(row=5, column=0, padx=20, pady=10, sticky="ew", columnspan=2)
+        self.match_memorias_button.grid(row=5, column=0, padx=20, pady=10, sticky="ew")
+
+        self.rescore_button = ctk.CTkButton(
+            self.main_frame,
+            text=f"Re-score Results [{self.hotkey_mappings['rescore_results']}]",
+            command=self.rescore_results
+        )
+        self.rescore_button.grid(row=5, column=1, padx=20, pady=10, sticky="ew")
 
         self.view_results_button = ctk.CTkButton(
             self.main_frame,
@@ -109,6 +121,15 @@ class MacroGUI(ctk.CTk):
         )
         self.view_results_button.grid(row=6, column=0, padx=20, pady=10, sticky="ew", columnspan=2)
 
+        # Captures and matches result screens as they appear (see results_trigger.py)
+        self.auto_capture = None
+        self.auto_capture_switch = ctk.CTkSwitch(
+            self.main_frame,
+            text="Auto-capture Result Screens",
+            command=self.toggle_auto_capture
+        )
+        self.auto_capture_switch.grid(row=7, column=0, padx=20, pady=10, sticky="w", columnspan=2)
+
         # Create status display
         self.status_label = ctk.CTkLabel(self, text="Status: Ready", anchor="w")
         self.status_label.grid(row=1, column=0, padx=20, pady=(0, 10), sticky="ew")
@@ -259,6 +280,42 @@ class MacroGUI(ctk.CTk):
         
         threading.Thread(target=run_task).start()
 
+    def toggle_auto_capture(self):
+        """Start or stop capturing and matching result screens as soon as they appear"""
+        if self.auto_capture_switch.get():
+            try:
+                detector = ResultsScreenDetector()
+            except ValueError as e:
+                self.log(f"Error: {str(e)}. Cut one from a result screen with "
+                         f"python results_trigger.py --make-probe SCREENSHOT X Y W H")
+                self.auto_capture_switch.deselect()
+                return
+            self.auto_capture = AutoCapture(CaptureService(), detector, on_result=self._log_auto_capture)
+            self.auto_capture.start()
+            self.log("Auto-capture started: result screens are captured and matched as they appear")
+            self.set_status("Auto-capturing result screens")
+            return
+
+        auto_capture, self.auto_capture = self.auto_capture, None
+        if auto_capture is None:
+            return
+
+        def run():
+            # Waits for the result screens already queued to be matched
+            auto_capture.stop()
+            self.log(f"Auto-capture stopped: {auto_capture.captured} result screens captured")
+            self.set_status("Ready")
+
+        self.set_status("Stopping auto-capture...")
+        threading.Thread(target=run, daemon=True).start()
+
+    def _log_auto_capture(self, title, screenshot_path, match_result):
+        """Log a result screen captured by auto-capture"""
+        if match_result is None:
+            self.log(f"Auto-capture: {title}: result screen could not be matched")
+            return
+        self.log(f"Auto-capture: {title}: {len(match_result['matches'])} matches ({screenshot_path})")
+
     def type_emails(self):
         """Handle typing salted emails into windows"""
         def run():
@@ -337,26 +394,8 @@ class MacroGUI(ctk.CTk):
         
         def run_task():
             try:
-                # Define custom scores for memorias
-                custom_scores = {
-                    'yingying-ss1': 20,
-                    'aoi-ss2': 5,
-                    'yuina-ss3': 1,
-                    'seira-ss1': 1,
-                    'chie-ss2': 1,
-                    'seika-ss2': 20,
-                    'seika-ss1': 3,
-                    'tama-ss1': 1,
-                    'tama-ss4': 2
-                }
-                
-                # Define scoring criteria
-                scoring_criteria = {
-                    'match_confidence_weight': 0.6,
-                    'position_weight': 0.2,
-                    'size_weight': 0.1,
-                    'color_similarity_weight': 0.1
-                }
+                # Custom scores and scoring criteria come from memoria_scores.json
+                custom_scores, scoring_criteria = load_scoring_config()
                 
                 # Ask if user wants to skip already processed screenshots
                 skip_processed = True
@@ -392,8 +431,9 @@ class MacroGUI(ctk.CTk):
                         for i, match in enumerate(top_matches):
                             self.log(f"  Match {i+1}: {match['memoria']} (Score: {match['custom_score']}, Quality: {match['match_quality_score']:.2f}) in {match['screenshot']}")
                 
-                # Save results to a more readable format
-                self.save_readable_results(results)
+                # Save all stored results (not only this run's) in a more readable format
+                save_readable_results()
+                self.log("Saved readable results to memoria_match_results.json")
                 
                 self.status_label.configure(text="Status: Memoria matching complete")
             except Exception as e:
@@ -402,87 +442,24 @@ class MacroGUI(ctk.CTk):
         
         threading.Thread(target=run_task).start()
     
-    def save_readable_results(self, results):
-        """Save match results in a more readable format"""
-        readable_results = {}
-        
-        # First, get all unique emails from screenshots directory
-        all_emails = set()
-        screenshots_dir = os.path.join(os.getcwd(), 'screenshots')
-        if os.path.exists(screenshots_dir):
-            for filename in os.listdir(screenshots_dir):
-                if filename.endswith('.png') and '@' in filename:
-                    email = self._extract_email_from_filename(filename)
-                    if email:
-                        all_emails.add(email)
-        
-        # Initialize all emails with zero scores
-        for email in all_emails:
-            readable_results[email] = {
-                'matching_memorias': [],
-                'score': 0
-            }
-        
-        # Update with actual match results
-        for email, match_results in results.items():
-            if email not in readable_results:
-                readable_results[email] = {
-                    'matching_memorias': [],
-                    'score': 0
-                }
-            
-            # Collect all memoria matches for this email
-            all_matches = []
-            for match_result in match_results:
-                for match in match_result.get('matches', []):
-                    all_matches.append({
-                        'memoria': match['memoria_name'],
-                        'custom_score': match['custom_score'],
-                        'match_quality_score': match['match_quality_score']
-                    })
-            
-            # Get unique memorias with their best scores
-            memoria_scores = {}
-            for match in all_matches:
-                memoria = match['memoria']
-                custom_score = match['custom_score']
-                match_quality = match['match_quality_score']
-                
-                if memoria not in memoria_scores or match_quality > memoria_scores[memoria]['match_quality_score']:
-                    memoria_scores[memoria] = {
-                        'custom_score': custom_score,
-                        'match_quality_score': match_quality
-                    }
-            
-            # Calculate overall score (sum of custom scores of top 3 memorias)
-            top_memorias = sorted(
-                [(memoria, info) for memoria, info in memoria_scores.items()],
-                key=lambda x: (x[1]['custom_score'], x[1]['match_quality_score']),
-                reverse=True
-            )[:3]
-            if top_memorias:
-                total_score = sum(info['custom_score'] for _, info in top_memorias)
-                readable_results[email]['score'] = total_score
-                readable_results[email]['matching_memorias'] = [
-                    {'name': name, 'score': info['custom_score']} for name, info in top_memorias
-                ]
+    def rescore_results(self):
+        """Rebuild the match results from cached detections with the current memoria_scores.json"""
+        self.status_label.configure(text="Status: Re-scoring results...")
         
-        # Save to file
-        with open('memoria_match_results.json', 'w') as f:
-            json.dump(readable_results, f, indent=2)
+        def run_task():
+            try:
+                start = time.perf_counter()
+                results = rescore_results()
+                total_screenshots = sum(len(match_results) for match_results in results.values())
+                self.log(f"Re-scored {total_screenshots} screenshots across {len(results)} emails "
+                         f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+                self.status_label.configure(text="Status: Re-scoring complete")
+            except Exception as e:
+                self.log(f"Error re-scoring results: {str(e)}")
+                self.status_label.configure(text="Status: Error re-scoring results")
         
-        self.log("Saved readable results to memoria_match_results.json")
+        threading.Thread(target=run_task).start()
     
-    def _extract_email_from_filename(self, filename):
-        """Extract email address from screenshot filename."""
-        # Assuming format like "email_at_domain.com_timestamp.png"
-        parts = filename.split('_')
-        if len(parts) >= 3:
-            email_parts = parts[:-2]  # Skip timestamp and extension
-            email = '_'.join(email_parts).replace('_at_', '@')
-            return email
-        return None
-
     def view_memoria_results(self):
         """Open a new window to display memoria match results in a pretty format"""
         try:
@@ -829,6 +806,8 @@ class MacroGUI(ctk.CTk):
             self.match_memorias()
         elif action == "view_memoria_results":
             self.view_memoria_results()
+        elif action == "rescore_results":
+            self.rescore_results()
 
 if __name__ == "__main__":
     ctk.set_appearance_mode("dark")
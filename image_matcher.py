@@ -3,14 +3,225 @@ import cv2
 import numpy as np
 from pathlib import Path
 import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from datetime import datetime
+from detection_cache import DetectionCache, DETECTION_CACHE_FILE, content_hash, file_content_hash, stale_templates, template_hash
+from fft_matcher import FFTCorrelationEngine
+from frame_fingerprint import FRAME_INDEX_FILE, FrameIndex
+from match_profiler import MatchProfiler
+from memoria_index import MemoriaIndex, dhash
+from peak_extraction import find_peaks, non_max_suppression
+from results_store import ResultsStore, RESULTS_DB_FILE
+from screenshot_prefetch import IO_THREADS, PREFETCH_DEPTH, ScreenshotPrefetcher
+from search_regions import SEARCH_REGION_FILE, load_search_regions
+from calibrate_thresholds import MEMORIA_THRESHOLD_FILE, load_memoria_thresholds
+from slot_classifier import SlotClassifier, SLOT_LAYOUT_FILE, load_slot_layouts
+from template_bank import SharedTemplateBank
+from template_cache import TemplateCache, TEMPLATE_CACHE_FILE
+
+SEARCH_MODES = ('exhaustive', 'pyramid', 'fft', 'slots', 'cascade')
+
+# Custom scores and scoring criteria shared by the GUI, the command line and rescore.py
+SCORING_CONFIG_FILE = 'memoria_scores.json'
+
+DEFAULT_SCORING_CRITERIA = {
+    'match_confidence_weight': 0.7,
+    'position_weight': 0.1,
+    'size_weight': 0.1,
+    'color_similarity_weight': 0.1
+}
+
+# Pyramid search: coarse peaks within this margin below the threshold are verified at full resolution
+PYRAMID_THRESHOLD_MARGIN = 0.25
+PYRAMID_MAX_CANDIDATES = 3
+PYRAMID_MIN_TEMPLATE_SIDE = 8
+# Pyramid search with multi_instance: coarse peaks per template verified at full resolution
+PYRAMID_MAX_PEAKS = 16
+
+# Cascade search: the grayscale stage nominates locations this far below the threshold, and
+# each nominee is confirmed in color within this many pixels of its grayscale peak
+CASCADE_GRAY_MARGIN = 0.15
+CASCADE_MAX_CANDIDATES = 3
+CASCADE_MAX_PEAKS = 16
+CASCADE_VERIFY_RADIUS = 2
+
+# Per-stage counters kept by the cascade search (see ImageMatcher.cascade_report)
+CASCADE_STATS = ('templates', 'templates_without_candidates', 'nominated', 'color_rejected', 'histogram_rejected',
+                 'accepted')
+
+# Bins in one plane of the 8x8x8 color histogram (see _histogram_correlation)
+HISTOGRAM_PLANE_BINS = 64
+
+# Budgeted matching: fraction of a template's size by which its window center must stay
+# clear of an already claimed card (0.5 = the center may not fall inside the claimed card)
+CLAIM_MARGIN = 0.5
+
+# Matcher owned by each process-pool worker, built once by _init_match_worker
+_worker_matcher = None
+
+
+def _histogram_correlation(hist1, hist2):
+    """
+    Row-wise equivalent of cv2.compareHist(..., cv2.HISTCMP_CORREL) for stacked flat 8x8x8 histograms.
+    
+    OpenCV walks an N-d histogram plane by plane and uses the plane size (8x8 bins) as the sample
+    count, so the "mean" terms are scaled by 1/64 rather than 1/512. That is reproduced here to keep
+    scores identical to what compareHist produced. Like OpenCV, a vanishing denominator gives 1.
+    """
+    scale = 1.0 / HISTOGRAM_PLANE_BINS
+    sum1 = hist1.sum(axis=-1)
+    sum2 = hist2.sum(axis=-1)
+    numerator = (hist1 * hist2).sum(axis=-1) - sum1 * sum2 * scale
+    denominator = ((hist1 ** 2).sum(axis=-1) - sum1 ** 2 * scale) * ((hist2 ** 2).sum(axis=-1) - sum2 ** 2 * scale)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(np.abs(denominator) > np.finfo(np.float64).eps, numerator / np.sqrt(denominator), 1.0)
+
+
+def load_scoring_config(config_file=SCORING_CONFIG_FILE):
+    """
+    Load the custom scores and scoring criteria from the shared config file.
+    
+    Returns:
+        Tuple of (custom_scores, scoring_criteria); empty scores and the default criteria
+        if the file does not exist
+    """
+    if not os.path.exists(config_file):
+        print(f"Warning: Scoring config {config_file} does not exist, using defaults")
+        return {}, dict(DEFAULT_SCORING_CRITERIA)
+        
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+        
+    return config.get('custom_scores', {}), config.get('scoring_criteria', dict(DEFAULT_SCORING_CRITERIA))
+
+
+def score_detections(detections, frame_size, custom_scores=None, scoring_criteria=None):
+    """
+    Turn raw detections into scored match records in one vectorized pass.
+    
+    Only arithmetic on the stored detection fields is involved, so scores can be rebuilt for new
+    custom_scores or scoring_criteria without any image work.
+    
+    Args:
+        detections: List of raw detections (see ImageMatcher.detect_screenshot)
+        frame_size: (width, height) of the screenshot the detections come from
+        custom_scores: Dictionary mapping memoria names to custom point values
+        scoring_criteria: Dictionary of scoring weights
+        
+    Returns:
+        List of match records, sorted by custom_score then match_quality_score (highest first)
+    """
+    if scoring_criteria is None:
+        scoring_criteria = DEFAULT_SCORING_CRITERIA
+    custom_scores = custom_scores or {}
+    if not detections:
+        return []
+        
+    confidence = np.array([d['confidence'] for d in detections], dtype=np.float64)
+    top_left = np.array([d['position'] for d in detections], dtype=np.int64).reshape(-1, 2)
+    size = np.array([d['size'] for d in detections], dtype=np.int64).reshape(-1, 2)
+    color_similarity = np.array([d['color_similarity'] for d in detections], dtype=np.float64)
+    width, height = frame_size
+    
+    # Position score (center of screen is better): normalized distance from center (0 = center, 1 = corner)
+    center = np.array([width / 2, height / 2])
+    match_center = top_left + size / 2
+    max_distance = np.sqrt((center ** 2).sum())
+    position_score = 1 - np.sqrt(((center - match_center) ** 2).sum(axis=1)) / max_distance
+    
+    # Size score (larger is better, up to a point)
+    size_ratio = size.prod(axis=1) / (width * height)
+    size_score = np.minimum(size_ratio * 10, 1.0)  # Cap at 1.0
+    
+    # Final score based on weights
+    match_quality_score = (
+        confidence * scoring_criteria.get('match_confidence_weight', 0.7) +
+        position_score * scoring_criteria.get('position_weight', 0.1) +
+        size_score * scoring_criteria.get('size_weight', 0.1) +
+        color_similarity * scoring_criteria.get('color_similarity_weight', 0.1)
+    )
+    
+    matches = []
+    for i, detection in enumerate(detections):
+        custom_score = custom_scores.get(detection['memoria_name'], 0)  # Default to 0 if not specified
+        matches.append({
+            'memoria_name': detection['memoria_name'],
+            'memoria_path': detection['memoria_path'],
+            'confidence': float(confidence[i]),
+            'position': (int(top_left[i][0]), int(top_left[i][1])),
+            'size': (int(size[i][0]), int(size[i][1])),
+            'position_score': float(position_score[i]),
+            'size_score': float(size_score[i]),
+            'color_similarity': float(color_similarity[i]),
+            'match_quality_score': float(match_quality_score[i]),
+            'custom_score': custom_score,
+            'final_score': custom_score  # Add final_score for backward compatibility
+        })
+        
+    # Sort matches by custom_score (highest first), then by match_quality_score as a tiebreaker
+    matches.sort(key=lambda x: (x['custom_score'], x['match_quality_score']), reverse=True)
+    return matches
+
+
+def build_match_result(record, custom_scores=None, scoring_criteria=None):
+    """Build the match result stored in match_results.json from a raw detection record."""
+    return {
+        'email': record['email'],
+        'screenshot_path': record['screenshot_path'],
+        'matches': score_detections(record['detections'], record['frame_size'], custom_scores, scoring_criteria),
+        'timestamp': record['timestamp']
+    }
+
+
+def _suppress_claimed(result, claimed, w, h):
+    """
+    Rule out every window of a w x h template whose center falls inside a claimed card.
+    
+    Args:
+        result: Correlation map indexed by window top-left, modified in place
+        claimed: List of (x, y, w, h) boxes in the map's coordinates
+    """
+    for x, y, box_w, box_h in claimed:
+        x0 = max(0, int(x - w * CLAIM_MARGIN) + 1)
+        y0 = max(0, int(y - h * CLAIM_MARGIN) + 1)
+        x1 = max(0, int(x + box_w - w * CLAIM_MARGIN))
+        y1 = max(0, int(y + box_h - h * CLAIM_MARGIN))
+        result[y0:y1, x0:x1] = -1.0
+
+
+def _is_claimed(x, y, w, h, claimed):
+    """Whether _suppress_claimed rules out the w x h window with top-left (x, y)."""
+    for box_x, box_y, box_w, box_h in claimed:
+        if (int(box_x - w * CLAIM_MARGIN) + 1 <= x < int(box_x + box_w - w * CLAIM_MARGIN) and
+                int(box_y - h * CLAIM_MARGIN) + 1 <= y < int(box_y + box_h - h * CLAIM_MARGIN)):
+            return True
+    return False
+
+
+def _init_match_worker(matcher_kwargs):
+    """Process-pool initializer: load the template bank once per worker."""
+    global _worker_matcher
+    _worker_matcher = ImageMatcher(**matcher_kwargs)
+
+
+def _detect_in_worker(screenshot_path, memoria_names=None):
+    """Process-pool task: collect the raw detections of a single screenshot with the worker's matcher."""
+    return _worker_matcher.detect_screenshot(screenshot_path, memoria_names)
+
 
 class ImageMatcher:
     """
     A class for matching partial images (memorias) against screenshots and scoring the matches.
     """
     
-    def __init__(self, memoria_dir='memorias', screenshots_dir='screenshots', threshold=0.7, custom_scores=None):
+    def __init__(self, memoria_dir='memorias', screenshots_dir='screenshots', threshold=0.7, custom_scores=None,
+                 search_mode='exhaustive', pyramid_scale=0.5, template_bank=None, detection_cache=None,
+                 results_store=None, slot_layout_file=SLOT_LAYOUT_FILE, template_cache=None, expected_cards=None,
+                 template_priority=None, multi_instance=False, cascade_thresholds=None, search_regions=None,
+                 memoria_thresholds=None, frame_index=None):
         """
         Initialize the ImageMatcher.
         
@@ -20,157 +231,849 @@ class ImageMatcher:
             threshold: Minimum confidence threshold for a match (0.0 to 1.0)
             custom_scores: Dictionary mapping memoria names to custom point values
                            e.g. {'yingying-ss1': 20, 'another-memoria': 15}
+            memoria_thresholds: Optional dictionary mapping memoria names to their own confidence
+                                threshold (see calibrate_thresholds.py); other memorias use
+                                threshold. The relaxed pyramid and cascade prefilter thresholds
+                                move with it, so a template's search stops at its own threshold.
+            search_mode: 'exhaustive' slides every template over the full-resolution color
+                         screenshot; 'pyramid' searches a downscaled grayscale copy first and
+                         only verifies candidate peaks at full resolution; 'fft' scores every
+                         template against one shared frequency-domain transform of the screenshot;
+                         'slots' classifies the learned card slots of the screenshot's resolution
+                         and confirms only the best candidates per slot (see slot_classifier.py),
+                         falling back to 'exhaustive' for resolutions without learned slots;
+                         'cascade' correlates in grayscale at a relaxed threshold and only runs
+                         the color match and histogram check on the locations it nominates
+            pyramid_scale: Downscale factor used for the coarse level in 'pyramid' mode
+            template_bank: Optional SharedTemplateBank spec. When given, the preprocessed templates
+                           are read from that shared memory block instead of being decoded from
+                           memoria_dir and preprocessed again.
+            detection_cache: Optional DetectionCache. batch_match_screenshots only matches the
+                             templates a screenshot has not been matched against yet (new
+                             screenshots, new or edited templates) and records every detection in it.
+            results_store: Optional ResultsStore. save_results appends to it instead of rewriting
+                           match_results.json, and it answers the "already processed" checks.
+            frame_index: Optional FrameIndex (see frame_fingerprint.py). Screenshots it links to a
+                         canonical frame reuse that frame's detections instead of being matched.
+            slot_layout_file: Learned card-slot layouts used in 'slots' mode
+            template_cache: Optional TemplateCache. Preprocessed templates are loaded from it and
+                            only templates whose PNG changed are decoded and preprocessed again.
+            expected_cards: Optional number of cards on a result screen (e.g. 10 for a ten-pull).
+                            Templates are then searched in priority order, each match claims its
+                            region so later templates cannot match the same card, and the search
+                            stops once that many cards are identified. Ignored in 'slots' mode.
+            template_priority: Optional list of memoria names, most likely first, for the
+                               expected_cards search. Defaults to the hit counts in the results
+                               store, then custom scores.
+            multi_instance: If True, report every copy of a memoria in a screenshot instead of
+                            only its best match. All peaks above the threshold are taken from
+                            each template's single correlation pass, and overlapping matches
+                            (repeats or look-alike memorias on the same card) are resolved to
+                            the strongest one.
+            cascade_thresholds: Optional stage thresholds for 'cascade' mode: 'gray' (grayscale
+                                correlation needed to nominate a location, default threshold - 0.15)
+                                and 'histogram' (color similarity a color-confirmed match needs,
+                                default 0.0). The color stage uses threshold.
+            search_regions: Optional dictionary mapping (width, height) frame sizes to
+                            dictionaries mapping memoria names to (x, y, w, h) regions of
+                            interest (see search_regions.py). In screenshots of that size those
+                            memorias are searched inside their region first and over the full
+                            frame only when the region holds no match above the threshold (or
+                            is smaller than the template). Used for the best-match searches of
+                            'exhaustive', 'pyramid' and 'cascade' modes; multi_instance searches
+                            stay full-frame so repeats in other slots are still found.
         """
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search_mode {search_mode!r}, expected one of {SEARCH_MODES}")
+        if not 0 < pyramid_scale <= 1:
+            raise ValueError(f"pyramid_scale must be in (0, 1], got {pyramid_scale}")
+        if expected_cards is not None and expected_cards < 1:
+            raise ValueError(f"expected_cards must be at least 1, got {expected_cards}")
+        unknown_stages = set(cascade_thresholds or {}) - {'gray', 'histogram'}
+        if unknown_stages:
+            raise ValueError(f"Unknown cascade stages {sorted(unknown_stages)}, expected 'gray' or 'histogram'")
+            
         self.memoria_dir = Path(memoria_dir)
         self.screenshots_dir = Path(screenshots_dir)
         self.threshold = threshold
+        self.memoria_thresholds = memoria_thresholds or {}
         self.custom_scores = custom_scores or {}
+        self.search_mode = search_mode
+        self.pyramid_scale = pyramid_scale
+        self.template_bank = template_bank
+        self._shared_bank = None
+        self.detection_cache = detection_cache
+        self.results_store = results_store
+        self.frame_index = frame_index
+        self.slot_layout_file = slot_layout_file
+        self.template_cache = template_cache
+        self.expected_cards = expected_cards
+        self.multi_instance = multi_instance
+        self.cascade_thresholds = {'gray': threshold - CASCADE_GRAY_MARGIN, 'histogram': 0.0}
+        self.cascade_thresholds.update(cascade_thresholds or {})
+        self.cascade_stats = dict.fromkeys(CASCADE_STATS, 0)
+        self.search_regions = search_regions or {}
         self.memorias = self._load_memorias()
+        self.template_hashes = {name: data['hash'] for name, data in self.memorias.items()}
+        # Perceptual-hash index over the bank: nominates the templates closest to a region
+        self.memoria_index = MemoriaIndex({name: data['image'] for name, data in self.memorias.items()},
+                                          [data['dhash'] for data in self.memorias.values()])
+        self._fft_engine = None
+        if self.search_mode == 'fft':
+            self._fft_engine = FFTCorrelationEngine({name: data['image'] for name, data in self.memorias.items()})
+        self._slot_classifier = None
+        if self.search_mode == 'slots':
+            self._slot_classifier = SlotClassifier({name: data['image'] for name, data in self.memorias.items()},
+                                                   load_slot_layouts(slot_layout_file), self.memoria_index)
+        self.template_priority = self._template_priority(template_priority)
+        self.config_hash = self._config_fingerprint()
+        self.failed_screenshots = []
+        # Optional MatchProfiler, attached with profile()
+        self.profiler = None
+        
+    def _worker_kwargs(self):
+        """Constructor arguments needed to rebuild this matcher inside a worker process."""
+        return {
+            'memoria_dir': str(self.memoria_dir),
+            'screenshots_dir': str(self.screenshots_dir),
+            'threshold': self.threshold,
+            'memoria_thresholds': self.memoria_thresholds,
+            'custom_scores': self.custom_scores,
+            'search_mode': self.search_mode,
+            'pyramid_scale': self.pyramid_scale,
+            'slot_layout_file': self.slot_layout_file,
+            'expected_cards': self.expected_cards,
+            'template_priority': self.template_priority,
+            'multi_instance': self.multi_instance,
+            'cascade_thresholds': self.cascade_thresholds,
+            'search_regions': self.search_regions
+        }
+        
+    def _config_fingerprint(self):
+        """
+        Digest of every setting that changes which detections a screenshot gets.
+        
+        Stored with each cached frame, so detections recorded under other settings are never
+        reused. template_priority only changes the search order and is left out; it follows
+        the hit counts of the results store and would otherwise invalidate the cache every run.
+        """
+        config = {
+            'threshold': self.threshold,
+            'memoria_thresholds': self.memoria_thresholds,
+            'search_mode': self.search_mode,
+            'multi_instance': self.multi_instance,
+            'expected_cards': self.expected_cards,
+            'search_regions': {f"{w}x{h}": regions for (w, h), regions in self.search_regions.items()}
+        }
+        if self.search_mode == 'pyramid':
+            config['pyramid_scale'] = self.pyramid_scale
+        if self.search_mode == 'cascade':
+            config['cascade_thresholds'] = self.cascade_thresholds
+        if self.search_mode == 'slots':
+            config['slot_layouts'] = {f"{w}x{h}": slots for (w, h), slots in self._slot_classifier.layouts.items()}
+        return content_hash(json.dumps(config, sort_keys=True).encode())
+        
+    def memoria_threshold(self, memoria_name):
+        """Confidence a match of this memoria needs: its calibrated threshold, else the global one."""
+        return self.memoria_thresholds.get(memoria_name, self.threshold)
+        
+    def _template_priority(self, template_priority=None):
+        """Memoria names in the order the expected_cards search tries them, most likely first."""
+        if template_priority is not None:
+            known = [name for name in template_priority if name in self.memorias]
+            return known + [name for name in self.memorias if name not in set(known)]
+            
+        hit_counts = self.results_store.memoria_counts() if self.results_store is not None else {}
+        return sorted(self.memorias, key=lambda name: (hit_counts.get(name, 0), self.custom_scores.get(name, 0)),
+                      reverse=True)
+        
+    @contextmanager
+    def profile(self, profiler=None):
+        """
+        Time every matching stage while the block runs.
+        
+        Args:
+            profiler: Optional MatchProfiler to keep accumulating into (default: a new one)
+            
+        Yields:
+            The attached MatchProfiler; print_summary() or save() it after the block
+        """
+        profiler = profiler or MatchProfiler()
+        previous, self.profiler = self.profiler, profiler
+        try:
+            yield profiler
+        finally:
+            self.profiler = previous
+            profiler.stop()
         
     def _load_memorias(self):
-        """Load all memoria template images from the memoria directory."""
+        """Load all memoria template images from the memoria directory (or the shared template bank)."""
         memorias = {}
         
+        if self.template_bank is not None:
+            # Keep the attached block alive for as long as the read-only views are in use
+            self._shared_bank = SharedTemplateBank.attach(self.template_bank)
+            for name, entry in self._shared_bank.entries().items():
+                # The owner's preprocessed fields are reused, not computed again per worker
+                memorias[name] = self._memoria_entry(name, entry['image'], entry['path'], entry)
+            return memorias
+        
         if not self.memoria_dir.exists():
             print(f"Warning: Memoria directory {self.memoria_dir} does not exist")
             return memorias
             
+        if self.template_cache is not None:
+            return self.template_cache.load_memorias(self.memoria_dir, self._memoria_entry)
+            
         for img_path in self.memoria_dir.glob('*.png'):
             try:
                 img = cv2.imread(str(img_path))
                 if img is not None:
-                    memorias[img_path.stem] = {
-                        'image': img,
-                        'path': str(img_path),
-                        'custom_score': self.custom_scores.get(img_path.stem, 0)  # Default to 0 if not specified
-                    }
+                    memorias[img_path.stem] = self._memoria_entry(img_path.stem, img, str(img_path))
             except Exception as e:
                 print(f"Error loading memoria {img_path}: {e}")
                 
         return memorias
         
-    def match_screenshot(self, screenshot_path, scoring_criteria=None):
+    def _memoria_entry(self, name, img, path, cached=None):
         """
-        Match memorias against a single screenshot.
+        Build the per-template record used during matching.
         
         Args:
-            screenshot_path: Path to the screenshot image
-            scoring_criteria: Dictionary of criteria for scoring matches
-                              (e.g. {'position_weight': 0.3, 'size_weight': 0.2, 'color_weight': 0.5})
-                              
+            name: Memoria name
+            img: Decoded template image
+            path: Template file path
+            cached: Optional entry built earlier from the same file (see TemplateCache); its
+                    precomputed fields are reused
+        """
+        cached = cached or {}
+        entry = {
+            'image': img,
+            'path': path,
+            'hash': cached['hash'] if 'hash' in cached else template_hash(img)
+        }
+        # Histograms are compared against every match of this template, so compute them once
+        entry['histogram'] = cached['histogram'] if 'histogram' in cached else self._color_histogram(img)
+        entry['gray'] = cached['gray'] if 'gray' in cached else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        entry['dhash'] = cached['dhash'] if 'dhash' in cached else dhash(img)
+        
+        # The coarse level depends on pyramid_scale; keep a cached one of the same scale in any mode
+        if 'coarse' in cached and cached.get('coarse_scale') == self.pyramid_scale:
+            entry['coarse'] = cached['coarse']
+            entry['coarse_scale'] = cached['coarse_scale']
+        elif self.search_mode == 'pyramid':
+            entry['coarse'] = self._downscale_gray(img)
+            entry['coarse_scale'] = self.pyramid_scale
+        return entry
+        
+    def _downscale_gray(self, img):
+        """Convert an image to grayscale and shrink it to the coarse pyramid level."""
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if self.pyramid_scale == 1:
+            return gray
+        return cv2.resize(gray, None, fx=self.pyramid_scale, fy=self.pyramid_scale, interpolation=cv2.INTER_AREA)
+        
+    def _find_best_matches(self, screenshot, memoria_names=None):
+        """
+        Locate the best match of every memoria in a screenshot using the configured search mode.
+        
+        Args:
+            screenshot: The screenshot image
+            memoria_names: Optional subset of memorias to search for (default: all)
+        
         Returns:
-            List of dictionaries containing match information
-        """
-        # Default scoring criteria if none provided
-        if scoring_criteria is None:
-            scoring_criteria = {
-                'match_confidence_weight': 0.7,
-                'position_weight': 0.1,
-                'size_weight': 0.1,
-                'color_similarity_weight': 0.1
-            }
+            Dictionary mapping memoria names to (confidence, top_left) tuples
+        """
+        if memoria_names is None:
+            memoria_names = list(self.memorias)
             
-        # Extract email from screenshot filename
-        screenshot_name = Path(screenshot_path).name
-        email = self._extract_email_from_filename(screenshot_name)
-        
-        # Load screenshot
-        screenshot = cv2.imread(str(screenshot_path))
-        if screenshot is None:
-            print(f"Error: Could not load screenshot {screenshot_path}")
-            return []
+        if self._fft_engine is not None and not self.expected_cards:
+            return self._fft_engine.best_matches(screenshot, memoria_names, self.profiler)
             
-        matches = []
-        
-        # Process each memoria template
-        for memoria_name, memoria_data in self.memorias.items():
-            memoria_img = memoria_data['image']
+        if self._slot_classifier is not None:
+            started = time.perf_counter()
+            matches = self._slot_classifier.best_matches(screenshot, memoria_names)
+            if matches is not None:
+                if self.profiler is not None:
+                    self.profiler.lap('slot_search', started)
+                return matches
             
-            # Use template matching to find the memoria in the screenshot
-            result = cv2.matchTemplate(screenshot, memoria_img, cv2.TM_CCOEFF_NORMED)
+        # The coarse level is shared by every template, so build it once per screenshot
+        coarse_screenshot = None
+        if self.search_mode == 'pyramid':
+            started = time.perf_counter()
+            coarse_screenshot = self._downscale_gray(screenshot)
+            if self.profiler is not None:
+                self.profiler.lap('pyramid_coarse', started)
+                
+        # Likewise the grayscale copy the cascade's first stage correlates against
+        gray_screenshot = None
+        if self.search_mode == 'cascade':
+            gray_screenshot = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
             
-            # Get the best match location and confidence
-            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+        if self.expected_cards:
+            return self._budgeted_best_matches(screenshot, memoria_names, coarse_screenshot, gray_screenshot)
+            
+        if self.profiler is not None:
+            return self._profiled_best_matches(screenshot, memoria_names, coarse_screenshot, gray_screenshot)
             
-            # If match confidence exceeds threshold, calculate score
-            if max_val >= self.threshold:
-                # Get the position of the match
-                top_left = max_loc
-                h, w = memoria_img.shape[:2]
-                bottom_right = (top_left[0] + w, top_left[1] + h)
+        return {
+            memoria_name: self._search_memoria(screenshot, memoria_name, coarse_screenshot,
+                                               gray_screenshot=gray_screenshot)
+            for memoria_name in memoria_names
+        }
+        
+    def _profiled_best_matches(self, screenshot, memoria_names, coarse_screenshot=None, gray_screenshot=None):
+        """_find_best_matches with every template search timed by the attached profiler."""
+        profiler = self.profiler
+        matches = {}
+        for memoria_name in memoria_names:
+            memoria_data = self.memorias[memoria_name]
+            started = time.perf_counter()
+            if self._search_region(screenshot, memoria_name) is not None:
+                matches[memoria_name] = self._search_memoria(screenshot, memoria_name, coarse_screenshot,
+                                                             gray_screenshot=gray_screenshot)
+                profiler.lap('region_search', started, memoria_name)
+                continue
+            if coarse_screenshot is not None or gray_screenshot is not None:
+                matches[memoria_name] = self._find_best_match(screenshot, memoria_data, coarse_screenshot,
+                                                              gray_screenshot=gray_screenshot,
+                                                              threshold=self.memoria_threshold(memoria_name))
+                stage = 'pyramid_search' if coarse_screenshot is not None else 'cascade_search'
+                profiler.lap(stage, started, memoria_name)
+                continue
                 
-                # Calculate position score (center of screen is better)
-                center_x, center_y = screenshot.shape[1] / 2, screenshot.shape[0] / 2
-                match_center_x = top_left[0] + w / 2
-                match_center_y = top_left[1] + h / 2
+            result = cv2.matchTemplate(screenshot, memoria_data['image'], cv2.TM_CCOEFF_NORMED)
+            started = profiler.lap('match_template', started, memoria_name)
+            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+            profiler.lap('min_max_loc', started, memoria_name)
+            matches[memoria_name] = (max_val, max_loc)
+        return matches
+        
+    def _budgeted_best_matches(self, screenshot, memoria_names, coarse_screenshot=None, gray_screenshot=None):
+        """
+        expected_cards search: try templates in priority order, let every match claim its card
+        and stop once expected_cards cards are claimed.
+        
+        Returns:
+            Dictionary mapping the memorias that were searched to (confidence, top_left) tuples
+        """
+        profiler = self.profiler
+        wanted = set(memoria_names)
+        frame = self._fft_engine.prepare(screenshot) if self._fft_engine is not None else None
+        claimed = []
+        matches = {}
+        for memoria_name in self.template_priority:
+            if len(claimed) >= self.expected_cards:
+                break
+            if memoria_name not in wanted:
+                continue
                 
-                # Normalized distance from center (0 = center, 1 = corner)
-                max_distance = np.sqrt((center_x**2) + (center_y**2))
-                distance = np.sqrt((center_x - match_center_x)**2 + (center_y - match_center_y)**2)
-                position_score = 1 - (distance / max_distance)
+            started = time.perf_counter()
+            memoria_data = self.memorias[memoria_name]
+            h, w = memoria_data['image'].shape[:2]
+            if frame is not None:
+                result = self._fft_engine.correlate(frame, memoria_name)
+                if result is None:
+                    continue
+                _suppress_claimed(result, claimed, w, h)
+                min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+            else:
+                max_val, max_loc = self._search_memoria(screenshot, memoria_name, coarse_screenshot, claimed,
+                                                        gray_screenshot)
+            if profiler is not None:
+                profiler.lap('budgeted_search', started, memoria_name)
                 
-                # Calculate size score (larger is better, up to a point)
-                size_ratio = (w * h) / (screenshot.shape[1] * screenshot.shape[0])
-                size_score = min(size_ratio * 10, 1.0)  # Cap at 1.0
+            matches[memoria_name] = (max_val, max_loc)
+            if max_val >= self.memoria_threshold(memoria_name):
+                claimed.append((max_loc[0], max_loc[1], w, h))
                 
-                # Calculate color similarity
-                match_region = screenshot[top_left[1]:bottom_right[1], top_left[0]:bottom_right[0]]
-                color_similarity = self._calculate_color_similarity(match_region, memoria_img)
+        if profiler is not None:
+            profiler.count('templates_skipped', len(wanted) - len(matches))
+        return matches
+        
+    def _find_all_matches(self, screenshot, memoria_names):
+        """
+        Every match of the given memorias above the threshold (multi_instance mode).
+        
+        With expected_cards, templates are searched in priority order, every match claims its
+        card and the search stops once enough cards are claimed, as in _budgeted_best_matches.
+        
+        Returns:
+            Tuple of the list of (memoria_name, confidence, top_left) tuples, strongest first,
+            with overlapping matches resolved to the strongest, and the list of memorias that
+            were searched
+        """
+        if self._slot_classifier is not None:
+            slot_matches = self._slot_classifier.slot_matches(screenshot, memoria_names)
+            if slot_matches is not None:
+                return self._suppress_overlaps([match for match in slot_matches
+                                                if match[1] >= self.memoria_threshold(match[0])]), memoria_names
                 
-                # Calculate final score based on weights
-                match_quality_score = (
-                    max_val * scoring_criteria.get('match_confidence_weight', 0.7) +
-                    position_score * scoring_criteria.get('position_weight', 0.1) +
-                    size_score * scoring_criteria.get('size_weight', 0.1) +
-                    color_similarity * scoring_criteria.get('color_similarity_weight', 0.1)
-                )
+        names = memoria_names
+        claimed = None
+        if self.expected_cards:
+            wanted = set(memoria_names)
+            names = [name for name in self.template_priority if name in wanted]
+            claimed = []
+            
+        coarse_screenshot = self._downscale_gray(screenshot) if self.search_mode == 'pyramid' else None
+        gray_screenshot = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY) if self.search_mode == 'cascade' else None
+        frame = self._fft_engine.prepare(screenshot) if self._fft_engine is not None else None
+        profiler = self.profiler
+        found = []
+        searched = []
+        for memoria_name in names:
+            if claimed is not None and len(claimed) >= self.expected_cards:
+                break
                 
-                # Create match record
-                match = {
-                    'memoria_name': memoria_name,
-                    'memoria_path': memoria_data['path'],
-                    'confidence': max_val,
-                    'position': top_left,
-                    'size': (w, h),
-                    'position_score': position_score,
-                    'size_score': size_score,
-                    'color_similarity': color_similarity,
-                    'match_quality_score': match_quality_score,
-                    'custom_score': memoria_data['custom_score'],  # Use the custom score from memoria data
-                    'final_score': memoria_data['custom_score']  # Add final_score for backward compatibility
-                }
+            started = time.perf_counter()
+            peaks = self._template_peaks(screenshot, memoria_name, frame, coarse_screenshot, claimed, gray_screenshot)
+            if profiler is not None:
+                profiler.lap('peak_search', started, memoria_name)
+            searched.append(memoria_name)
+            
+            found.extend((memoria_name, val, loc) for val, loc in peaks)
+            if claimed is not None:
+                h, w = self.memorias[memoria_name]['image'].shape[:2]
+                claimed.extend((x, y, w, h) for _, (x, y) in peaks)
+                
+        if profiler is not None and claimed is not None:
+            profiler.count('templates_skipped', len(names) - len(searched))
+        return self._suppress_overlaps(found), searched
+        
+    def _template_peaks(self, screenshot, memoria_name, frame=None, coarse_screenshot=None, claimed=None,
+                        gray_screenshot=None):
+        """All peaks of one memoria above its threshold, as (confidence, top_left) tuples."""
+        memoria_data = self.memorias[memoria_name]
+        threshold = self.memoria_threshold(memoria_name)
+        h, w = memoria_data['image'].shape[:2]
+        if gray_screenshot is not None:
+            return self._cascade_peaks(screenshot, gray_screenshot, memoria_data, claimed, CASCADE_MAX_PEAKS, threshold)
+        if frame is not None:
+            result = self._fft_engine.correlate(frame, memoria_name)
+            if result is None:
+                return []
+        else:
+            if coarse_screenshot is not None:
+                peaks = self._pyramid_peaks(screenshot, coarse_screenshot, memoria_data, claimed, threshold)
+                if peaks is not None:
+                    return peaks
+            result = cv2.matchTemplate(screenshot, memoria_data['image'], cv2.TM_CCOEFF_NORMED)
+            
+        if claimed:
+            _suppress_claimed(result, claimed, w, h)
+        return find_peaks(result, threshold, w, h)
+        
+    def _pyramid_peaks(self, screenshot, coarse_screenshot, memoria_data, claimed=None, threshold=None):
+        """
+        Multi-instance coarse-to-fine search: verify every coarse-level peak at full resolution.
+        
+        Returns:
+            List of (confidence, top_left) tuples, or None if the template is too small (or too
+            large) for the coarse level
+        """
+        threshold = self.threshold if threshold is None else threshold
+        coarse_template = memoria_data['coarse']
+        th, tw = coarse_template.shape[:2]
+        if min(th, tw) < PYRAMID_MIN_TEMPLATE_SIDE or th > coarse_screenshot.shape[0] or tw > coarse_screenshot.shape[1]:
+            return None
+            
+        coarse_result = cv2.matchTemplate(coarse_screenshot, coarse_template, cv2.TM_CCOEFF_NORMED)
+        if claimed:
+            scale = self.pyramid_scale
+            _suppress_claimed(coarse_result, [tuple(v * scale for v in box) for box in claimed], tw, th)
+            
+        peaks = []
+        coarse_peaks = find_peaks(coarse_result, threshold - PYRAMID_THRESHOLD_MARGIN, tw, th, PYRAMID_MAX_PEAKS)
+        for _, coarse_loc in coarse_peaks:
+            val, loc = self._verify_candidate(screenshot, memoria_data['image'], coarse_loc)
+            if val >= threshold:
+                peaks.append((val, loc))
+        return peaks
+        
+    def _suppress_overlaps(self, matches):
+        """Resolve overlapping (memoria_name, confidence, top_left) matches to the strongest one."""
+        if not matches:
+            return []
+        boxes = [(*top_left, *self.memorias[name]['image'].shape[1::-1]) for name, _, top_left in matches]
+        keep = non_max_suppression(boxes, [confidence for _, confidence, _ in matches])
+        return [matches[i] for i in keep]
+        
+    def _search_memoria(self, screenshot, memoria_name, coarse_screenshot=None, claimed=None, gray_screenshot=None):
+        """
+        Best match of one memoria, searched inside its search region first when it has one for
+        the screenshot's size.
+        
+        The full frame is searched when there is no region, the region is smaller than the
+        template once clipped to the frame, or nothing in it reaches the memoria's threshold.
+        
+        Returns:
+            Tuple of (confidence, top_left) in full-resolution screenshot coordinates
+        """
+        memoria_data = self.memorias[memoria_name]
+        threshold = self.memoria_threshold(memoria_name)
+        region = self._search_region(screenshot, memoria_name)
+        if region is not None:
+            match = self._find_best_match_in_region(screenshot, memoria_data, region, coarse_screenshot is not None,
+                                                    claimed, gray_screenshot, threshold)
+            if match is not None and match[0] >= threshold:
+                return match
+            if self.profiler is not None:
+                self.profiler.count('region_fallbacks')
                 
-                matches.append(match)
+        return self._find_best_match(screenshot, memoria_data, coarse_screenshot, claimed, gray_screenshot, threshold)
         
-        # Sort matches by custom_score (highest first), then by match_quality_score as a tiebreaker
-        matches.sort(key=lambda x: (x['custom_score'], x['match_quality_score']), reverse=True)
+    def _search_region(self, screenshot, memoria_name):
+        """The memoria's (x, y, w, h) search region for the screenshot's size, or None."""
+        regions = self.search_regions.get((screenshot.shape[1], screenshot.shape[0]))
+        return regions.get(memoria_name) if regions is not None else None
         
+    def _find_best_match_in_region(self, screenshot, memoria_data, region, pyramid=False, claimed=None,
+                                   gray_screenshot=None, threshold=None):
+        """
+        _find_best_match confined to an (x, y, w, h) region of the screenshot.
+        
+        Returns:
+            Tuple of (confidence, top_left) in full-frame coordinates, or None if the region
+            (clipped to the frame) is smaller than the template
+        """
+        h, w = memoria_data['image'].shape[:2]
+        x, y, region_w, region_h = region
+        x0, y0 = max(0, x), max(0, y)
+        x1 = min(screenshot.shape[1], x + region_w)
+        y1 = min(screenshot.shape[0], y + region_h)
+        if x1 - x0 < w or y1 - y0 < h:
+            return None
+            
+        roi = screenshot[y0:y1, x0:x1]
+        coarse_roi = self._downscale_gray(roi) if pyramid else None
+        gray_roi = gray_screenshot[y0:y1, x0:x1] if gray_screenshot is not None else None
+        if claimed:
+            claimed = [(cx - x0, cy - y0, cw, ch) for cx, cy, cw, ch in claimed]
+        max_val, (mx, my) = self._find_best_match(roi, memoria_data, coarse_roi, claimed, gray_roi, threshold)
+        return max_val, (x0 + mx, y0 + my)
+        
+    def _find_best_match(self, screenshot, memoria_data, coarse_screenshot=None, claimed=None, gray_screenshot=None,
+                         threshold=None):
+        """
+        Locate the best match of a memoria in a screenshot.
+        
+        Args:
+            claimed: Optional list of (x, y, w, h) cards the match may not be centered on
+            gray_screenshot: Grayscale screenshot, given in 'cascade' mode
+            threshold: The memoria's confidence threshold (default: the global one); the pyramid
+                       and cascade prefilters are relaxed relative to it
+        
+        Returns:
+            Tuple of (confidence, top_left) in full-resolution screenshot coordinates
+        """
+        if gray_screenshot is not None:
+            peaks = self._cascade_peaks(screenshot, gray_screenshot, memoria_data, claimed, CASCADE_MAX_CANDIDATES,
+                                        threshold)
+            return max(peaks, default=(-1.0, (0, 0)))
+            
+        if coarse_screenshot is not None:
+            return self._pyramid_match(screenshot, coarse_screenshot, memoria_data, claimed, threshold)
+            
+        result = cv2.matchTemplate(screenshot, memoria_data['image'], cv2.TM_CCOEFF_NORMED)
+        if claimed:
+            h, w = memoria_data['image'].shape[:2]
+            _suppress_claimed(result, claimed, w, h)
+        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+        return max_val, max_loc
+        
+    def _pyramid_match(self, screenshot, coarse_screenshot, memoria_data, claimed=None, threshold=None):
+        """
+        Coarse-to-fine search: correlate the grayscale template on the coarse level, then
+        re-run the exact color TM_CCOEFF_NORMED in a small window around each candidate peak.
+        """
+        coarse_template = memoria_data['coarse']
+        th, tw = coarse_template.shape[:2]
+        
+        # Templates that collapse to a few pixels carry no signal at the coarse level
+        if min(th, tw) < PYRAMID_MIN_TEMPLATE_SIDE or th > coarse_screenshot.shape[0] or tw > coarse_screenshot.shape[1]:
+            return self._find_best_match(screenshot, memoria_data, claimed=claimed)
+            
+        coarse_result = cv2.matchTemplate(coarse_screenshot, coarse_template, cv2.TM_CCOEFF_NORMED)
+        if claimed:
+            scale = self.pyramid_scale
+            _suppress_claimed(coarse_result, [tuple(v * scale for v in box) for box in claimed], tw, th)
+        coarse_threshold = (self.threshold if threshold is None else threshold) - PYRAMID_THRESHOLD_MARGIN
+        
+        best_val, best_loc = -1.0, (0, 0)
+        for _ in range(PYRAMID_MAX_CANDIDATES):
+            min_val, coarse_val, min_loc, coarse_loc = cv2.minMaxLoc(coarse_result)
+            if coarse_val < coarse_threshold:
+                break
+                
+            val, loc = self._verify_candidate(screenshot, memoria_data['image'], coarse_loc)
+            if val > best_val:
+                best_val, best_loc = val, loc
+                
+            # Suppress this peak so the next iteration finds a different candidate
+            x, y = coarse_loc
+            coarse_result[max(0, y - th // 2):y + th // 2 + 1, max(0, x - tw // 2):x + tw // 2 + 1] = -1
+            
+        return best_val, best_loc
+        
+    def _cascade_peaks(self, screenshot, gray_screenshot, memoria_data, claimed=None, max_peaks=None, threshold=None):
+        """
+        Cascade search of one memoria: nominate locations on the grayscale correlation map at the
+        relaxed 'gray' threshold, then confirm each with the exact color TM_CCOEFF_NORMED.
+        
+        Returns:
+            List of (confidence, top_left) tuples of the nominees whose color confidence reaches
+            the threshold, strongest first
+        """
+        threshold = self.threshold if threshold is None else threshold
+        gray_template = memoria_data['gray']
+        h, w = gray_template.shape[:2]
+        result = cv2.matchTemplate(gray_screenshot, gray_template, cv2.TM_CCOEFF_NORMED)
+        if claimed:
+            _suppress_claimed(result, claimed, w, h)
+        # The gray stage stays as far below a calibrated threshold as it is below the global one
+        gray_threshold = self.cascade_thresholds['gray'] + threshold - self.threshold
+        nominated = find_peaks(result, gray_threshold, w, h, max_peaks)
+        
+        confirmed = []
+        for _, (x, y) in nominated:
+            val, loc = self._verify_window(screenshot, memoria_data['image'], x, y, CASCADE_VERIFY_RADIUS)
+            if val >= threshold:
+                confirmed.append((val, loc))
+                
+        stats = self.cascade_stats
+        stats['templates'] += 1
+        stats['templates_without_candidates'] += not nominated
+        stats['nominated'] += len(nominated)
+        stats['color_rejected'] += len(nominated) - len(confirmed)
+        return sorted(confirmed, reverse=True)
+        
+    def _verify_candidate(self, screenshot, memoria_img, coarse_loc):
+        """Run the full-resolution color match in a window around a coarse-level peak."""
+        radius = int(np.ceil(1 / self.pyramid_scale)) + 1
+        x = int(round(coarse_loc[0] / self.pyramid_scale))
+        y = int(round(coarse_loc[1] / self.pyramid_scale))
+        return self._verify_window(screenshot, memoria_img, x, y, radius)
+        
+    def _verify_window(self, screenshot, memoria_img, x, y, radius):
+        """Best full-resolution color match with its top-left within radius pixels of (x, y)."""
+        h, w = memoria_img.shape[:2]
+        x0 = max(0, x - radius)
+        y0 = max(0, y - radius)
+        x1 = min(screenshot.shape[1], x + radius + w)
+        y1 = min(screenshot.shape[0], y + radius + h)
+        if x1 - x0 < w or y1 - y0 < h:
+            return -1.0, (x0, y0)
+            
+        result = cv2.matchTemplate(screenshot[y0:y1, x0:x1], memoria_img, cv2.TM_CCOEFF_NORMED)
+        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+        return max_val, (x0 + max_loc[0], y0 + max_loc[1])
+        
+    def match_screenshot(self, screenshot_path, scoring_criteria=None, screenshot=None):
+        """
+        Match memorias against a single screenshot.
+        
+        Args:
+            screenshot_path: Path to the screenshot image
+            scoring_criteria: Dictionary of criteria for scoring matches
+                              (e.g. {'position_weight': 0.3, 'size_weight': 0.2, 'color_weight': 0.5})
+            screenshot: Optional BGR frame already in memory (e.g. from
+                        screenshot_windows.capture_window_array); the file is then not read
+                              
+        Returns:
+            Dictionary with the email, screenshot path, list of matches and timestamp,
+            or None if the screenshot could not be loaded
+        """
+        record = self.detect_screenshot(screenshot_path, screenshot=screenshot)
+        if record is None:
+            return None
+        return build_match_result(record, self.custom_scores, scoring_criteria)
+    
+    def template_scores(self, screenshot_path, memoria_names=None):
+        """
+        Best-match confidence of every memoria in a screenshot, without any threshold.
+        
+        Args:
+            screenshot_path: Path to the screenshot image
+            memoria_names: Optional subset of memorias to score (default: the whole bank)
+            
+        Returns:
+            Dictionary mapping memoria names to confidences, or None if the screenshot could
+            not be loaded
+        """
+        screenshot = cv2.imread(str(screenshot_path))
+        if screenshot is None:
+            print(f"Error: Could not load screenshot {screenshot_path}")
+            return None
+        best_matches = self._find_best_matches(screenshot, memoria_names)
+        return {memoria_name: max_val for memoria_name, (max_val, max_loc) in best_matches.items()}
+        
+    def detect_screenshot(self, screenshot_path, memoria_names=None, data=None, screenshot=None):
+        """
+        Collect the raw (unscored) detections of every memoria in a single screenshot.
+        
+        Args:
+            screenshot_path: Path to the screenshot image
+            memoria_names: Optional subset of memorias to match (default: the whole bank)
+            data: Optional raw bytes of the screenshot file, already read (e.g. by a
+                  ScreenshotPrefetcher); the file is not read again
+            screenshot: Optional decoded screenshot matching data; it is not decoded again. Given
+                        without data (a frame captured in memory), the file is not read at all
+                        and the record's content hash is None until the caller sets it.
+            
+        Returns:
+            Dictionary with the email, screenshot path, content hash, the hashes of the templates
+            matched, the hashes of the templates skipped (an expected_cards search that stopped
+            early), the matcher config fingerprint, frame size (width, height), detections and
+            timestamp, or None if the screenshot could not be loaded
+        """
+        if memoria_names is None:
+            memoria_names = list(self.memorias)
+            
+        # Extract email from screenshot filename
+        screenshot_name = Path(screenshot_path).name
+        email = self._extract_email_from_filename(screenshot_name)
+        
+        profiler = self.profiler
+        started = time.perf_counter()
+        
+        # Load screenshot; the raw bytes double as the cache key
+        if data is None and screenshot is None:
+            try:
+                with open(screenshot_path, 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                print(f"Error: Could not read screenshot {screenshot_path}: {e}")
+                return None
+            if profiler is not None:
+                started = profiler.lap('read', started)
+                
+        if screenshot is None:
+            screenshot = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if screenshot is None:
+                print(f"Error: Could not load screenshot {screenshot_path}")
+                return None
+            if profiler is not None:
+                profiler.lap('decode', started)
+        else:
+            # Captured frames can be strided views (BGR over BGRX); pack them once rather than
+            # letting every OpenCV call copy them again
+            screenshot = np.ascontiguousarray(screenshot)
+            
+        if self.multi_instance:
+            candidates, searched = self._find_all_matches(screenshot, memoria_names)
+        else:
+            # Find the best match location and confidence of each memoria template
+            best_matches = self._find_best_matches(screenshot, memoria_names)
+            searched = best_matches
+            
+            # Keep the memorias that exceed their threshold
+            candidates = [
+                (memoria_name, max_val, max_loc)
+                for memoria_name, (max_val, max_loc) in best_matches.items()
+                if max_val >= self.memoria_threshold(memoria_name)
+            ]
+        
+        started = time.perf_counter()
+        detections = self._measure_candidates(screenshot, candidates)
+        if self.search_mode == 'cascade':
+            detections = self._histogram_stage(detections)
+        if profiler is not None:
+            started = profiler.lap('histogram', started)
+        frame_hash = content_hash(data) if data is not None else None
+        if profiler is not None:
+            profiler.lap('hash', started)
+            
         return {
             'email': email,
             'screenshot_path': str(screenshot_path),
-            'matches': matches,
+            'content_hash': frame_hash,
+            'templates': {name: self.template_hashes[name] for name in memoria_names if name in searched},
+            'skipped': {name: self.template_hashes[name] for name in memoria_names if name not in searched},
+            'config': self.config_hash,
+            'frame_size': (screenshot.shape[1], screenshot.shape[0]),
+            'detections': detections,
             'timestamp': datetime.now().isoformat()
         }
     
+    def _measure_candidates(self, screenshot, candidates):
+        """
+        Turn candidate matches into raw detections, adding the color similarity of each matched
+        region against the precomputed template histogram.
+        
+        Args:
+            screenshot: The screenshot image
+            candidates: List of (memoria_name, confidence, top_left) tuples
+            
+        Returns:
+            List of raw detection dictionaries
+        """
+        if not candidates:
+            return []
+            
+        sizes = [self.memorias[name]['image'].shape[1::-1] for name, _, _ in candidates]
+        region_histograms = np.stack([
+            self._color_histogram(screenshot[y:y + h, x:x + w])
+            for (_, _, (x, y)), (w, h) in zip(candidates, sizes)
+        ])
+        template_histograms = np.stack([self.memorias[name]['histogram'] for name, _, _ in candidates])
+        color_similarity = np.fmax(0, _histogram_correlation(region_histograms, template_histograms))
+        
+        return [
+            {
+                'memoria_name': name,
+                'memoria_path': self.memorias[name]['path'],
+                'confidence': float(max_val),
+                'position': (int(top_left[0]), int(top_left[1])),
+                'size': (int(w), int(h)),
+                'color_similarity': float(similarity)
+            }
+            for (name, max_val, top_left), (w, h), similarity in zip(candidates, sizes, color_similarity)
+        ]
+    
+    def _histogram_stage(self, detections):
+        """Last cascade stage: drop color-confirmed matches below the 'histogram' color similarity."""
+        accepted = [d for d in detections if d['color_similarity'] >= self.cascade_thresholds['histogram']]
+        self.cascade_stats['histogram_rejected'] += len(detections) - len(accepted)
+        self.cascade_stats['accepted'] += len(accepted)
+        return accepted
+        
+    def cascade_report(self):
+        """
+        Print how many candidates each cascade stage rejected since the matcher was created.
+        
+        Screenshots matched by pool workers (workers > 1) are counted in the workers, not here.
+        
+        Returns:
+            Dictionary of the cascade counters
+        """
+        stats = dict(self.cascade_stats)
+        print(f"Cascade over {stats['templates']} template searches "
+              f"(gray >= {self.cascade_thresholds['gray']:.2f}, color >= {self.threshold:.2f}, "
+              f"histogram >= {self.cascade_thresholds['histogram']:.2f}):")
+        print(f"  gray stage: {stats['templates_without_candidates']} searches without any candidate, "
+              f"{stats['nominated']} locations nominated")
+        print(f"  color stage: {stats['color_rejected']} rejected")
+        print(f"  histogram stage: {stats['histogram_rejected']} rejected, {stats['accepted']} accepted")
+        return stats
+        
+    def _color_histogram(self, img):
+        """8x8x8 BGR histogram, min-max normalized and flattened (as compared by _calculate_color_similarity)."""
+        hist = cv2.calcHist([img], [0, 1, 2], None, [8, 8, 8], [0, 256, 0, 256, 0, 256])
+        cv2.normalize(hist, hist, 0, 1, cv2.NORM_MINMAX)
+        return hist.ravel().astype(np.float64)
+    
     def _calculate_color_similarity(self, region1, region2):
         """Calculate color similarity between two image regions."""
         # Resize region2 to match region1 if needed
         if region1.shape != region2.shape:
             region2 = cv2.resize(region2, (region1.shape[1], region1.shape[0]))
             
-        # Calculate histogram for both regions
-        hist1 = cv2.calcHist([region1], [0, 1, 2], None, [8, 8, 8], [0, 256, 0, 256, 0, 256])
-        hist2 = cv2.calcHist([region2], [0, 1, 2], None, [8, 8, 8], [0, 256, 0, 256, 0, 256])
-        
-        # Normalize histograms
-        cv2.normalize(hist1, hist1, 0, 1, cv2.NORM_MINMAX)
-        cv2.normalize(hist2, hist2, 0, 1, cv2.NORM_MINMAX)
-        
-        # Compare histograms
-        similarity = cv2.compareHist(hist1, hist2, cv2.HISTCMP_CORREL)
+        similarity = _histogram_correlation(self._color_histogram(region1), self._color_histogram(region2))
         
         # Return similarity (0 to 1, where 1 is identical)
-        return max(0, similarity)
+        return float(np.fmax(0, similarity))
     
     def _extract_email_from_filename(self, filename):
         """Extract email address from screenshot filename."""
@@ -182,20 +1085,37 @@ class ImageMatcher:
             return email
         return None
     
-    def batch_match_screenshots(self, scoring_criteria=None, email_filter=None, skip_processed=True):
+    def batch_match_screenshots(self, scoring_criteria=None, email_filter=None, skip_processed=True, workers=1,
+                                prefetch_depth=PREFETCH_DEPTH, io_threads=IO_THREADS):
         """
         Match memorias against all screenshots in the screenshots directory.
         
+        With a detection cache, work is tracked per (screenshot, template): new screenshots are
+        matched against the whole bank, and old screenshots only against templates that were
+        added or edited since they were last matched.
+        
         Args:
             scoring_criteria: Dictionary of criteria for scoring matches
             email_filter: Optional filter to only process screenshots with matching email
-            skip_processed: If True, skip screenshots that have already been processed
-                           and have results in match_results.json
+            skip_processed: If True, skip screenshots that have already been processed: those
+                           that have results in the results store (or match_results.json
+                           without a store or cache) and, with a detection cache, were matched
+                           against every current template with the current settings. Both
+                           checks are lookups by path, so processed screenshots are never
+                           read or hashed. If False, every screenshot is matched again from
+                           scratch and the cache is only written to.
+            workers: Number of worker processes. With more than one, screenshots are spread
+                     across a process pool; results are still merged in directory order.
+            prefetch_depth: With a single worker, how many screenshots io_threads read and decode
+                            ahead of the one being matched (0 reads each one only when its turn
+                            comes). Reading stalls while that many frames are waiting.
+            io_threads: Threads reading and decoding screenshots ahead
             
         Returns:
             Dictionary with emails as keys and lists of matches as values
         """
         results = {}
+        self.failed_screenshots = []
         
         if not self.screenshots_dir.exists():
             print(f"Error: Screenshots directory {self.screenshots_dir} does not exist")
@@ -203,7 +1123,13 @@ class ImageMatcher:
         
         # Load existing results if skip_processed is True
         processed_screenshots = set()
-        if skip_processed and os.path.exists('match_results.json'):
+        is_processed = processed_screenshots.__contains__
+        if skip_processed and self.results_store is not None:
+            is_processed = self.results_store.is_processed
+        elif skip_processed and self.detection_cache is not None:
+            # Without a results store the detection cache alone tells what is up to date
+            is_processed = lambda path: True
+        elif skip_processed and self.detection_cache is None and os.path.exists('match_results.json'):
             try:
                 with open('match_results.json', 'r') as f:
                     existing_results = json.load(f)
@@ -218,19 +1144,82 @@ class ImageMatcher:
                 print(f"Error loading existing results: {e}")
                 processed_screenshots = set()
             
-        # Process each screenshot
+        # Work out what each screenshot still needs: (path, cached record, memorias to match)
+        plans = []
         for screenshot_path in self.screenshots_dir.glob('*.png'):
             # Skip if doesn't match email filter
             if email_filter and email_filter not in screenshot_path.name:
                 continue
                 
-            # Skip if already processed
-            if skip_processed and str(screenshot_path) in processed_screenshots:
+            # Skip if already processed, before anything reads or hashes the screenshot
+            if skip_processed and is_processed(str(screenshot_path)) and (
+                    self.detection_cache is None or
+                    self.detection_cache.is_current(screenshot_path, self.template_hashes, self.config_hash)):
                 print(f"Skipping already processed screenshot: {screenshot_path.name}")
                 continue
                 
-            match_result = self.match_screenshot(screenshot_path, scoring_criteria)
+            # A forced re-match never reuses cached detections
+            cached = None
+            if skip_processed and self.detection_cache is not None:
+                cached = self._cached_record(screenshot_path)
+            if cached is None:
+                plans.append((screenshot_path, None, None))
+                continue
+                
+            # Nothing stale means only the results are missing (or the frame is cached under
+            # another name): they are rebuilt from the cached detections
+            memoria_names = stale_templates(cached['templates'], self.template_hashes, cached.get('config'),
+                                            self.config_hash, cached.get('skipped'))
+            if memoria_names and cached.get('skipped'):
+                # The last search stopped early, and a changed template may now claim a card
+                # the skipped ones would have: only a full match repairs that
+                plans.append((screenshot_path, None, None))
+                continue
+            plans.append((screenshot_path, cached, memoria_names))
+            
+        partial = sum(1 for _, cached, memoria_names in plans if cached is not None and memoria_names)
+        if partial:
+            print(f"Matching new or changed templates against {partial} previously matched screenshots")
+            
+        # Only run template matching where there is something left to match
+        records = [cached for _, cached, _ in plans]
+        to_detect = [i for i, (_, cached, memoria_names) in enumerate(plans) if cached is None or memoria_names]
+        duplicate_of = self._duplicate_frames(plans, to_detect)
+        to_detect = [i for i in to_detect if i not in duplicate_of]
+        jobs = [(plans[i][0], plans[i][2]) for i in to_detect]
+        if workers > 1 and len(jobs) > 1:
+            detected = self._match_in_pool(jobs, workers)
+        elif prefetch_depth > 0 and len(jobs) > 1:
+            # Read and decode the next screenshots while this one is matched
+            frames = ScreenshotPrefetcher([path for path, _ in jobs], prefetch_depth, io_threads, self.profiler)
+            detected = (self.detect_screenshot(path, memoria_names, data, screenshot)
+                        for (path, data, screenshot), (_, memoria_names) in zip(frames, jobs))
+        else:
+            detected = (self.detect_screenshot(path, memoria_names) for path, memoria_names in jobs)
+            
+        for i, record in zip(to_detect, detected):
+            cached = plans[i][1]
+            if record is not None and cached is not None:
+                record = self._merge_detections(cached, record)
+            records[i] = record
             
+        for i, (source, frame_hash) in duplicate_of.items():
+            if records[source] is not None:
+                records[i] = self._relabel_record(records[source], plans[i][0], frame_hash)
+                
+        for (screenshot_path, _, _), record in zip(plans, records):
+            if record is None:
+                self.failed_screenshots.append(str(screenshot_path))
+                continue
+                
+            if self.detection_cache is not None:
+                record = self._prune_removed_templates(record)
+                self.detection_cache.store(record)
+                
+            started = time.perf_counter()
+            match_result = build_match_result(record, self.custom_scores, scoring_criteria)
+            if self.profiler is not None:
+                self.profiler.lap('score', started)
             if match_result['email']:
                 email = match_result['email']
                 
@@ -239,10 +1228,247 @@ class ImageMatcher:
                     
                 results[email].append(match_result)
         
+        if self.failed_screenshots:
+            print(f"Failed to match {len(self.failed_screenshots)} screenshots")
+        
         return results
     
+    def _cached_record(self, screenshot_path):
+        """
+        Raw detection record for a screenshot from the detection cache, or None on a miss.
+        
+        Frames matched with other settings (see _config_fingerprint) are misses.
+        """
+        started = time.perf_counter()
+        try:
+            frame_hash = file_content_hash(screenshot_path)
+        except OSError:
+            return None
+        if self.profiler is not None:
+            self.profiler.lap('cache_lookup', started)
+            
+        cached = self.detection_cache.record(str(screenshot_path), self.config_hash)
+        if cached is not None and cached['content_hash'] == frame_hash:
+            return cached
+            
+        # Same pixels saved under another name: reuse that frame's detections
+        frame = self.detection_cache.lookup(frame_hash, self.config_hash)
+        if frame is None and self.frame_index is not None:
+            # Linked at capture to an identical canonical frame: reuse that one's
+            canonical = self.frame_index.canonical(screenshot_path)
+            if canonical is None:
+                return None
+            try:
+                frame_hash = file_content_hash(canonical)
+            except OSError:
+                return None
+            frame = self.detection_cache.lookup(frame_hash, self.config_hash)
+        if frame is None:
+            return None
+            
+        return {
+            'email': self._extract_email_from_filename(Path(screenshot_path).name),
+            'screenshot_path': str(screenshot_path),
+            'content_hash': frame_hash,
+            'templates': frame['templates'],
+            'skipped': frame.get('skipped', {}),
+            'config': frame['config'],
+            'frame_size': tuple(frame['frame_size']),
+            'detections': frame['detections'],
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def _duplicate_frames(self, plans, to_detect):
+        """
+        Screenshots of a batch that show the same frame as an earlier one in it.
+        
+        Frames are the same when their files have the same content or the frame index links
+        them to the same canonical frame. Only screenshots that need a full match are considered.
+        
+        Returns:
+            Dictionary mapping the plan index of each duplicate to a tuple of the plan index of
+            the first screenshot showing its frame and the duplicate's own content hash
+        """
+        first = {}
+        duplicate_of = {}
+        for i in to_detect:
+            screenshot_path, cached, memoria_names = plans[i]
+            if cached is not None:
+                continue
+            canonical = self.frame_index.canonical(screenshot_path) if self.frame_index is not None else None
+            try:
+                frame_hash = file_content_hash(screenshot_path)
+                key = file_content_hash(canonical) if canonical is not None else frame_hash
+            except OSError:
+                continue
+            if key in first:
+                duplicate_of[i] = (first[key], frame_hash)
+            else:
+                first[key] = i
+                
+        if duplicate_of:
+            print(f"Reusing detections for {len(duplicate_of)} duplicate screenshots")
+            if self.profiler is not None:
+                self.profiler.count('duplicate_frames', len(duplicate_of))
+        return duplicate_of
+        
+    def _relabel_record(self, record, screenshot_path, frame_hash):
+        """A copy of another screenshot's raw detection record, attributed to this screenshot."""
+        return dict(record,
+                    email=self._extract_email_from_filename(Path(screenshot_path).name),
+                    screenshot_path=str(screenshot_path),
+                    content_hash=frame_hash,
+                    timestamp=datetime.now().isoformat())
+        
+    def _merge_detections(self, cached, record):
+        """
+        Combine the cached detections of unchanged templates with a fresh partial match.
+        
+        The fresh detections were found without knowing the cached ones, so the combined list
+        goes through the same overlap rules as a full match (see _resolve_overlaps).
+        """
+        rematched = set(record['templates']) | set(record.get('skipped', {}))
+        merged = dict(record)
+        merged['templates'] = {name: digest for name, digest in cached['templates'].items() if name not in rematched}
+        merged['templates'].update(record['templates'])
+        merged['skipped'] = {name: digest for name, digest in cached.get('skipped', {}).items()
+                             if name not in rematched}
+        merged['skipped'].update(record.get('skipped', {}))
+        detections = [d for d in cached['detections'] if d['memoria_name'] not in rematched]
+        detections.extend(record['detections'])
+        merged['detections'] = self._resolve_overlaps(detections)
+        return merged
+        
+    def _resolve_overlaps(self, detections):
+        """
+        Apply a full match's overlap rules to raw detections gathered by separate matches.
+        
+        With expected_cards, detections claim their cards in template priority order: one
+        centered on an already claimed card is dropped, and claiming stops at expected_cards
+        cards (as in _budgeted_best_matches). With multi_instance, overlapping detections are
+        resolved to the strongest (as in _suppress_overlaps). Otherwise a full match keeps
+        overlapping best matches of different memorias too, and so does this.
+        """
+        if self.expected_cards:
+            priority = {name: i for i, name in enumerate(self.template_priority)}
+            ordered = sorted(detections, key=lambda d: (priority.get(d['memoria_name'], len(priority)),
+                                                        -d['confidence']))
+            claimed = []
+            for detection in ordered:
+                if len(claimed) >= self.expected_cards:
+                    break
+                (x, y), (w, h) = detection['position'], detection['size']
+                if not _is_claimed(x, y, w, h, claimed):
+                    claimed.append((x, y, w, h))
+            kept = {tuple(box) for box in claimed}
+            detections = [d for d in detections if (*d['position'], *d['size']) in kept]
+            
+        if self.multi_instance and detections:
+            boxes = [(*d['position'], *d['size']) for d in detections]
+            keep = non_max_suppression(boxes, [d['confidence'] for d in detections])
+            detections = [detections[i] for i in sorted(keep)]
+        return detections
+    
+    def _prune_removed_templates(self, record):
+        """Drop detections of templates that are no longer in the bank (or no longer match their hash)."""
+        current = {name for name, digest in record['templates'].items() if self.template_hashes.get(name) == digest}
+        skipped = {name: digest for name, digest in record.get('skipped', {}).items()
+                   if self.template_hashes.get(name) == digest}
+        if len(current) == len(record['templates']) and len(skipped) == len(record.get('skipped', {})):
+            return record
+            
+        pruned = dict(record)
+        pruned['templates'] = {name: record['templates'][name] for name in current}
+        pruned['skipped'] = skipped
+        pruned['detections'] = [d for d in record['detections'] if d['memoria_name'] in current]
+        return pruned
+    
+    def _match_in_pool(self, jobs, workers):
+        """
+        Collect raw detections for screenshots in a process pool.
+        
+        Args:
+            jobs: List of (screenshot_path, memoria_names) tuples; memoria_names None means all
+            workers: Number of worker processes
+        
+        The preprocessed template bank is packed once into shared memory and every worker
+        attaches to it, so worker start-up (including a replacement worker after a crash) does
+        not decode memorias/*.png or preprocess a template again.
+        
+        A worker that dies (e.g. on a corrupt PNG that crashes the decoder) breaks the whole pool,
+        so every screenshot that was still in flight is retried one at a time in a fresh
+        single-worker pool. That pins the crash on the screenshot that caused it, which is
+        then reported as failed instead of taking the rest of the batch down with it.
+        
+        Returns:
+            List of raw detection records (None for failures) in the same order as jobs
+        """
+        records = [None] * len(jobs)
+        bank = SharedTemplateBank.create(self.memorias)
+        matcher_kwargs = self._worker_kwargs()
+        matcher_kwargs['template_bank'] = bank.spec()
+        
+        def make_pool(max_workers):
+            return ProcessPoolExecutor(max_workers=max_workers, initializer=_init_match_worker,
+                                       initargs=(matcher_kwargs,))
+        
+        try:
+            self._run_pool(jobs, workers, make_pool, records)
+        finally:
+            bank.close()
+            bank.unlink()
+            
+        return records
+    
+    def _run_pool(self, jobs, workers, make_pool, records):
+        """Fill records from a process pool, isolating screenshots that crash a worker."""
+        retry = []
+        with make_pool(workers) as executor:
+            futures = [executor.submit(_detect_in_worker, str(path), memoria_names) for path, memoria_names in jobs]
+            for i, future in enumerate(futures):
+                try:
+                    records[i] = future.result()
+                except BrokenProcessPool:
+                    retry.append(i)
+                except Exception as e:
+                    print(f"Error matching screenshot {jobs[i][0]}: {e}")
+                    
+        if retry:
+            print(f"A match worker crashed, retrying {len(retry)} screenshots one at a time")
+            executor = make_pool(1)
+            try:
+                for i in retry:
+                    path, memoria_names = jobs[i]
+                    try:
+                        records[i] = executor.submit(_detect_in_worker, str(path), memoria_names).result()
+                    except BrokenProcessPool:
+                        print(f"Error: match worker crashed on screenshot {path}")
+                        executor.shutdown(wait=False)
+                        executor = make_pool(1)
+                    except Exception as e:
+                        print(f"Error matching screenshot {path}: {e}")
+            finally:
+                executor.shutdown()
+    
     def save_results(self, results, output_file='match_results.json'):
-        """Save match results to a JSON file."""
+        """Save match results to the results store, or merge them into a JSON file without one."""
+        started = time.perf_counter()
+        if self.results_store is not None:
+            # Only the screenshots being saved, so a save costs O(results) rather than O(history)
+            content_hashes = {}
+            if self.detection_cache is not None:
+                screenshots = self.detection_cache.screenshots
+                content_hashes = {
+                    match_result['screenshot_path']: screenshots[match_result['screenshot_path']]['content_hash']
+                    for match_results in results.values() for match_result in match_results
+                    if match_result['screenshot_path'] in screenshots
+                }
+            self.results_store.add_results(results, content_hashes)
+            if self.profiler is not None:
+                self.profiler.lap('save', started)
+            print(f"Results saved to {self.results_store.db_file}")
+            return
+            
         # Load existing results if file exists
         existing_results = {}
         if os.path.exists(output_file):
@@ -256,10 +1482,12 @@ class ImageMatcher:
         merged_results = existing_results.copy()
         for email, match_results in results.items():
             if email in merged_results:
-                # Add only new screenshots
-                existing_paths = {r['screenshot_path'] for r in merged_results[email]}
+                # Add new screenshots and replace the ones that were matched again
+                existing_index = {r['screenshot_path']: i for i, r in enumerate(merged_results[email])}
                 for match_result in match_results:
-                    if match_result['screenshot_path'] not in existing_paths:
+                    if match_result['screenshot_path'] in existing_index:
+                        merged_results[email][existing_index[match_result['screenshot_path']]] = match_result
+                    else:
                         merged_results[email].append(match_result)
             else:
                 merged_results[email] = match_results
@@ -267,11 +1495,16 @@ class ImageMatcher:
         # Save merged results
         with open(output_file, 'w') as f:
             json.dump(merged_results, f, indent=2)
+        if self.profiler is not None:
+            self.profiler.lap('save', started)
         
         print(f"Results saved to {output_file}")
 
     def load_results(self, input_file='match_results.json'):
-        """Load match results from a JSON file."""
+        """Load match results from the results store, or from a JSON file without one."""
+        if self.results_store is not None:
+            return self.results_store.load_results()
+            
         if not os.path.exists(input_file):
             print(f"Error: Results file {input_file} does not exist")
             return {}
@@ -280,7 +1513,13 @@ class ImageMatcher:
             return json.load(f)
 
 
-def match_memorias(custom_scores=None, scoring_criteria=None, email_filter=None, threshold=0.7, skip_processed=True):
+def match_memorias(custom_scores=None, scoring_criteria=None, email_filter=None, threshold=0.7, skip_processed=True,
+                   search_mode='exhaustive', workers=1, detection_cache_file=DETECTION_CACHE_FILE,
+                   results_db_file=RESULTS_DB_FILE, export_json=False, profile=False,
+                   template_cache_file=TEMPLATE_CACHE_FILE, expected_cards=None, multi_instance=False,
+                   cascade_thresholds=None, search_region_file=SEARCH_REGION_FILE,
+                   threshold_file=MEMORIA_THRESHOLD_FILE, prefetch_depth=PREFETCH_DEPTH,
+                   frame_index_file=FRAME_INDEX_FILE):
     """
     Convenience function to match memorias against screenshots.
     
@@ -288,39 +1527,66 @@ def match_memorias(custom_scores=None, scoring_criteria=None, email_filter=None,
         custom_scores: Dictionary mapping memoria names to custom point values
                        e.g. {'yingying-ss1': 20, 'another-memoria': 15}
         scoring_criteria: Dictionary of criteria for scoring matches
+                          (both default to memoria_scores.json when neither is given)
         email_filter: Optional filter to only process screenshots with matching email
         threshold: Minimum confidence threshold for a match (0.0 to 1.0)
         skip_processed: If True, skip screenshots that have already been processed
+        search_mode: 'exhaustive', 'pyramid', 'fft', 'slots' or 'cascade' (see ImageMatcher)
+        workers: Number of worker processes used to match screenshots in parallel
+        expected_cards: Optional number of cards per result screen; matching a screenshot stops
+                        once that many cards are identified (see ImageMatcher)
+        multi_instance: If True, report every copy of a memoria instead of only its best match
+        cascade_thresholds: Optional 'gray' and 'histogram' stage thresholds of 'cascade' mode;
+                            the stage report is printed after matching
+        search_region_file: Per-memoria search regions (see search_regions.py); memorias without
+                            one are searched over the full frame
+        threshold_file: Calibrated per-memoria thresholds (see calibrate_thresholds.py); memorias
+                        without one use threshold
+        prefetch_depth: Screenshots read and decoded ahead of matching when workers is 1
+        frame_index_file: Frame index written at capture (see frame_fingerprint.py); linked
+                          duplicate screenshots reuse their canonical frame's detections
+        detection_cache_file: File the raw detections are recorded in, for rescore.py
+        results_db_file: SQLite results store the results are appended to
+        export_json: If True, also export the full results to match_results.json
+        profile: If True, print how long each matching stage and the slowest templates took
+        template_cache_file: File the preprocessed templates are cached in between runs
         
     Returns:
         Dictionary with emails as keys and lists of matches as values
     """
-    matcher = ImageMatcher(threshold=threshold, custom_scores=custom_scores)
-    results = matcher.batch_match_screenshots(scoring_criteria, email_filter, skip_processed)
-    matcher.save_results(results)
+    if custom_scores is None and scoring_criteria is None:
+        custom_scores, scoring_criteria = load_scoring_config()
+        
+    detection_cache = DetectionCache(detection_cache_file)
+    with ResultsStore(results_db_file) as results_store:
+        matcher = ImageMatcher(threshold=threshold, custom_scores=custom_scores, search_mode=search_mode,
+                               detection_cache=detection_cache, results_store=results_store,
+                               template_cache=TemplateCache(template_cache_file), expected_cards=expected_cards,
+                               multi_instance=multi_instance, cascade_thresholds=cascade_thresholds,
+                               search_regions=load_search_regions(search_region_file),
+                               memoria_thresholds=load_memoria_thresholds(threshold_file),
+                               frame_index=FrameIndex(frame_index_file))
+        if profile:
+            with matcher.profile() as profiler:
+                results = matcher.batch_match_screenshots(scoring_criteria, email_filter, skip_processed, workers,
+                                                          prefetch_depth)
+                matcher.save_results(results)
+            profiler.print_summary()
+        else:
+            results = matcher.batch_match_screenshots(scoring_criteria, email_filter, skip_processed, workers,
+                                                      prefetch_depth)
+            matcher.save_results(results)
+        if search_mode == 'cascade':
+            matcher.cascade_report()
+        if export_json:
+            results_store.export_json()
+    detection_cache.save()
     return results
 
 
 if __name__ == "__main__":
-    # Example usage with custom scores
-    custom_scores = {
-        'yingying-ss1': 20,
-        'aoi-ss2': 5,
-        'yuina-ss3': 1,
-        'seira-ss1': 1,
-        'chie-ss2': 1,
-        'seika-ss2': 20,
-        'seika-ss1': 3,
-        'tama-ss1': 1,
-        'tama-ss4': 2
-    }
-    
-    scoring_criteria = {
-        'match_confidence_weight': 0.6,
-        'position_weight': 0.2,
-        'size_weight': 0.1,
-        'color_similarity_weight': 0.1
-    }
+    # Custom scores and scoring criteria come from memoria_scores.json
+    custom_scores, scoring_criteria = load_scoring_config()
     
     results = match_memorias(custom_scores, scoring_criteria)
     
@@ -333,4 +1599,4 @@ if __name__ == "__main__":
             
             for i, match in enumerate(match_result['matches'][:3]):  # Show top 3 matches
                 print(f"    Match {i+1}: {match['memoria_name']} " +
-                      f"(Custom Score: {match['custom_score']}, Match Quality: {match['match_quality_score']:.2f})")
\ No newline at end of file
+                      f"(Custom Score: {match['custom_score']}, Match Quality: {match['match_quality_score']:.2f})")
@@ -0,0 +1,359 @@
+"""
+Synthetic benchmark suite for the memoria matcher.
+
+Builds a template bank of the requested size (the real memorias/*.png plus generated look-alike
+cards), composites some of those templates onto noisy backgrounds at instance resolutions with
+scale jitter and partial occlusion, then measures ImageMatcher.match_screenshot and
+batch_match_screenshots:
+
+- per-screenshot latency percentiles
+- batch throughput
+- peak RSS
+- precision and recall against the known card placements
+
+Each configuration runs in a fresh process so peak RSS is per configuration. The report is
+JSON, so two runs can be diffed:
+
+    python match_benchmark.py --bank-sizes 9,100,500 --search-modes pyramid,fft --output before.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from image_matcher import ImageMatcher, SEARCH_MODES
+
+DEFAULT_RESOLUTIONS = ['1280x720']
+DEFAULT_BANK_SIZES = [9, 50]
+
+# A detection counts as correct when it overlaps a placed card of the same memoria this much
+IOU_THRESHOLD = 0.5
+
+
+def generate_bank(memoria_dir, size, rng):
+    """
+    Template bank of `size` cards: the real memorias first, then generated cards of similar size.
+
+    Returns:
+        Dictionary mapping template names to BGR images
+    """
+    bank = {}
+    for path in sorted(Path(memoria_dir).glob('*.png')):
+        if len(bank) >= size:
+            break
+        img = cv2.imread(str(path))
+        if img is not None:
+            bank[path.stem] = img
+
+    shapes = [img.shape[:2] for img in bank.values()] or [(50, 80)]
+    while len(bank) < size:
+        h, w = shapes[int(rng.integers(len(shapes)))]
+        bank[f"synthetic-{len(bank):03d}"] = _synthetic_card(h, w, rng)
+    return bank
+
+
+def _synthetic_card(h, w, rng):
+    """A card-like template: smooth color field with a few sharp shapes for texture."""
+    field = rng.integers(0, 256, (max(2, h // 8), max(2, w // 8), 3), dtype=np.uint8)
+    card = cv2.resize(field, (w, h), interpolation=cv2.INTER_CUBIC)
+    for _ in range(int(rng.integers(3, 7))):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        x, y = int(rng.integers(0, w)), int(rng.integers(0, h))
+        if rng.random() < 0.5:
+            cv2.circle(card, (x, y), int(rng.integers(3, max(4, h // 3))), color, -1)
+        else:
+            cv2.rectangle(card, (x, y), (x + int(rng.integers(4, w // 2 + 5)), y + int(rng.integers(3, h // 2 + 4))), color, -1)
+    return card
+
+
+def compose_screenshot(bank, resolution, rng, cards=5, scale_jitter=0.02, occlusion=0.15, noise=6):
+    """
+    Paste `cards` distinct templates onto a background without overlap.
+
+    Args:
+        bank: Template bank
+        resolution: (width, height) of the screenshot
+        rng: numpy Generator
+        cards: Number of templates to place
+        scale_jitter: Maximum relative rescale of each pasted template
+        occlusion: Maximum fraction of each pasted template's width hidden by an overlay
+        noise: Amplitude of the uniform pixel noise added to the whole frame
+
+    Returns:
+        Tuple of (screenshot, ground truth list of (name, (x, y, w, h)))
+    """
+    width, height = resolution
+    field = rng.integers(0, 256, (max(2, height // 16), max(2, width // 16), 3), dtype=np.uint8)
+    screenshot = cv2.resize(cv2.GaussianBlur(field, (3, 3), 0), (width, height), interpolation=cv2.INTER_LINEAR)
+
+    names = list(bank)
+    truth = []
+    for index in rng.permutation(len(names))[:cards]:
+        name = names[index]
+        img = bank[name]
+        scale = 1 + rng.uniform(-scale_jitter, scale_jitter)
+        if scale != 1:
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        h, w = img.shape[:2]
+
+        # A few attempts to find free space; skip the card if the frame is too crowded
+        for _ in range(50):
+            x, y = int(rng.integers(0, width - w)), int(rng.integers(0, height - h))
+            if all(_iou((x, y, w, h), box) == 0 for _, box in truth):
+                break
+        else:
+            continue
+
+        screenshot[y:y + h, x:x + w] = img
+        hidden = int(w * rng.uniform(0, occlusion))
+        if hidden:
+            screenshot[y:y + h, x + w - hidden:x + w] = rng.integers(0, 256, 3, dtype=np.uint8)
+        truth.append((name, (x, y, w, h)))
+
+    noisy = screenshot.astype(np.int16) + rng.integers(-noise, noise + 1, screenshot.shape, dtype=np.int16)
+    return np.clip(noisy, 0, 255).astype(np.uint8), truth
+
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    overlap_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    overlap_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    overlap = overlap_w * overlap_h
+    return overlap / float(aw * ah + bw * bh - overlap) if overlap else 0.0
+
+
+def evaluate(matches, truth):
+    """
+    Count true positives, false positives and false negatives of one screenshot.
+
+    Returns:
+        Tuple of (true_positives, false_positives, false_negatives)
+    """
+    unmatched = list(truth)
+    true_positives = 0
+    for match in sorted(matches, key=lambda m: m['confidence'], reverse=True):
+        box = (*match['position'], *match['size'])
+        hit = next((t for t in unmatched if t[0] == match['memoria_name'] and _iou(box, t[1]) >= IOU_THRESHOLD), None)
+        if hit is not None:
+            unmatched.remove(hit)
+            true_positives += 1
+    return true_positives, len(matches) - true_positives, len(unmatched)
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process and of its finished child processes, in MB.
+
+    Returns:
+        Tuple of (self, children); None where the platform does not report it
+    """
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_rss_mb(), None
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2 ** 20
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2 ** 20
+    return own, children
+
+
+def _windows_peak_rss_mb():
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / 2 ** 20
+    except (AttributeError, OSError):
+        pass
+    return None
+
+
+def _percentiles(values):
+    values = np.asarray(values, dtype=np.float64) * 1000
+    if not len(values):
+        return {}
+    return {
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max())
+    }
+
+
+def run_configuration(config):
+    """
+    Build the synthetic data for one configuration and benchmark it. Runs in its own process.
+
+    Args:
+        config: Dictionary with memoria_dir, bank_size, resolution, screenshots, cards,
+                search_mode, threshold, workers and seed
+
+    Returns:
+        Dictionary with the configuration and its measurements
+    """
+    rng = np.random.default_rng(config['seed'])
+    bank = generate_bank(config['memoria_dir'], config['bank_size'], rng)
+
+    with tempfile.TemporaryDirectory(prefix='memoria-bench-') as tmp:
+        memoria_dir = Path(tmp) / 'memorias'
+        screenshots_dir = Path(tmp) / 'screenshots'
+        memoria_dir.mkdir()
+        screenshots_dir.mkdir()
+        for name, img in bank.items():
+            cv2.imwrite(str(memoria_dir / f"{name}.png"), img)
+
+        truth = {}
+        for i in range(config['screenshots']):
+            screenshot, placed = compose_screenshot(bank, config['resolution'], rng, cards=config['cards'])
+            path = screenshots_dir / f"bench{i:04d}_at_example.com_20240101_{i:06d}.png"
+            cv2.imwrite(str(path), screenshot)
+            truth[str(path)] = placed
+
+        start = time.perf_counter()
+        matcher = ImageMatcher(memoria_dir=memoria_dir, screenshots_dir=screenshots_dir,
+                               threshold=config['threshold'], search_mode=config['search_mode'])
+        load_seconds = time.perf_counter() - start
+
+        # Latency and accuracy, one screenshot at a time
+        latencies = []
+        totals = np.zeros(3, dtype=np.int64)
+        for path, placed in truth.items():
+            start = time.perf_counter()
+            match_result = matcher.match_screenshot(path)
+            latencies.append(time.perf_counter() - start)
+            totals += evaluate(match_result['matches'] if match_result else [], placed)
+
+        # Throughput of the batch entry point
+        start = time.perf_counter()
+        matcher.batch_match_screenshots(skip_processed=False, workers=config['workers'])
+        batch_seconds = time.perf_counter() - start
+
+    true_positives, false_positives, false_negatives = (int(n) for n in totals)
+    own_rss, children_rss = peak_rss_mb()
+    return {
+        'config': {key: value for key, value in config.items() if key != 'memoria_dir'},
+        'template_load_seconds': load_seconds,
+        'latency_ms': _percentiles(latencies),
+        'batch_seconds': batch_seconds,
+        'throughput_per_second': config['screenshots'] / batch_seconds if batch_seconds else None,
+        'peak_rss_mb': own_rss,
+        'peak_children_rss_mb': children_rss,
+        'true_positives': true_positives,
+        'false_positives': false_positives,
+        'false_negatives': false_negatives,
+        'precision': true_positives / (true_positives + false_positives) if true_positives + false_positives else None,
+        'recall': true_positives / (true_positives + false_negatives) if true_positives + false_negatives else None
+    }
+
+
+def run_benchmarks(configs):
+    """Run every configuration in a fresh single-use process and collect the reports."""
+    reports = []
+    for config in configs:
+        label = (f"{config['search_mode']} bank={config['bank_size']} "
+                 f"{config['resolution'][0]}x{config['resolution'][1]} workers={config['workers']}")
+        print(f"Running {label}...", flush=True)
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            report = executor.submit(run_configuration, config).result()
+        reports.append(report)
+
+        latency = report['latency_ms']
+        print(f"  p50 {latency['p50']:.1f} ms, p90 {latency['p90']:.1f} ms, p99 {latency['p99']:.1f} ms, "
+              f"throughput {report['throughput_per_second']:.2f}/s, "
+              f"precision {_format_ratio(report['precision'])}, recall {_format_ratio(report['recall'])}, "
+              f"peak RSS {_format_mb(report['peak_rss_mb'])}")
+    return reports
+
+
+def environment():
+    """Versions and hardware the numbers were measured on."""
+    return {
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'opencv_threads': cv2.getNumThreads()
+    }
+
+
+def _format_ratio(value):
+    return 'n/a' if value is None else f"{value:.3f}"
+
+
+def _format_mb(value):
+    return 'n/a' if value is None else f"{value:.0f} MB"
+
+
+def _parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic benchmark for the memoria matcher")
+    parser.add_argument('--memoria-dir', default='memorias', help="Real templates used at the start of every bank")
+    parser.add_argument('--bank-sizes', default=','.join(map(str, DEFAULT_BANK_SIZES)),
+                        help="Comma-separated template bank sizes, e.g. 9,100,500")
+    parser.add_argument('--resolutions', default=','.join(DEFAULT_RESOLUTIONS),
+                        help="Comma-separated instance resolutions, e.g. 960x540,1280x720")
+    parser.add_argument('--search-modes', default='exhaustive',
+                        help=f"Comma-separated search modes out of {', '.join(SEARCH_MODES)}")
+    parser.add_argument('--screenshots', type=int, default=10, help="Screenshots per configuration")
+    parser.add_argument('--cards', type=int, default=5, help="Cards placed on each screenshot")
+    parser.add_argument('--threshold', type=float, default=0.7)
+    parser.add_argument('--workers', type=int, default=1, help="Workers for batch_match_screenshots")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    configs = [
+        {
+            'memoria_dir': args.memoria_dir,
+            'bank_size': bank_size,
+            'resolution': resolution,
+            'screenshots': args.screenshots,
+            'cards': args.cards,
+            'search_mode': search_mode,
+            'threshold': args.threshold,
+            'workers': args.workers,
+            'seed': args.seed
+        }
+        for search_mode in args.search_modes.split(',')
+        for resolution in map(_parse_resolution, args.resolutions.split(','))
+        for bank_size in map(int, args.bank_sizes.split(','))
+    ]
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment(),
+        'runs': run_benchmarks(configs)
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
@@ -0,0 +1,138 @@
+"""
+Opt-in per-stage timing for ImageMatcher.
+
+    with matcher.profile() as profiler:
+        results = matcher.batch_match_screenshots()
+        matcher.save_results(results)
+    profiler.print_summary()
+
+The matcher only times its stages while a profiler is attached. Without one, the per-template
+search loop is untouched and the per-screenshot stages cost one `is not None` check. Stages are accumulated across calls, so a whole batch ends up in one
+summary. Per-template figures cover the template search itself (matchTemplate and minMaxLoc,
+the pyramid search, or the FFT correlation of that template).
+
+With workers > 1 the template search runs in other processes and is not recorded; profile
+a serial run to see where matching time goes.
+"""
+import json
+import time
+
+# Template search stages, summed into the per-template totals
+TEMPLATE_STAGES = ('match_template', 'min_max_loc', 'pyramid_search', 'fft_correlate', 'budgeted_search',
+                   'peak_search', 'cascade_search', 'region_search')
+
+
+class MatchProfiler:
+    """
+    Accumulates the time spent in each matching stage and on each template.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.templates = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+        self.stopped = None
+
+    def record(self, stage, seconds, template=None):
+        """
+        Add one timed call to a stage.
+
+        Args:
+            stage: Stage name, e.g. 'decode' or 'match_template'
+            seconds: Duration of the call
+            template: Memoria name when the call belongs to a single template
+        """
+        calls, total = self.stages.get(stage, (0, 0.0))
+        self.stages[stage] = (calls + 1, total + seconds)
+        if template is not None and stage in TEMPLATE_STAGES:
+            template_stages = self.templates.setdefault(template, {})
+            calls, total = template_stages.get(stage, (0, 0.0))
+            template_stages[stage] = (calls + 1, total + seconds)
+
+    def count(self, counter, n=1):
+        """Add to an event counter (e.g. templates an early-terminated search skipped)."""
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def lap(self, stage, started, template=None):
+        """
+        Record the time since `started` and return the current time, to chain consecutive stages.
+
+        Args:
+            stage: Stage name
+            started: time.perf_counter() value the stage started at
+            template: Memoria name when the stage belongs to a single template
+        """
+        now = time.perf_counter()
+        self.record(stage, now - started, template)
+        return now
+
+    def stop(self):
+        """Freeze the wall-clock time of the session."""
+        self.stopped = time.perf_counter()
+
+    def wall_seconds(self):
+        return (self.stopped or time.perf_counter()) - self.started
+
+    def summary(self, top=10):
+        """
+        Summary of the recorded timings.
+
+        Args:
+            top: Number of slowest templates to include
+
+        Returns:
+            Dictionary with the wall time, per-stage rows (calls, total, mean, share of the
+            recorded time) sorted by total time, the slowest templates and the event counters
+        """
+        recorded = sum(total for _, total in self.stages.values()) or 1.0
+        stages = [
+            {
+                'stage': stage,
+                'calls': calls,
+                'total_seconds': total,
+                'mean_ms': total / calls * 1000,
+                'share': total / recorded
+            }
+            for stage, (calls, total) in sorted(self.stages.items(), key=lambda item: item[1][1], reverse=True)
+        ]
+        # One search of a template spans several stages (e.g. matchTemplate then minMaxLoc)
+        searches = {
+            name: (max(calls for calls, _ in template_stages.values()),
+                   sum(total for _, total in template_stages.values()))
+            for name, template_stages in self.templates.items()
+        }
+        templates = [
+            {
+                'memoria_name': name,
+                'searches': calls,
+                'total_seconds': total,
+                'mean_ms': total / calls * 1000
+            }
+            for name, (calls, total) in sorted(searches.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        ]
+        return {'wall_seconds': self.wall_seconds(), 'stages': stages, 'slowest_templates': templates,
+                'counters': dict(self.counters)}
+
+    def print_summary(self, top=10):
+        """Print the per-stage table and the slowest templates."""
+        summary = self.summary(top)
+        print(f"Profiled {summary['wall_seconds']:.2f}s wall time")
+        print(f"{'Stage':<16}{'Calls':>8}{'Total (s)':>12}{'Mean (ms)':>12}{'Share':>8}")
+        for row in summary['stages']:
+            print(f"{row['stage']:<16}{row['calls']:>8}{row['total_seconds']:>12.3f}"
+                  f"{row['mean_ms']:>12.2f}{row['share']:>8.1%}")
+        for counter, n in summary['counters'].items():
+            print(f"{counter}: {n}")
+
+        if summary['slowest_templates']:
+            print("\nSlowest templates:")
+            print(f"{'Memoria':<24}{'Searches':>9}{'Total (s)':>12}{'Mean (ms)':>12}")
+            for row in summary['slowest_templates']:
+                print(f"{row['memoria_name']:<24}{row['searches']:>9}{row['total_seconds']:>12.3f}{row['mean_ms']:>12.2f}")
+
+    def save(self, output_file, top=10):
+        """Write the summary to a JSON file."""
+        with open(output_file, 'w') as f:
+            json.dump(self.summary(top), f, indent=2)
+        print(f"Profile saved to {output_file}")
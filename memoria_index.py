@@ -0,0 +1,129 @@
+"""
+Perceptual-hash index over the memoria template bank.
+
+Every template gets a 256-bit difference hash (dHash: whether each pixel of a 17x16
+grayscale thumbnail is brighter than its left neighbour). Hashes are packed into a
+(templates, 32) uint8 table, so finding the templates closest to a region is one XOR and
+one popcount lookup over the whole table, independent of the template sizes.
+
+The index only nominates candidates. Callers confirm the best few with the exact
+TM_CCOEFF_NORMED match, so accuracy stays tied to the existing scoring.
+"""
+import cv2
+import numpy as np
+
+# The hash is HASH_SIDE x HASH_SIDE bits
+HASH_SIDE = 16
+# Template sizes are grouped to this many pixels, so a location is cropped once per group
+SIZE_BUCKET = 8
+
+# Number of set bits of every byte value
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def dhash(img):
+    """256-bit difference hash of a BGR or grayscale image, packed into 32 bytes."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (HASH_SIDE + 1, HASH_SIDE), interpolation=cv2.INTER_AREA)
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+def hamming_distances(hashes, query):
+    """Hamming distance between every row of a packed hash table and one packed hash."""
+    return POPCOUNT[np.bitwise_xor(hashes, query)].sum(axis=1, dtype=np.int32)
+
+
+class MemoriaIndex:
+    """
+    Vectorized Hamming table of template hashes.
+    """
+
+    def __init__(self, templates, hashes=None):
+        """
+        Build the index.
+
+        Args:
+            templates: Dictionary mapping template names to BGR images
+            hashes: Optional precomputed dhash() of every template, in the same order
+        """
+        self.names = list(templates)
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        if hashes is None:
+            hashes = [dhash(img) for img in templates.values()]
+        self.hashes = np.stack(hashes) if self.names else np.zeros((0, HASH_SIDE * HASH_SIDE // 8), np.uint8)
+
+        # Templates grouped by (bucketed) size: crop size (w, h) and template positions
+        groups = {}
+        for i, img in enumerate(templates.values()):
+            h, w = img.shape[:2]
+            key = (max(1, round(w / SIZE_BUCKET)), max(1, round(h / SIZE_BUCKET)))
+            groups.setdefault(key, []).append(i)
+        self._groups = []
+        for positions in groups.values():
+            sizes = [templates[self.names[i]].shape[:2] for i in positions]
+            crop_size = (int(np.median([w for _, w in sizes])), int(np.median([h for h, _ in sizes])))
+            self._groups.append((crop_size, np.array(positions)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def mask(self, names=None):
+        """Boolean mask over the index selecting the given template names (default: all)."""
+        if names is None:
+            return np.ones(len(self.names), dtype=bool)
+        selected = np.zeros(len(self.names), dtype=bool)
+        selected[[self._positions[name] for name in names]] = True
+        return selected
+
+    def lookup(self, region, k=3, names=None):
+        """
+        Templates whose hash is closest to a region that is already cropped to a card.
+
+        Args:
+            region: BGR image of the candidate card
+            k: Number of templates to return
+            names: Optional subset of template names to consider
+
+        Returns:
+            List of (name, distance) tuples, closest first
+        """
+        distances = hamming_distances(self.hashes, dhash(region))
+        return self._top(distances, self.mask(names), k)
+
+    def lookup_at(self, screenshot, center, k=3, mask=None):
+        """
+        Templates closest to whatever is centered on a screenshot location.
+
+        Each template is compared with a crop of its own (bucketed) size around the center, so
+        cards of different sizes can share a location.
+
+        Args:
+            screenshot: BGR screenshot
+            center: (x, y) of the location
+            k: Number of templates to return
+            mask: Optional boolean mask (see mask()) of templates to consider
+
+        Returns:
+            List of (name, distance) tuples, closest first
+        """
+        distances = np.full(len(self.names), np.iinfo(np.int32).max, dtype=np.int32)
+        frame_h, frame_w = screenshot.shape[:2]
+        for (w, h), positions in self._groups:
+            x = int(round(center[0] - w / 2))
+            y = int(round(center[1] - h / 2))
+            if x < 0 or y < 0 or x + w > frame_w or y + h > frame_h:
+                continue
+            distances[positions] = hamming_distances(self.hashes[positions], dhash(screenshot[y:y + h, x:x + w]))
+
+        # Templates whose crop did not fit in the screenshot cannot be nominated
+        valid = distances < np.iinfo(np.int32).max
+        return self._top(distances, valid if mask is None else valid & mask, k)
+
+    def _top(self, distances, selected, k):
+        positions = np.flatnonzero(selected)
+        k = min(k, len(positions))
+        if not k:
+            return []
+        nearest = positions[np.argpartition(distances[positions], k - 1)[:k]]
+        nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+        return [(self.names[i], int(distances[i])) for i in nearest]
@@ -0,0 +1,75 @@
+"""
+Multi-instance peak extraction and non-maximum suppression for correlation maps.
+
+cv2.minMaxLoc only reports the single strongest location of a template, so a second copy
+of the same card needs another pass. find_peaks() returns every local maximum above the
+threshold from one TM_CCOEFF_NORMED map, and non_max_suppression() resolves overlapping
+detections, either of one template or across look-alike templates, to the strongest one.
+"""
+import cv2
+import numpy as np
+
+# Two detections are the same card when this much of the smaller box is covered by the other
+NMS_OVERLAP = 0.5
+
+
+def find_peaks(result, threshold, w, h, max_peaks=None):
+    """
+    Every local maximum of a correlation map at or above threshold.
+
+    Args:
+        result: float32 correlation map indexed by window top-left
+        threshold: Minimum peak value
+        w, h: Template size; peaks closer than half a template to a stronger one are dropped
+        max_peaks: Optional cap on the number of peaks returned
+
+    Returns:
+        List of (value, (x, y)) tuples, strongest first
+    """
+    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+    if max_val < threshold:
+        return []
+
+    # A pixel is a peak when nothing within half a template is higher
+    kernel = np.ones((max(1, h // 2) | 1, max(1, w // 2) | 1), np.uint8)
+    ys, xs = np.nonzero((result >= threshold) & (result >= cv2.dilate(result, kernel)))
+    scores = result[ys, xs]
+    boxes = np.column_stack([xs, ys, np.full_like(xs, w), np.full_like(ys, h)])
+
+    # Plateaus yield several equal neighbours; keep one per card
+    keep = non_max_suppression(boxes, scores)
+    if max_peaks is not None:
+        keep = keep[:max_peaks]
+    return [(float(scores[i]), (int(xs[i]), int(ys[i]))) for i in keep]
+
+
+def non_max_suppression(boxes, scores, overlap_threshold=NMS_OVERLAP):
+    """
+    Greedy non-maximum suppression.
+
+    Args:
+        boxes: (N, 4) array of (x, y, w, h) boxes
+        scores: (N,) array of scores
+        overlap_threshold: Boxes covering at least this fraction of the smaller box are
+                           suppressed by the higher-scoring one
+
+    Returns:
+        Indices of the kept boxes, highest score first
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64)
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(int(i))
+        rest = order[1:]
+        overlap_w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        overlap_h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        overlap = overlap_w * overlap_h / np.minimum(areas[i], areas[rest])
+        order = rest[overlap < overlap_threshold]
+    return keep
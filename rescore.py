@@ -0,0 +1,66 @@
+"""
+Rebuild the match results and memoria_match_results.json from cached raw detections.
+
+Run this after editing memoria_scores.json: scores are recomputed from the detections that
+image_matcher recorded in detection_cache.json, so no screenshot is decoded or matched again.
+"""
+import time
+
+from detection_cache import DetectionCache, DETECTION_CACHE_FILE
+from fix_memoria_results import save_readable_results
+from image_matcher import build_match_result, load_scoring_config
+from results_store import ResultsStore, RESULTS_DB_FILE
+
+
+def rescore_results(custom_scores=None, scoring_criteria=None, cache_file=DETECTION_CACHE_FILE,
+                    results_db_file=RESULTS_DB_FILE, output_file='match_results.json',
+                    readable_file='memoria_match_results.json'):
+    """
+    Re-score every cached screenshot with the given scores.
+
+    Stored results of screenshots that have no cached detections (matched before the cache
+    existed) are kept as they are.
+
+    Args:
+        custom_scores: Dictionary mapping memoria names to custom point values
+        scoring_criteria: Dictionary of criteria for scoring matches
+                          (both default to memoria_scores.json when neither is given)
+        cache_file: Detection cache written by image_matcher
+        results_db_file: Results store the new scores are written to
+        output_file: Match results JSON export to rebuild (None to skip it)
+        readable_file: Per-email summary file to rebuild
+
+    Returns:
+        Dictionary with emails as keys and lists of matches as values
+    """
+    if custom_scores is None and scoring_criteria is None:
+        custom_scores, scoring_criteria = load_scoring_config()
+
+    cache = DetectionCache(cache_file)
+    results = {}
+    for record in cache.records():
+        if record['email']:
+            results.setdefault(record['email'], []).append(
+                build_match_result(record, custom_scores, scoring_criteria))
+
+    with ResultsStore(results_db_file) as results_store:
+        content_hashes = {path: entry['content_hash'] for path, entry in cache.screenshots.items()}
+        results_store.add_results(results, content_hashes)
+        # Re-scoring supersedes every cached screenshot, so drop the old rows right away
+        results_store.compact()
+
+        # Keep results the cache knows nothing about
+        results = results_store.load_results()
+        if output_file:
+            results_store.export_json(output_file)
+
+    save_readable_results(results, readable_file)
+    return results
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    results = rescore_results()
+    screenshots = sum(len(match_results) for match_results in results.values())
+    print(f"Re-scored {screenshots} screenshots across {len(results)} emails "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
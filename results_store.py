@@ -0,0 +1,238 @@
+"""
+Indexed SQLite store for memoria match results.
+
+match_results.json has to be loaded, merged and rewritten in full on every run, so each run
+costs O(total history). The store appends each run's results instead, and answers "was this
+screenshot already processed?" with an indexed lookup. Re-matched screenshots get a new row;
+the newest row per screenshot path wins and compact() drops the superseded ones.
+
+match_results.json remains available as an export (export_json) for tools that read it.
+Run this module directly to export it.
+"""
+import argparse
+import json
+import os
+import sqlite3
+
+RESULTS_DB_FILE = 'match_results.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS match_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    screenshot_path TEXT NOT NULL,
+    content_hash TEXT,
+    email TEXT,
+    timestamp TEXT
+);
+CREATE TABLE IF NOT EXISTS matches (
+    result_id INTEGER NOT NULL REFERENCES match_results(id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    memoria_name TEXT NOT NULL,
+    memoria_path TEXT,
+    confidence REAL,
+    x INTEGER,
+    y INTEGER,
+    width INTEGER,
+    height INTEGER,
+    position_score REAL,
+    size_score REAL,
+    color_similarity REAL,
+    match_quality_score REAL,
+    custom_score REAL
+);
+CREATE INDEX IF NOT EXISTS idx_match_results_path ON match_results(screenshot_path);
+CREATE INDEX IF NOT EXISTS idx_match_results_hash ON match_results(content_hash);
+CREATE INDEX IF NOT EXISTS idx_match_results_email ON match_results(email);
+CREATE INDEX IF NOT EXISTS idx_matches_result ON matches(result_id);
+CREATE INDEX IF NOT EXISTS idx_matches_memoria ON matches(memoria_name);
+"""
+
+# Newest row per screenshot path
+LATEST_RESULTS = """
+SELECT id, screenshot_path, email, timestamp FROM match_results
+WHERE id IN (SELECT MAX(id) FROM match_results GROUP BY screenshot_path)
+"""
+
+MATCH_COLUMNS = ('memoria_name', 'memoria_path', 'confidence', 'x', 'y', 'width', 'height', 'position_score',
+                 'size_score', 'color_similarity', 'match_quality_score', 'custom_score')
+
+
+class ResultsStore:
+    """
+    Append-only match results store backed by SQLite.
+    """
+
+    def __init__(self, db_file=RESULTS_DB_FILE, legacy_json='match_results.json'):
+        """
+        Open (or create) the store.
+
+        Args:
+            db_file: SQLite database file
+            legacy_json: match_results.json imported once when the store is created empty
+        """
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(SCHEMA)
+
+        if legacy_json and self._is_empty() and os.path.exists(legacy_json):
+            self.import_json(legacy_json)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _is_empty(self):
+        return self.conn.execute("SELECT 1 FROM match_results LIMIT 1").fetchone() is None
+
+    def add_results(self, results, content_hashes=None):
+        """
+        Append match results in a single transaction.
+
+        Args:
+            results: Dictionary with emails as keys and lists of match results as values
+            content_hashes: Optional dictionary mapping screenshot paths to content hashes
+        """
+        content_hashes = content_hashes or {}
+        with self.conn:
+            for email, match_results in results.items():
+                for match_result in match_results:
+                    screenshot_path = match_result['screenshot_path']
+                    cursor = self.conn.execute(
+                        "INSERT INTO match_results (screenshot_path, content_hash, email, timestamp) VALUES (?, ?, ?, ?)",
+                        (screenshot_path, content_hashes.get(screenshot_path), email, match_result.get('timestamp')))
+                    self.conn.executemany(
+                        f"INSERT INTO matches (result_id, rank, {', '.join(MATCH_COLUMNS)}) "
+                        f"VALUES (?, ?, {', '.join('?' * len(MATCH_COLUMNS))})",
+                        [(cursor.lastrowid, rank) + _match_row(match)
+                         for rank, match in enumerate(match_result['matches'])])
+
+    def is_processed(self, screenshot_path):
+        """Whether results for a screenshot path have been stored (indexed lookup)."""
+        row = self.conn.execute("SELECT 1 FROM match_results WHERE screenshot_path = ? LIMIT 1",
+                                (str(screenshot_path),)).fetchone()
+        return row is not None
+
+    def has_content(self, content_hash):
+        """Whether results for a screenshot with this content hash have been stored (indexed lookup)."""
+        row = self.conn.execute("SELECT 1 FROM match_results WHERE content_hash = ? LIMIT 1",
+                                (content_hash,)).fetchone()
+        return row is not None
+
+    def load_results(self, email=None):
+        """
+        Newest results per screenshot, in the same shape as match_results.json.
+
+        Args:
+            email: Optional email to restrict the results to
+        """
+        query = LATEST_RESULTS
+        params = ()
+        if email is not None:
+            query += " AND email = ?"
+            params = (email,)
+        query += " ORDER BY id"
+
+        rows = self.conn.execute(query, params).fetchall()
+        matches = {}
+        if rows:
+            result_ids = [row[0] for row in rows]
+            for result_id, match in self._matches_for(result_ids):
+                matches.setdefault(result_id, []).append(match)
+
+        results = {}
+        for result_id, screenshot_path, row_email, timestamp in rows:
+            results.setdefault(row_email, []).append({
+                'email': row_email,
+                'screenshot_path': screenshot_path,
+                'matches': matches.get(result_id, []),
+                'timestamp': timestamp
+            })
+        return results
+
+    def _matches_for(self, result_ids):
+        """Yield (result_id, match record) for the given results, in rank order."""
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(result_ids), 500):
+            chunk = result_ids[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT result_id, {', '.join(MATCH_COLUMNS)} FROM matches "
+                f"WHERE result_id IN ({', '.join('?' * len(chunk))}) ORDER BY result_id, rank", chunk)
+            for row in rows:
+                yield row[0], _match_record(row[1:])
+
+    def memoria_counts(self):
+        """Number of (newest) screenshot results each memoria was found in."""
+        rows = self.conn.execute(
+            f"SELECT memoria_name, COUNT(*) FROM matches WHERE result_id IN (SELECT id FROM ({LATEST_RESULTS})) "
+            "GROUP BY memoria_name")
+        return dict(rows.fetchall())
+
+    def compact(self):
+        """Delete rows superseded by a newer result for the same screenshot."""
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM match_results WHERE id NOT IN (SELECT MAX(id) FROM match_results GROUP BY screenshot_path)")
+
+    def import_json(self, input_file='match_results.json'):
+        """Append the results of a match_results.json file."""
+        try:
+            with open(input_file, 'r') as f:
+                results = json.load(f)
+        except json.JSONDecodeError as e:
+            print(f"Error importing {input_file}: {e}")
+            return
+        self.add_results(results)
+        print(f"Imported {sum(len(r) for r in results.values())} results from {input_file}")
+
+    def export_json(self, output_file='match_results.json'):
+        """Write the newest results in the match_results.json format."""
+        with open(output_file, 'w') as f:
+            json.dump(self.load_results(), f, indent=2)
+        print(f"Results exported to {output_file}")
+
+
+def _match_row(match):
+    x, y = match['position']
+    width, height = match['size']
+    return (match['memoria_name'], match.get('memoria_path'), match['confidence'], x, y, width, height,
+            match.get('position_score'), match.get('size_score'), match.get('color_similarity'),
+            match['match_quality_score'], match['custom_score'])
+
+
+def _match_record(row):
+    values = dict(zip(MATCH_COLUMNS, row))
+    custom_score = values['custom_score']
+    if custom_score is not None and float(custom_score).is_integer():
+        custom_score = int(custom_score)
+    return {
+        'memoria_name': values['memoria_name'],
+        'memoria_path': values['memoria_path'],
+        'confidence': values['confidence'],
+        'position': (values['x'], values['y']),
+        'size': (values['width'], values['height']),
+        'position_score': values['position_score'],
+        'size_score': values['size_score'],
+        'color_similarity': values['color_similarity'],
+        'match_quality_score': values['match_quality_score'],
+        'custom_score': custom_score,
+        'final_score': custom_score  # Add final_score for backward compatibility
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the match results store to match_results.json")
+    parser.add_argument('--db', default=RESULTS_DB_FILE)
+    parser.add_argument('--output', default='match_results.json')
+    parser.add_argument('--compact', action='store_true', help="Drop superseded results before exporting")
+    args = parser.parse_args()
+
+    with ResultsStore(args.db, legacy_json=None) as store:
+        if args.compact:
+            store.compact()
+        store.export_json(args.output)
@@ -0,0 +1,291 @@
+"""
+Automatic capture of gacha result screens.
+
+Result screens used to be captured by hand with the screenshot hotkey, often a little too
+early or too late. ResultsScreenDetector looks for a small probe template, cut from a
+result screen, in a downsampled grayscale copy of each frame. That costs a couple of
+milliseconds per 1280x720 frame, so it can run on every frame the capture service reports
+changed.
+
+AutoCapture subscribes the detector to a CaptureService. When the probe appears on an
+instance (the rising edge: it was not on that instance's previous changed frame), the frame
+is queued, and a worker thread saves it to screenshots/ and matches it. The instance is
+captured once per result screen, however long the screen stays up. The detection cache and
+frame index are saved whenever the queue runs empty and on stop(), not after every frame;
+both append to journals, so the GUI's own runs and auto-capture keep each other's entries.
+
+Pick a probe that is only drawn once every card is shown (for example the button that
+closes the results), or the capture may catch the cards mid-animation. Cut it from a
+screenshot with:
+
+    python results_trigger.py --make-probe screenshots/x_at_y.com_20240101_120000.png X Y W H
+
+and check it against existing screenshots with --test.
+"""
+import argparse
+import os
+import queue
+import threading
+
+import cv2
+
+RESULTS_PROBE_FILE = 'results_probe.png'
+
+# The probe is searched in frames downscaled by this factor
+PROBE_SCALE = 0.25
+# Minimum normalized correlation of the probe for a frame to count as a result screen
+PROBE_THRESHOLD = 0.8
+# Result screens waiting to be saved and matched before new ones are dropped
+MATCH_QUEUE_SIZE = 64
+
+
+class ResultsScreenDetector:
+    """
+    Tells result screens apart from every other screen with one downsampled probe match.
+    """
+
+    def __init__(self, probe_file=RESULTS_PROBE_FILE, threshold=PROBE_THRESHOLD, scale=PROBE_SCALE):
+        """
+        Load the probe template.
+
+        Args:
+            probe_file: Image cut from a full-size result screen
+            threshold: Minimum probe confidence of a result screen
+            scale: Factor frames and probe are downscaled by before matching
+        """
+        probe = cv2.imread(probe_file, cv2.IMREAD_GRAYSCALE)
+        if probe is None:
+            raise ValueError(f"Could not load results probe {probe_file}")
+        self.threshold = threshold
+        self.scale = scale
+        self.probe = cv2.resize(probe, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        # Instances whose last checked frame was a result screen
+        self._showing = set()
+
+    def score(self, frame):
+        """Best probe confidence in a BGR frame (-1.0 if the frame is smaller than the probe)."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        if small.shape[0] < self.probe.shape[0] or small.shape[1] < self.probe.shape[1]:
+            return -1.0
+        return float(cv2.minMaxLoc(cv2.matchTemplate(small, self.probe, cv2.TM_CCOEFF_NORMED))[1])
+
+    def is_results(self, frame):
+        """Whether a frame shows a result screen."""
+        return self.score(frame) >= self.threshold
+
+    def update(self, instance, frame):
+        """
+        Check an instance's new frame.
+
+        Returns:
+            True only for the first frame of a result screen on that instance
+        """
+        showing = self.is_results(frame)
+        appeared = showing and instance not in self._showing
+        if showing:
+            self._showing.add(instance)
+        else:
+            self._showing.discard(instance)
+        return appeared
+
+    def forget(self, instance):
+        """Drop an instance's state (e.g. its window closed)."""
+        self._showing.discard(instance)
+
+
+class AutoCapture:
+    """
+    Saves and matches every result screen the capture service sees, as it appears.
+    """
+
+    def __init__(self, service, detector, custom_scores=None, scoring_criteria=None, on_result=None,
+                 queue_size=MATCH_QUEUE_SIZE):
+        """
+        Initialize auto-capture; nothing runs until start().
+
+        Args:
+            service: CaptureService providing the frames (see capture_service.py)
+            detector: ResultsScreenDetector
+            custom_scores: Dictionary mapping memoria names to custom point values
+            scoring_criteria: Dictionary of criteria for scoring matches
+                              (both default to memoria_scores.json when neither is given)
+            on_result: Optional callback(title, screenshot_path, match_result) called on the
+                       worker thread for every captured result screen; match_result is None
+                       if matching failed
+            queue_size: Result screens waiting to be matched before new ones are dropped
+        """
+        self.service = service
+        self.detector = detector
+        self.custom_scores = custom_scores
+        self.scoring_criteria = scoring_criteria
+        self.on_result = on_result
+        self.captured = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Start matching result screens and the capture service."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='results-trigger', daemon=True)
+        self._thread.start()
+        # A closed instance's next window starts without a result screen showing
+        self.service.subscribe(self._on_frame, closed=self.detector.forget)
+        self.service.start()
+
+    def stop(self):
+        """Stop the capture service, then finish the result screens already queued."""
+        self.service.unsubscribe(self._on_frame)
+        self.service.stop()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _on_frame(self, event):
+        # Runs on the capture thread: only the probe match happens here
+        if not self.detector.update(event['hwnd'], event['frame']):
+            return
+        try:
+            # The event's frame is reused by later captures
+            self._queue.put_nowait((event['title'], event['frame'].copy()))
+        except queue.Full:
+            self.dropped += 1
+            print(f"Result screen of {event['title']} dropped: {self._queue.maxsize} are already waiting")
+
+    def _run(self):
+        from detection_cache import DetectionCache
+        from image_matcher import load_scoring_config
+        from results_store import ResultsStore
+
+        custom_scores, scoring_criteria = self.custom_scores, self.scoring_criteria
+        if custom_scores is None and scoring_criteria is None:
+            custom_scores, scoring_criteria = load_scoring_config()
+
+        # The results store's connection belongs to this thread, so the matcher is built here
+        with ResultsStore() as results_store:
+            matcher = self._build_matcher(custom_scores, DetectionCache(), results_store)
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    self._save(matcher)
+                    return
+                title, frame = item
+                screenshot_path, match_result = None, None
+                try:
+                    screenshot_path, match_result = self._save_and_match(matcher, title, frame, scoring_criteria)
+                except Exception as e:
+                    print(f"Error matching result screen of {title}: {str(e)}")
+                self.captured += 1
+                if self.on_result is not None:
+                    self.on_result(title, screenshot_path, match_result)
+                if self._queue.empty():
+                    # Once per burst of result screens rather than once per frame
+                    self._save(matcher)
+
+    def _save(self, matcher):
+        """Append what was matched since the last save to the detection cache and frame index journals."""
+        try:
+            matcher.detection_cache.save()
+            matcher.frame_index.save()
+        except OSError as e:
+            print(f"Error saving auto-capture matches: {str(e)}")
+
+    def _build_matcher(self, custom_scores, detection_cache, results_store):
+        """Matcher set up the way match_memorias sets it up."""
+        from calibrate_thresholds import load_memoria_thresholds
+        from frame_fingerprint import FrameIndex
+        from image_matcher import ImageMatcher
+        from search_regions import load_search_regions
+        from template_cache import TemplateCache
+
+        return ImageMatcher(custom_scores=custom_scores, detection_cache=detection_cache,
+                            results_store=results_store, template_cache=TemplateCache(),
+                            search_regions=load_search_regions(),
+                            memoria_thresholds=load_memoria_thresholds(),
+                            frame_index=FrameIndex())
+
+    def _save_and_match(self, matcher, title, frame, scoring_criteria):
+        """
+        Save one result screen and record its matches (the cache and index are saved by _run).
+
+        Returns:
+            Tuple of (screenshot path, match result or None)
+        """
+        from image_matcher import build_match_result
+        from screenshot_windows import ensure_screenshots_dir, screenshot_path_for, write_screenshot
+
+        screenshot_path = screenshot_path_for(ensure_screenshots_dir(), title)
+        duplicate_of = matcher.frame_index.register(screenshot_path, frame)
+        file_hash = write_screenshot(screenshot_path, frame, duplicate_of)
+
+        record = matcher.detect_screenshot(screenshot_path, screenshot=frame)
+        if record is None:
+            return screenshot_path, None
+        record['content_hash'] = file_hash
+        if duplicate_of is not None:
+            matcher.detection_cache.store_duplicate(record)
+        else:
+            matcher.detection_cache.store(record)
+
+        match_result = build_match_result(record, matcher.custom_scores, scoring_criteria)
+        matcher.save_results({match_result['email']: [match_result]})
+        return screenshot_path, match_result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture and match result screens as soon as they appear")
+    parser.add_argument('--probe', default=RESULTS_PROBE_FILE)
+    parser.add_argument('--threshold', type=float, default=PROBE_THRESHOLD)
+    parser.add_argument('--make-probe', nargs=5, metavar=('SCREENSHOT', 'X', 'Y', 'W', 'H'),
+                        help="Cut the probe out of a result screen screenshot and exit")
+    parser.add_argument('--test', nargs='+', metavar='SCREENSHOT',
+                        help="Print the probe confidence of screenshots and exit")
+    parser.add_argument('--interval', type=float, help="Seconds between capture rounds")
+    args = parser.parse_args()
+
+    if args.make_probe:
+        screenshot_path = args.make_probe[0]
+        # Snap the probe to the downscaling grid, so its pixels average exactly like the frame's
+        step = max(1, round(1 / PROBE_SCALE))
+        x, y, w, h = (int(value) // step * step for value in args.make_probe[1:])
+        img = cv2.imread(screenshot_path)
+        if img is None:
+            raise SystemExit(f"Error: Could not load screenshot {screenshot_path}")
+        cv2.imwrite(args.probe, img[y:y + h, x:x + w])
+        print(f"Probe saved to {args.probe}")
+    elif args.test:
+        detector = ResultsScreenDetector(args.probe, args.threshold)
+        for screenshot_path in args.test:
+            img = cv2.imread(screenshot_path)
+            if img is None:
+                print(f"Error: Could not load screenshot {screenshot_path}")
+                continue
+            score = detector.score(img)
+            verdict = 'result screen' if score >= detector.threshold else 'other screen'
+            print(f"{os.path.basename(screenshot_path)}: {score:.3f} ({verdict})")
+    else:
+        from capture_service import CAPTURE_INTERVAL, CaptureService
+
+        def report(title, screenshot_path, match_result):
+            if match_result is not None:
+                print(f"{title}: {screenshot_path}, {len(match_result['matches'])} matches")
+
+        service = CaptureService(args.interval if args.interval else CAPTURE_INTERVAL)
+        auto_capture = AutoCapture(service, ResultsScreenDetector(args.probe, args.threshold), on_result=report)
+        print("Watching for result screens, press Ctrl+C to stop...")
+        with auto_capture:
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+        print(f"{auto_capture.captured} result screens captured, {auto_capture.dropped} dropped")
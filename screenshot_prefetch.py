@@ -0,0 +1,91 @@
+"""
+Bounded read-ahead of screenshots for batch matching.
+
+Matching a screenshot used to start only after its PNG had been read and decoded, so disk
+and decode time added straight onto matching time. ScreenshotPrefetcher reads and decodes
+the next screenshots on I/O threads while the current one is matched. cv2.imdecode releases
+the GIL, so those threads run alongside the matcher.
+
+At most `depth` screenshots are read ahead. When matching falls behind, the I/O threads
+stop until the matcher takes the next frame, so a large backlog never holds more than
+`depth` decoded frames in memory. Frames come out in the order the paths went in.
+"""
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Screenshots read and decoded ahead of the one being matched
+PREFETCH_DEPTH = 4
+# Threads reading and decoding screenshots
+IO_THREADS = 2
+
+
+def load_screenshot(path):
+    """
+    Read and decode one screenshot.
+
+    Returns:
+        Tuple of (path, raw bytes, decoded BGR image). The bytes are None if the file could
+        not be read and the image is None if it could not be read or decoded; the matcher
+        reports those failures itself.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return path, None, None
+    return path, data, cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+class ScreenshotPrefetcher:
+    """
+    Iterates over (path, raw bytes, decoded image) tuples, read ahead on I/O threads.
+    """
+
+    def __init__(self, paths, depth=PREFETCH_DEPTH, io_threads=IO_THREADS, profiler=None):
+        """
+        Initialize the prefetcher.
+
+        Args:
+            paths: Screenshot paths, in the order the frames are wanted
+            depth: Maximum number of screenshots read ahead of the consumer (at least 1)
+            io_threads: Number of threads reading and decoding screenshots
+            profiler: Optional MatchProfiler; the time the consumer waits for a frame is
+                      recorded as 'prefetch_wait'
+        """
+        if depth < 1:
+            raise ValueError(f"depth must be at least 1, got {depth}")
+        self.paths = paths
+        self.depth = depth
+        self.io_threads = max(1, io_threads)
+        self.profiler = profiler
+
+    def __iter__(self):
+        paths = iter(self.paths)
+        with ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix='screenshot-io') as pool:
+            pending = deque()
+            try:
+                for path in paths:
+                    pending.append(pool.submit(load_screenshot, path))
+                    if len(pending) >= self.depth:
+                        break
+
+                while pending:
+                    future = pending.popleft()
+                    started = time.perf_counter()
+                    frame = future.result()
+                    if self.profiler is not None:
+                        self.profiler.lap('prefetch_wait', started)
+
+                    # Refill the slot the consumer just freed
+                    path = next(paths, None)
+                    if path is not None:
+                        pending.append(pool.submit(load_screenshot, path))
+                    yield frame
+            finally:
+                # Consumer stopped early: drop the frames nobody will take
+                for future in pending:
+                    future.cancel()
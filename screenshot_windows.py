@@ -1,10 +1,18 @@
 import os
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import win32gui
-import win32ui
-from ctypes import windll
-from PIL import Image
+import cv2
+from capture_session import CaptureSession
+from detection_cache import content_hash
+from frame_fingerprint import FrameIndex
+
+# Frames waiting to be written by a ScreenshotWriter before submit() blocks
+WRITE_QUEUE_SIZE = 32
+# Windows captured at once in parallel mode
+CAPTURE_THREADS = 8
 
 def ensure_screenshots_dir():
     """Create screenshots directory if it doesn't exist"""
@@ -13,53 +21,123 @@ def ensure_screenshots_dir():
         os.makedirs(screenshots_dir)
     return screenshots_dir
 
-def capture_window_screenshot(hwnd, save_path):
+def capture_window_array(hwnd, sessions=None):
     """
-    Capture a screenshot of a specific window and save it
+    Capture a specific window into memory
+
+    GDI copies the bitmap bits straight into a NumPy buffer (no PIL, no PNG); the returned
+    image is a BGR view over its BGRX rows.
+
+    Args:
+        hwnd: Window handle
+        sessions: Optional CaptureSessionPool; the window's device contexts and buffer are
+                  then reused, and the returned view is overwritten by its next capture
+
+    Returns:
+        (height, width, 3) uint8 BGR array
     """
-    # Get the window size
-    left, top, right, bottom = win32gui.GetWindowRect(hwnd)
-    width = right - left
-    height = bottom - top
+    if sessions is not None:
+        return sessions.capture(hwnd)
+    with CaptureSession(hwnd) as session:
+        return session.capture()
 
-    # Get the window DC
-    hwndDC = win32gui.GetWindowDC(hwnd)
-    mfcDC = win32ui.CreateDCFromHandle(hwndDC)
-    saveDC = mfcDC.CreateCompatibleDC()
+def capture_window_screenshot(hwnd, save_path, frame_index=None, sessions=None):
+    """
+    Capture a screenshot of a specific window and save it
 
-    # Create a bitmap object
-    saveBitMap = win32ui.CreateBitmap()
-    saveBitMap.CreateCompatibleBitmap(mfcDC, width, height)
-    saveDC.SelectObject(saveBitMap)
+    With a FrameIndex, a frame identical to an already saved one is not written again:
+    save_path becomes a hard link to the canonical screenshot (or a normal copy where the
+    filesystem has no hard links) and the link is recorded in the index.
 
-    # Copy the screen into our memory device context
-    result = windll.user32.PrintWindow(hwnd, saveDC.GetSafeHdc(), 3)
+    Returns:
+        Tuple of (save_path, canonical screenshot path or None if the frame is new)
+    """
+    frame = capture_window_array(hwnd, sessions)
+    canonical = frame_index.register(save_path, frame) if frame_index is not None else None
+    write_screenshot(save_path, frame, canonical)
+    return save_path, canonical
 
-    # Convert the raw data into a format PIL understands
-    bmpinfo = saveBitMap.GetInfo()
-    bmpstr = saveBitMap.GetBitmapBits(True)
-    im = Image.frombuffer(
-        'RGB',
-        (bmpinfo['bmWidth'], bmpinfo['bmHeight']),
-        bmpstr, 'raw', 'BGRX', 0, 1)
+def write_screenshot(save_path, frame, link_to=None):
+    """
+    Save a captured frame as a PNG, or as a hard link to the screenshot it duplicates
 
-    # Clean up
-    win32gui.DeleteObject(saveBitMap.GetHandle())
-    saveDC.DeleteDC()
-    mfcDC.DeleteDC()
-    win32gui.ReleaseDC(hwnd, hwndDC)
+    Returns:
+        Content hash of the file written (see detection_cache.content_hash)
+    """
+    if link_to is not None:
+        try:
+            os.link(link_to, save_path)
+            with open(save_path, 'rb') as f:
+                return content_hash(f.read())
+        except OSError:
+            pass
 
-    # Save the image
-    im.save(save_path)
-    return save_path
+    ok, encoded = cv2.imencode('.png', frame)
+    if not ok:
+        raise ValueError(f"Could not encode screenshot {save_path}")
+    data = encoded.tobytes()
+    with open(save_path, 'wb') as f:
+        f.write(data)
+    return content_hash(data)
 
-def screenshot_windows():
+class ScreenshotWriter:
     """
-    Take screenshots of all windows with email addresses as titles
+    Writes captured frames to disk on a background thread, off the capture and match path
+
+    submit() only blocks once WRITE_QUEUE_SIZE frames are waiting. close() (or leaving the
+    with block) waits until every frame is on disk; saved then maps each path to the content
+    hash of its file and failed lists the paths that could not be written.
+
+    With a FrameIndex, frames are fingerprinted on the writer thread too, so hashing stays
+    off the capture path; duplicates then maps each path to the canonical screenshot it was
+    linked to (or None if the frame was new). The index is only touched by the writer thread
+    until close().
     """
-    screenshots_dir = ensure_screenshots_dir()
-    
-    # Find all windows with email addresses
+
+    def __init__(self, queue_size=WRITE_QUEUE_SIZE, frame_index=None):
+        self.frame_index = frame_index
+        self.saved = {}
+        self.duplicates = {}
+        self.failed = []
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='screenshot-writer', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, save_path, frame, link_to=None):
+        """Queue a frame to be saved (see write_screenshot); the frame must not be modified afterwards."""
+        self._queue.put((save_path, frame, link_to))
+
+    def close(self):
+        """Wait for every queued frame to be written and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            save_path, frame, link_to = item
+            try:
+                if link_to is None and self.frame_index is not None:
+                    link_to = self.frame_index.register(save_path, frame)
+                    self.duplicates[save_path] = link_to
+                self.saved[save_path] = write_screenshot(save_path, frame, link_to)
+            except Exception as e:
+                print(f"Error saving screenshot {save_path}: {str(e)}")
+                self.failed.append(save_path)
+
+def find_email_windows():
+    """Visible windows whose title is an email address, as (hwnd, title) tuples"""
+    import win32gui
+
     email_windows = []
     def callback(hwnd, _):
         if win32gui.IsWindowVisible(hwnd):
@@ -67,40 +145,239 @@ def screenshot_windows():
             if '@' in title:  # Simple check for email address
                 email_windows.append((hwnd, title))
     win32gui.EnumWindows(callback, None)
-    
-    # Take screenshots
-    screenshots_taken = []
-    for hwnd, title in email_windows:
+    return email_windows
+
+def capture_windows(windows, sessions=None, max_workers=CAPTURE_THREADS):
+    """
+    Capture several windows at once from a thread pool
+
+    PrintWindow renders a window without it being in front, so no window is focused and
+    nothing waits for a redraw. The GDI calls release the GIL, so the captures overlap.
+
+    Args:
+        windows: List of (hwnd, title) tuples
+        sessions: Optional CaptureSessionPool (see capture_window_array); each window has its
+                  own buffer, so the frames of one call do not overwrite each other
+        max_workers: Number of capture threads
+
+    Returns:
+        List of dictionaries with the hwnd, title, frame (None if the capture failed), capture
+        time in milliseconds and error message (or None), in the order of windows
+    """
+    if sessions is not None:
+        # Open the sessions up front so the threads never add to the pool
+        for hwnd, _ in windows:
+            sessions.session(hwnd)
+
+    def capture(window):
+        hwnd, title = window
+        started = time.perf_counter()
+        try:
+            frame, error = capture_window_array(hwnd, sessions), None
+        except Exception as e:
+            frame, error = None, str(e)
+        return {
+            'hwnd': hwnd,
+            'title': title,
+            'frame': frame,
+            'capture_ms': (time.perf_counter() - started) * 1000,
+            'error': error
+        }
+
+    if not windows:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows))),
+                            thread_name_prefix='window-capture') as pool:
+        return list(pool.map(capture, windows))
+
+def screenshot_path_for(screenshots_dir, title):
+    """Timestamped screenshot path for a window title"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"{title.replace('@', '_at_')}_{timestamp}.png"
+    return os.path.join(screenshots_dir, filename)
+
+def window_frames(sessions=None, parallel=False):
+    """
+    Capture every email-titled window
+
+    Sequentially, each window is brought to the front and given time to redraw before it is
+    captured. In parallel mode every window is captured at once without any focus change
+    (see capture_windows) and the windows come in title order. Failed captures are reported
+    and skipped.
+
+    Args:
+        sessions: Optional CaptureSessionPool (see capture_window_array)
+        parallel: If True, capture all windows at once
+
+    Yields:
+        Tuples of (title, frame, capture time in milliseconds)
+    """
+    windows = find_email_windows()
+    if parallel:
+        for capture in capture_windows(sorted(windows, key=lambda window: window[1]), sessions):
+            if capture['error'] is not None:
+                print(f"Error capturing screenshot for {capture['title']}: {capture['error']}")
+                continue
+            yield capture['title'], capture['frame'], capture['capture_ms']
+        return
+
+    import win32gui
+
+    for hwnd, title in windows:
         try:
             # Bring window to front
             win32gui.SetForegroundWindow(hwnd)
             time.sleep(0.5)  # Wait for window to be in foreground
-            
-            # Generate filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{title.replace('@', '_at_')}_{timestamp}.png"
-            screenshot_path = os.path.join(screenshots_dir, filename)
-            
-            # Take screenshot
-            capture_window_screenshot(hwnd, screenshot_path)
+
+            started = time.perf_counter()
+            frame = capture_window_array(hwnd, sessions)
+        except Exception as e:
+            print(f"Error capturing screenshot for {title}: {str(e)}")
+            continue
+        yield title, frame, (time.perf_counter() - started) * 1000
+
+def screenshot_windows(dedupe=True, sessions=None, parallel=False):
+    """
+    Take screenshots of all windows with email addresses as titles
+
+    Args:
+        dedupe: If True, frames identical to an earlier screenshot are linked to it in
+                frame_index.json instead of being saved as a new image
+        sessions: Optional CaptureSessionPool kept open across rounds, so each window's
+                  device contexts and buffer are reused
+        parallel: If True, capture every window at once without bringing any to the front
+                  (see window_frames)
+
+    Returns:
+        List of dictionaries with the window title, screenshot path, canonical screenshot it
+        duplicates (or None) and capture time in milliseconds
+    """
+    screenshots_dir = ensure_screenshots_dir()
+    frame_index = FrameIndex() if dedupe else None
+
+    # Take screenshots
+    screenshots_taken = []
+    for title, frame, capture_ms in window_frames(sessions, parallel):
+        try:
+            screenshot_path = screenshot_path_for(screenshots_dir, title)
+            duplicate_of = frame_index.register(screenshot_path, frame) if frame_index is not None else None
+            write_screenshot(screenshot_path, frame, duplicate_of)
             screenshots_taken.append({
                 'title': title,
-                'path': screenshot_path
+                'path': screenshot_path,
+                'duplicate_of': duplicate_of,
+                'capture_ms': capture_ms
             })
         except Exception as e:
-            print(f"Error capturing screenshot for {title}: {str(e)}")
-    
+            print(f"Error saving screenshot for {title}: {str(e)}")
+
+    if frame_index is not None:
+        frame_index.save()
+    return screenshots_taken
+
+def capture_and_match(matcher, scoring_criteria=None, dedupe=True, sessions=None, parallel=False):
+    """
+    Capture every email-titled window and match the frames in memory
+
+    Frames go from the bitmap straight into the matcher; fingerprinting and the PNGs are left
+    to a ScreenshotWriter in the background. Once they are on disk the raw detections are
+    recorded in the matcher's detection cache under the files' content hashes, so later batch
+    runs skip these screenshots, and the results are saved with the matcher. A duplicate frame
+    is pointed at its canonical frame's cached detections, which it never overwrites.
+
+    Args:
+        matcher: ImageMatcher to match the frames with
+        scoring_criteria: Dictionary of criteria for scoring matches
+        dedupe: If True, duplicate frames are linked in frame_index.json (see screenshot_windows)
+        sessions: Optional CaptureSessionPool kept open across rounds (see screenshot_windows)
+        parallel: If True, capture every window at once before matching (see window_frames)
+
+    Returns:
+        List of dictionaries with the window title, screenshot path, canonical screenshot it
+        duplicates (or None), capture time in milliseconds and match result (None if
+        matching failed)
+    """
+    from image_matcher import build_match_result
+
+    screenshots_dir = ensure_screenshots_dir()
+    frame_index = FrameIndex() if dedupe else None
+
+    captured = []
+    with ScreenshotWriter(frame_index=frame_index) as writer:
+        # A session buffer is only reused by the window's next capture, after the writer closed
+        for title, frame, capture_ms in window_frames(sessions, parallel):
+            try:
+                screenshot_path = screenshot_path_for(screenshots_dir, title)
+                writer.submit(screenshot_path, frame)
+                record = matcher.detect_screenshot(screenshot_path, screenshot=frame)
+                captured.append((title, screenshot_path, capture_ms, record))
+            except Exception as e:
+                print(f"Error matching screenshot for {title}: {str(e)}")
+
+    if frame_index is not None:
+        frame_index.save()
+
+    results = {}
+    screenshots_taken = []
+    for title, screenshot_path, capture_ms, record in captured:
+        match_result = None
+        duplicate_of = writer.duplicates.get(screenshot_path)
+        if record is not None and screenshot_path in writer.saved:
+            record['content_hash'] = writer.saved[screenshot_path]
+            if matcher.detection_cache is not None and duplicate_of is not None:
+                matcher.detection_cache.store_duplicate(record)
+            elif matcher.detection_cache is not None:
+                matcher.detection_cache.store(record)
+            match_result = build_match_result(record, matcher.custom_scores, scoring_criteria)
+            results.setdefault(match_result['email'], []).append(match_result)
+        screenshots_taken.append({
+            'title': title,
+            'path': screenshot_path,
+            'duplicate_of': duplicate_of,
+            'capture_ms': capture_ms,
+            'match': match_result
+        })
+
+    if results:
+        matcher.save_results(results)
+    if matcher.detection_cache is not None:
+        matcher.detection_cache.save()
     return screenshots_taken
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Take screenshots of windows with email addresses as titles")
+    parser.add_argument('--match', action='store_true',
+                        help="Match the frames in memory right after capture (PNGs are written in the background)")
+    parser.add_argument('--parallel', action='store_true',
+                        help="Capture every window at once without bringing any to the front")
+    args = parser.parse_args()
+
     print("Taking screenshots of windows with email addresses as titles...")
-    screenshots = screenshot_windows()
-    
+    if args.match:
+        from detection_cache import DetectionCache
+        from image_matcher import ImageMatcher, load_scoring_config
+        from results_store import ResultsStore
+
+        custom_scores, scoring_criteria = load_scoring_config()
+        with ResultsStore() as results_store:
+            matcher = ImageMatcher(custom_scores=custom_scores, detection_cache=DetectionCache(),
+                                   results_store=results_store)
+            screenshots = capture_and_match(matcher, scoring_criteria, parallel=args.parallel)
+    else:
+        screenshots = screenshot_windows(parallel=args.parallel)
+
     if screenshots:
         print("\nScreenshots taken:")
         for screenshot in screenshots:
             print(f"Window: {screenshot['title']}")
             print(f"Saved to: {screenshot['path']}")
+            print(f"Capture time: {screenshot['capture_ms']:.1f} ms")
+            if screenshot['duplicate_of']:
+                print(f"Duplicate of: {screenshot['duplicate_of']}")
+            if screenshot.get('match'):
+                print(f"Matches found: {len(screenshot['match']['matches'])}")
             print("-" * 50)
     else:
         print("No windows with email addresses found")
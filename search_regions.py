@@ -0,0 +1,170 @@
+"""
+Per-memoria search regions.
+
+A memoria only ever shows up in a few places on the result screen, yet every template is
+slid over the whole frame. memoria_regions.json gives a memoria a region of interest
+(x, y, w, h) in screenshot pixels for each instance resolution; ImageMatcher then searches
+that region of screenshots of that resolution first, and falls back to the full frame when
+nothing in it reaches the threshold (or the region cannot be applied: it is smaller than
+the template once clipped to the frame). A card that moved costs one extra search instead
+of a miss, and its full-frame match lets the next relearn grow the region.
+
+Regions are grouped by resolution, like memoria_slots.json:
+
+    {"1280x720": {"memoria": [x, y, w, h], "other memoria": {"region": [x, y, w, h], "support": n}}}
+
+Plain [x, y, w, h] lists are declared by hand; {"region", "support"} entries are learned
+from the detections recorded in detection_cache.json, which know the frame size of every
+match. Relearning replaces learned entries only.
+
+Run this module directly to learn the regions from the detection cache.
+"""
+import argparse
+import json
+import os
+import re
+
+SEARCH_REGION_FILE = 'memoria_regions.json'
+
+# A memoria must have been matched this many times at a resolution before a region is
+# learned for it there
+MIN_REGION_SUPPORT = 3
+# Learned regions extend this fraction of the template size beyond the recorded matches
+REGION_MARGIN = 0.5
+
+RESOLUTION_PATTERN = re.compile(r'^(\d+)x(\d+)$')
+
+
+def learn_search_regions(records, min_support=MIN_REGION_SUPPORT, margin=REGION_MARGIN):
+    """
+    Learn a search region for every memoria and frame size from its recorded detections.
+
+    The region is the bounding box of all recorded match boxes of the memoria in frames of
+    that size, padded by margin times the template size on every side and clipped to the frame.
+
+    Args:
+        records: Raw detection records (see ImageMatcher.detect_screenshot)
+        min_support: Matches a memoria needs at a frame size before a region is learned for it
+        margin: Padding around the recorded matches, as a fraction of the template size
+
+    Returns:
+        Dictionary mapping (width, height) to dictionaries mapping memoria names to
+        (region, support) tuples, region being (x, y, w, h)
+    """
+    boxes = {}
+    for record in records:
+        frame_size = tuple(record['frame_size'])
+        for detection in record['detections']:
+            boxes.setdefault(frame_size, {}).setdefault(detection['memoria_name'], []).append(
+                (*detection['position'], *detection['size']))
+
+    regions = {}
+    for (frame_w, frame_h), memoria_boxes_by_name in boxes.items():
+        for name, memoria_boxes in memoria_boxes_by_name.items():
+            if len(memoria_boxes) < min_support:
+                continue
+            w = max(box[2] for box in memoria_boxes)
+            h = max(box[3] for box in memoria_boxes)
+            pad_x, pad_y = int(round(w * margin)), int(round(h * margin))
+            x0 = max(0, min(box[0] for box in memoria_boxes) - pad_x)
+            y0 = max(0, min(box[1] for box in memoria_boxes) - pad_y)
+            x1 = min(frame_w, max(box[0] + box[2] for box in memoria_boxes) + pad_x)
+            y1 = min(frame_h, max(box[1] + box[3] for box in memoria_boxes) + pad_y)
+            regions.setdefault((frame_w, frame_h), {})[name] = ((x0, y0, x1 - x0, y1 - y0), len(memoria_boxes))
+    return regions
+
+
+def read_region_file(region_file=SEARCH_REGION_FILE):
+    """
+    Raw entries of a region file (declared lists and learned dicts) per resolution.
+
+    Returns:
+        Dictionary mapping (width, height) to dictionaries of raw entries; empty if the file
+        does not exist. Entries outside a resolution (the old format) are skipped with a
+        warning, since the frame size they were made for is unknown.
+    """
+    if not os.path.exists(region_file):
+        return {}
+
+    try:
+        with open(region_file, 'r') as f:
+            data = json.load(f)
+    except json.JSONDecodeError as e:
+        print(f"Error loading search regions {region_file}: {e}")
+        return {}
+
+    entries = {}
+    unplaced = []
+    for key, value in data.items():
+        match = RESOLUTION_PATTERN.match(key)
+        if match is None or not isinstance(value, dict):
+            unplaced.append(key)
+            continue
+        entries[(int(match.group(1)), int(match.group(2)))] = value
+    if unplaced:
+        print(f"Ignoring {len(unplaced)} search regions in {region_file} without a resolution; "
+              f"declare them under a \"WIDTHxHEIGHT\" key or relearn them with search_regions.py")
+    return entries
+
+
+def load_search_regions(region_file=SEARCH_REGION_FILE):
+    """
+    Load the search regions of every resolution.
+
+    Returns:
+        Dictionary mapping (width, height) to dictionaries mapping memoria names to
+        (x, y, w, h) regions
+    """
+    regions = {}
+    for frame_size, entries in read_region_file(region_file).items():
+        regions[frame_size] = {
+            name: tuple(int(v) for v in (entry['region'] if isinstance(entry, dict) else entry))
+            for name, entry in entries.items()
+        }
+    return regions
+
+
+def save_learned_regions(learned, region_file=SEARCH_REGION_FILE):
+    """
+    Write learned regions, keeping every region declared by hand.
+
+    Args:
+        learned: Dictionary mapping (width, height) to dictionaries mapping memoria names to
+            (region, support) tuples (see learn_search_regions)
+    """
+    entries = {
+        frame_size: {name: entry for name, entry in frame_entries.items() if not isinstance(entry, dict)}
+        for frame_size, frame_entries in read_region_file(region_file).items()
+    }
+    for frame_size, frame_regions in learned.items():
+        frame_entries = entries.setdefault(frame_size, {})
+        for name, (region, support) in frame_regions.items():
+            if name not in frame_entries:
+                frame_entries[name] = {'region': list(region), 'support': support}
+
+    with open(region_file, 'w') as f:
+        json.dump({f"{w}x{h}": dict(sorted(frame_entries.items()))
+                   for (w, h), frame_entries in sorted(entries.items())}, f, indent=2)
+    print(f"Search regions saved to {region_file}")
+
+
+if __name__ == "__main__":
+    from detection_cache import DETECTION_CACHE_FILE, DetectionCache
+
+    parser = argparse.ArgumentParser(description="Learn per-memoria search regions from recorded detections")
+    parser.add_argument('--cache', default=DETECTION_CACHE_FILE, help="Detection cache written by image_matcher")
+    parser.add_argument('--output', default=SEARCH_REGION_FILE)
+    parser.add_argument('--min-support', type=int, default=MIN_REGION_SUPPORT,
+                        help="Matches a memoria needs at a resolution before a region is learned for it")
+    parser.add_argument('--margin', type=float, default=REGION_MARGIN,
+                        help="Padding around the recorded matches, as a fraction of the template size")
+    args = parser.parse_args()
+
+    learned = learn_search_regions(DetectionCache(args.cache).records(), args.min_support, args.margin)
+    for (w, h), frame_regions in sorted(learned.items()):
+        for name, (region, support) in sorted(frame_regions.items()):
+            print(f"{w}x{h} {name}: {region} from {support} matches")
+    if learned:
+        save_learned_regions(learned, args.output)
+    else:
+        print("No regions learned; run a normal match first so the detection cache has detections")
@@ -0,0 +1,229 @@
+"""
+Card-slot classification for memoria matching.
+
+Result screens show the pulled cards in a fixed grid, so sliding every memoria across the
+whole frame is mostly wasted work. The slot rectangles of each instance resolution are
+learned once from the detections already recorded in detection_cache.json and saved to
+memoria_slots.json. A screenshot is then matched slot by slot:
+
+1. The perceptual-hash index (see memoria_index.py) nominates the templates closest to
+   what is centered in the slot, comparing each template with a crop of its own size.
+2. Only the best few templates are confirmed with the exact TM_CCOEFF_NORMED match inside
+   the slot (plus a small margin), so confidences are the same as a full-frame search
+   whenever the card sits in a known slot.
+
+Run this module directly to (re)learn memoria_slots.json from the detection cache.
+"""
+import argparse
+import json
+import os
+
+import cv2
+import numpy as np
+
+from memoria_index import MemoriaIndex
+
+SLOT_LAYOUT_FILE = 'memoria_slots.json'
+
+# Templates per slot that are confirmed with the exact match
+SLOT_CANDIDATES = 3
+# Extra search room around a slot, as a fraction of the slot size
+SLOT_MARGIN = 0.1
+# A learned slot must have held a detection in at least this many frames
+MIN_SLOT_SUPPORT = 2
+# Detections whose center is this close to a slot's center (as a fraction of the smaller
+# detection side) belong to that slot while learning
+SLOT_CENTER_TOLERANCE = 0.5
+
+
+def _center(box):
+    return box[0] + box[2] / 2, box[1] + box[3] / 2
+
+
+def learn_slot_layouts(records, min_support=MIN_SLOT_SUPPORT):
+    """
+    Learn the slot rectangles of every frame size from recorded detections.
+
+    Cards of different sizes share a slot's center rather than its corner, so detections are
+    grouped by center. A slot's rectangle is centered on the median center of its detections
+    and is as large as the largest of them.
+
+    Args:
+        records: Raw detection records (see ImageMatcher.detect_screenshot)
+        min_support: Frames a slot must appear in to be kept
+
+    Returns:
+        Dictionary mapping (width, height) to lists of (x, y, w, h) slots, sorted top to bottom
+        then left to right
+    """
+    clusters_by_size = {}
+    for record in records:
+        clusters = clusters_by_size.setdefault(tuple(record['frame_size']), [])
+        for detection in record['detections']:
+            box = (*detection['position'], *detection['size'])
+            cx, cy = _center(box)
+            tolerance = min(box[2], box[3]) * SLOT_CENTER_TOLERANCE
+
+            # Greedy clustering: join the nearest slot center, or open a new slot
+            distances = [np.hypot(cx - cluster['center'][0], cy - cluster['center'][1]) for cluster in clusters]
+            if distances and min(distances) <= tolerance:
+                cluster = clusters[int(np.argmin(distances))]
+                cluster['boxes'].append(box)
+                cluster['center'] = tuple(np.median([_center(b) for b in cluster['boxes']], axis=0))
+            else:
+                clusters.append({'center': (cx, cy), 'boxes': [box]})
+
+    layouts = {}
+    for frame_size, clusters in clusters_by_size.items():
+        slots = []
+        for cluster in clusters:
+            if len(cluster['boxes']) < min_support:
+                continue
+            w = max(box[2] for box in cluster['boxes'])
+            h = max(box[3] for box in cluster['boxes'])
+            cx, cy = cluster['center']
+            slots.append((int(round(cx - w / 2)), int(round(cy - h / 2)), w, h))
+        if slots:
+            layouts[frame_size] = sorted(slots, key=lambda slot: (slot[1], slot[0]))
+    return layouts
+
+
+def load_slot_layouts(layout_file=SLOT_LAYOUT_FILE):
+    """
+    Load learned slot layouts.
+
+    Returns:
+        Dictionary mapping (width, height) to lists of (x, y, w, h) slots; empty if the file
+        does not exist
+    """
+    if not os.path.exists(layout_file):
+        return {}
+
+    try:
+        with open(layout_file, 'r') as f:
+            data = json.load(f)
+    except json.JSONDecodeError as e:
+        print(f"Error loading slot layouts {layout_file}: {e}")
+        return {}
+
+    layouts = {}
+    for resolution, slots in data.items():
+        width, height = resolution.split('x')
+        layouts[(int(width), int(height))] = [tuple(slot) for slot in slots]
+    return layouts
+
+
+def save_slot_layouts(layouts, layout_file=SLOT_LAYOUT_FILE):
+    """Save slot layouts keyed by "WIDTHxHEIGHT"."""
+    data = {f"{width}x{height}": [list(slot) for slot in slots] for (width, height), slots in layouts.items()}
+    with open(layout_file, 'w') as f:
+        json.dump(data, f, indent=2)
+    print(f"Slot layouts saved to {layout_file}")
+
+
+class SlotClassifier:
+    """
+    Matches a template bank against the known card slots of a screenshot.
+    """
+
+    def __init__(self, templates, layouts=None, index=None, candidates=SLOT_CANDIDATES, margin=SLOT_MARGIN):
+        """
+        Initialize the classifier.
+
+        Args:
+            templates: Dictionary mapping template names to BGR images
+            layouts: Dictionary mapping (width, height) to lists of (x, y, w, h) slots
+            index: Optional MemoriaIndex of the same templates (built here if not given)
+            candidates: Templates per slot confirmed with the exact match
+            margin: Extra search room around a slot, as a fraction of the slot size
+        """
+        self.templates = templates
+        self.layouts = layouts or {}
+        self.index = index if index is not None else MemoriaIndex(templates)
+        self.candidates = candidates
+        self.margin = margin
+
+    def slots_for(self, frame_size):
+        """Slots of a (width, height) frame, or None if that resolution has not been learned."""
+        return self.layouts.get(tuple(frame_size))
+
+    def best_matches(self, screenshot, names=None):
+        """
+        Best match of every template, searched only inside the known slots.
+
+        Args:
+            screenshot: BGR screenshot
+            names: Optional subset of template names to score
+
+        Returns:
+            Dictionary mapping template names to (confidence, top_left) tuples; templates that
+            were not a candidate of any slot get (-1.0, (0, 0)). None when the screenshot's
+            resolution has no learned slots.
+        """
+        confirmed = self._confirm_slots(screenshot, names)
+        if confirmed is None:
+            return None
+
+        matches = {name: (-1.0, (0, 0)) for name in (self.index.names if names is None else names)}
+        for slot_matches in confirmed:
+            for name, max_val, top_left in slot_matches:
+                if max_val > matches[name][0]:
+                    matches[name] = (max_val, top_left)
+        return matches
+
+    def slot_matches(self, screenshot, names=None):
+        """
+        The best confirmed template of every slot, so repeated cards are reported once per slot.
+
+        Returns:
+            List of (name, confidence, top_left) tuples, or None when the screenshot's
+            resolution has no learned slots
+        """
+        confirmed = self._confirm_slots(screenshot, names)
+        if confirmed is None:
+            return None
+        return [max(slot_matches, key=lambda match: match[1]) for slot_matches in confirmed if slot_matches]
+
+    def _confirm_slots(self, screenshot, names=None):
+        """Exact matches of the nominated templates of every slot, as one list per slot."""
+        frame_h, frame_w = screenshot.shape[:2]
+        slots = self.slots_for((frame_w, frame_h))
+        if slots is None:
+            return None
+
+        mask = self.index.mask(names)
+        confirmed = []
+        for x, y, w, h in slots:
+            nominated = self.index.lookup_at(screenshot, _center((x, y, w, h)), self.candidates, mask)
+
+            pad_x, pad_y = int(np.ceil(w * self.margin)), int(np.ceil(h * self.margin))
+            x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+            window = screenshot[y0:min(frame_h, y + h + pad_y), x0:min(frame_w, x + w + pad_x)]
+            slot_matches = []
+            for name, _ in nominated:
+                template = self.templates[name]
+                if template.shape[0] > window.shape[0] or template.shape[1] > window.shape[1]:
+                    continue
+                result = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+                min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+                slot_matches.append((name, max_val, (x0 + max_loc[0], y0 + max_loc[1])))
+            confirmed.append(slot_matches)
+        return confirmed
+
+if __name__ == "__main__":
+    from detection_cache import DetectionCache, DETECTION_CACHE_FILE
+
+    parser = argparse.ArgumentParser(description="Learn card-slot layouts from recorded detections")
+    parser.add_argument('--cache', default=DETECTION_CACHE_FILE, help="Detection cache written by image_matcher")
+    parser.add_argument('--output', default=SLOT_LAYOUT_FILE)
+    parser.add_argument('--min-support', type=int, default=MIN_SLOT_SUPPORT,
+                        help="Frames a slot must appear in to be kept")
+    args = parser.parse_args()
+
+    layouts = learn_slot_layouts(DetectionCache(args.cache).records(), args.min_support)
+    for (width, height), slots in sorted(layouts.items()):
+        print(f"{width}x{height}: {len(slots)} slots")
+    if layouts:
+        save_slot_layouts(layouts, args.output)
+    else:
+        print("No slots learned; run a normal match first so the detection cache has detections")
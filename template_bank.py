@@ -0,0 +1,119 @@
+"""
+Shared-memory template bank for multi-process memoria matching.
+
+The preprocessed memoria entries (the decoded image plus its grayscale copy, histogram,
+hashes and pyramid level, see ImageMatcher._memoria_entry) are packed once into a single
+multiprocessing.shared_memory block, their arrays back to back. The spec a worker attaches
+with carries where each array sits and the entries' small non-array fields. Workers get
+read-only NumPy views, so memory stays flat as the worker count grows and no worker has to
+decode memorias/*.png or preprocess a template again, not even a replacement worker started
+after a crash.
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Arrays are packed at offsets that are a multiple of this
+ARRAY_ALIGNMENT = 16
+
+
+class SharedTemplateBank:
+    """
+    A memoria template bank living in shared memory.
+
+    The creating process owns the block and must call close() and unlink() once the
+    workers are done. Workers attach() with the spec() of the owner and only close().
+    """
+
+    def __init__(self, shm, layout, owner):
+        self._shm = shm
+        self.layout = layout
+        self.names = list(layout)
+        self.owner = owner
+
+    @classmethod
+    def create(cls, memorias):
+        """
+        Pack a memorias dictionary (as built by ImageMatcher._load_memorias) into shared memory.
+
+        Args:
+            memorias: Dictionary mapping memoria names to template entries; their NumPy arrays
+                      are packed, every other field must be picklable
+
+        Returns:
+            The owning SharedTemplateBank
+        """
+        layout = {}
+        arrays = []
+        offset = 0
+        for name, entry in memorias.items():
+            fields = {}
+            placed = {}
+            for key, value in entry.items():
+                if isinstance(value, np.ndarray):
+                    value = np.ascontiguousarray(value)
+                    placed[key] = (offset, value.dtype.str, value.shape)
+                    arrays.append((offset, value))
+                    offset += value.nbytes + (-value.nbytes % ARRAY_ALIGNMENT)
+                else:
+                    fields[key] = value
+            layout[name] = {'fields': fields, 'arrays': placed}
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        try:
+            for array_offset, value in arrays:
+                np.ndarray(value.shape, dtype=value.dtype, buffer=shm.buf, offset=array_offset)[...] = value
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+
+        return cls(shm, layout, owner=True)
+
+    @classmethod
+    def attach(cls, spec):
+        """
+        Attach to a bank created in another process, given the owner's spec().
+
+        Pool workers share the owner's resource tracker, so the block stays registered once
+        and is only cleaned up by the owner's unlink().
+        """
+        shm = shared_memory.SharedMemory(name=spec['shm_name'])
+        return cls(shm, spec['layout'], owner=False)
+
+    def spec(self):
+        """Picklable description (block name and entry layout) used to attach from a worker process."""
+        return {
+            'shm_name': self._shm.name,
+            'layout': self.layout
+        }
+
+    def entries(self):
+        """
+        Rebuild the template entries over the packed arrays.
+
+        Returns:
+            Dictionary mapping memoria names to entries whose arrays are read-only views
+        """
+        entries = {}
+        for name, item in self.layout.items():
+            entry = dict(item['fields'])
+            for key, (offset, dtype, shape) in item['arrays'].items():
+                view = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)
+                view.flags.writeable = False
+                entry[key] = view
+            entries[name] = entry
+        return entries
+
+    @property
+    def nbytes(self):
+        return self._shm.size
+
+    def close(self):
+        """Detach from the block. Fails with BufferError while views are still referenced."""
+        self._shm.close()
+
+    def unlink(self):
+        """Free the block. Only the owner may do this, after every worker has finished."""
+        if self.owner:
+            self._shm.unlink()
@@ -0,0 +1,188 @@
+"""
+Persistent cache of preprocessed memoria templates.
+
+Every ImageMatcher used to decode memorias/*.png again and recompute each template's
+grayscale copy, histogram, hashes and pyramid level. The cache keeps all of that on disk:
+
+- template_cache.bin: the arrays of every template, back to back
+- template_cache.json: the manifest, holding each template's file size, mtime and SHA-1,
+  its non-array fields and where its arrays sit in the .bin file
+
+A warm start reads the .bin file once and slices every array out of it. A template is only
+decoded and preprocessed again when its PNG changed: the size and mtime are compared first,
+and the SHA-1 settles the cases where only the mtime moved.
+"""
+import hashlib
+import json
+import math
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+TEMPLATE_CACHE_FILE = 'template_cache.json'
+TEMPLATE_CACHE_FORMAT_VERSION = 1
+
+# Arrays are stored at offsets that are a multiple of this
+ARRAY_ALIGNMENT = 16
+
+
+class TemplateCache:
+    """
+    On-disk store of the preprocessed template entries built by ImageMatcher.
+    """
+
+    def __init__(self, cache_file=TEMPLATE_CACHE_FILE):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_file: Manifest file; the arrays go to the same path with a .bin suffix
+        """
+        self.cache_file = cache_file
+        self.blob_file = str(Path(cache_file).with_suffix('.bin'))
+
+    def load_memorias(self, memoria_dir, build_entry):
+        """
+        Load the template entries of every PNG in a directory, rebuilding only changed ones.
+
+        Args:
+            memoria_dir: Directory containing the memoria template images
+            build_entry: Callable (name, img, path, cached) returning the template entry. cached
+                         is the previously stored entry of an unchanged file (None otherwise);
+                         fields it returns unchanged are not recomputed or rewritten.
+
+        Returns:
+            Dictionary mapping memoria names to entries
+        """
+        stored = self._read()
+        memorias = {}
+        files = {}
+        dirty = False
+
+        for img_path in Path(memoria_dir).glob('*.png'):
+            name = img_path.stem
+            try:
+                stat = img_path.stat()
+                cached = stored.get(name)
+                if cached is not None and not self._unchanged(cached['file'], img_path, stat):
+                    cached = None
+
+                if cached is not None:
+                    entry = build_entry(name, cached['entry']['image'], str(img_path), cached['entry'])
+                    digest = cached['file']['sha1']
+                    if cached['file']['mtime_ns'] != stat.st_mtime_ns or _entry_changed(entry, cached['entry']):
+                        dirty = True
+                else:
+                    with open(img_path, 'rb') as f:
+                        data = f.read()
+                    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                    if img is None:
+                        continue
+                    entry = build_entry(name, img, str(img_path), None)
+                    digest = hashlib.sha1(data).hexdigest()
+                    dirty = True
+            except Exception as e:
+                print(f"Error loading memoria {img_path}: {e}")
+                continue
+
+            memorias[name] = entry
+            files[name] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': digest}
+
+        if dirty or set(stored) != set(memorias):
+            self.save(memorias, files)
+        return memorias
+
+    def _unchanged(self, cached_file, img_path, stat):
+        """Whether a template file still has the content it was cached with."""
+        if cached_file['size'] != stat.st_size:
+            return False
+        if cached_file['mtime_ns'] == stat.st_mtime_ns:
+            return True
+        # Touched but possibly identical (e.g. copied back from a backup)
+        with open(img_path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest() == cached_file['sha1']
+
+    def _read(self):
+        """Stored entries as {name: {'file': ..., 'entry': ...}}, or {} if the cache is missing or stale."""
+        if not os.path.exists(self.cache_file) or not os.path.exists(self.blob_file):
+            return {}
+
+        try:
+            with open(self.cache_file, 'r') as f:
+                manifest = json.load(f)
+        except json.JSONDecodeError as e:
+            print(f"Error loading template cache {self.cache_file}: {e}")
+            return {}
+
+        if manifest.get('format_version') != TEMPLATE_CACHE_FORMAT_VERSION:
+            return {}
+
+        blob = np.fromfile(self.blob_file, dtype=np.uint8)
+        if blob.size != manifest.get('blob_size'):
+            # The manifest and the arrays were not written by the same save
+            return {}
+
+        stored = {}
+        for name, item in manifest['templates'].items():
+            entry = dict(item['fields'])
+            for key, (offset, dtype, shape) in item['arrays'].items():
+                count = math.prod(shape)
+                entry[key] = np.frombuffer(blob, dtype=dtype, count=count, offset=offset).reshape(shape)
+            stored[name] = {'file': item['file'], 'entry': entry}
+        return stored
+
+    def save(self, memorias, files):
+        """
+        Write every entry to disk atomically.
+
+        Args:
+            memorias: Dictionary mapping memoria names to entries
+            files: Dictionary mapping memoria names to their file size, mtime_ns and sha1
+        """
+        templates = {}
+        chunks = []
+        offset = 0
+        for name, entry in memorias.items():
+            arrays = {}
+            fields = {}
+            for key, value in entry.items():
+                if isinstance(value, np.ndarray):
+                    value = np.ascontiguousarray(value)
+                    arrays[key] = [offset, value.dtype.str, list(value.shape)]
+                    padding = -value.nbytes % ARRAY_ALIGNMENT
+                    chunks.append(value.tobytes() + b'\0' * padding)
+                    offset += value.nbytes + padding
+                else:
+                    fields[key] = value
+            templates[name] = {'file': files[name], 'fields': fields, 'arrays': arrays}
+
+        blob_tmp = f"{self.blob_file}.tmp"
+        with open(blob_tmp, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(blob_tmp, self.blob_file)
+
+        manifest_tmp = f"{self.cache_file}.tmp"
+        with open(manifest_tmp, 'w') as f:
+            json.dump({
+                'format_version': TEMPLATE_CACHE_FORMAT_VERSION,
+                'blob_size': offset,
+                'templates': templates
+            }, f, separators=(',', ':'))
+        os.replace(manifest_tmp, self.cache_file)
+
+
+def _entry_changed(entry, cached_entry):
+    """Whether build_entry replaced, added or dropped any field of a cached entry."""
+    if set(entry) != set(cached_entry):
+        return True
+    for key, value in entry.items():
+        cached_value = cached_entry[key]
+        if isinstance(value, np.ndarray) or isinstance(cached_value, np.ndarray):
+            if value is not cached_value:
+                return True
+        elif value != cached_value:
+            return True
+    return False